@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Table-driven accent folding.
+
+The generators strip accents with::
+
+    nfkd_form = unicodedata.normalize('NFKD', text)
+    ''.join(c for c in nfkd_form if not unicodedata.combining(c))
+
+which decomposes the whole string and then filters it one character at
+a time in Python.  It runs for every roster name, every workbook name,
+every fee comment and every month header.
+
+Dropping combining marks after NFKD works character by character: NFKD
+decomposes each character on its own, and the only reordering it does
+is among combining marks, which are all discarded.  Folding every
+character separately therefore gives exactly the same string, so the
+folded form of each character can be computed once:
+
+* Latin-1 text (Spanish names and comments) is folded with a
+  ``bytes.translate`` over its Latin-1 encoding, a single C-level pass.
+  The four Latin-1 characters that do not fold to another Latin-1
+  character (``µ``, ``¼``, ``½``, ``¾``) take the path below.
+* Anything else goes through ``str.translate`` with a table pre-filled
+  for Latin Extended-A/B, Latin Extended Additional and the combining
+  diacritics.  Characters outside those ranges are folded with NFKD the
+  first time they are seen and then remembered in the table.
+
+:func:`fold_accents` returns the same string as the NFKD code above for
+every input.
+"""
+
+import re
+import unicodedata
+from typing import Dict, Optional, Union
+
+# Ranges pre-computed at import time; everything else is filled lazily
+_PREFILLED_RANGES = (
+    range(0x0080, 0x0250),  # Latin-1 Supplement, Latin Extended-A/B
+    range(0x0300, 0x0370),  # Combining Diacritical Marks
+    range(0x1E00, 0x1F00),  # Latin Extended Additional
+)
+
+
+def _fold_char(char: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+
+
+def nfkd_fold(text: str) -> str:
+    """Reference implementation: NFKD, then drop the combining marks."""
+    nfkd_form = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in nfkd_form if not unicodedata.combining(c))
+
+
+class _FoldTable(Dict[int, Union[int, str, None]]):
+    """``str.translate`` table that folds unseen characters on demand."""
+
+    def __missing__(self, code: int) -> Union[int, str, None]:
+        folded = _fold_char(chr(code))
+        value: Union[int, str, None]
+        if folded == chr(code):
+            value = code
+        elif not folded:
+            value = None
+        else:
+            value = folded
+        self[code] = value
+        return value
+
+
+def _build_tables():
+    table = _FoldTable()
+    for block in _PREFILLED_RANGES:
+        for code in block:
+            table[code]  # computed and stored by __missing__
+    latin1 = bytearray(range(256))
+    special = []
+    for code in range(0x80, 0x100):
+        folded = _fold_char(chr(code))
+        if len(folded) == 1 and ord(folded) < 0x100:
+            latin1[code] = ord(folded)
+        else:
+            special.append(chr(code))
+    return table, bytes(latin1), re.compile('[' + re.escape(''.join(special)) + ']')
+
+
+FOLD_TABLE, _LATIN1_TABLE, _LATIN1_SPECIAL_RE = _build_tables()
+
+
+def fold_accents(text: str) -> str:
+    """Remove accents and diacritics, exactly like :func:`nfkd_fold`.
+
+    Parameters
+    ----------
+    text: str
+        Input string potentially containing accented characters.
+
+    Returns
+    -------
+    str
+        The input string without any accents.
+    """
+    if text.isascii():
+        return text
+    if not _LATIN1_SPECIAL_RE.search(text):
+        try:
+            return text.encode('latin-1').translate(_LATIN1_TABLE).decode('latin-1')
+        except UnicodeEncodeError:
+            pass
+    return text.translate(FOLD_TABLE)
+
+
+def fold_accents_or_none(text: Optional[str]) -> Optional[str]:
+    """:func:`fold_accents` that passes ``None`` through."""
+    return None if text is None else fold_accents(text)
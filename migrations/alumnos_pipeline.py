@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Workbook to ``Alumnos`` SQL in one pass, without intermediate files.
+
+Loading a classroom roster used to take three runs (see ``comandos.MD``)::
+
+    python extract_names.py PrimeroPrimaria-A.xlsx
+    python process_names.py extracted_names_PrimeroPrimaria-A.txt
+    python generate_sql.py processed_names_PrimeroPrimaria-A.txt 5 A
+
+each of which starts an interpreter, re-reads the previous step's text
+file and writes the next one.  This module chains the same three stages
+as generators inside a single process:
+
+* extract: :func:`extract_names.iter_sheet_names` streams column A of
+  the sheet;
+* parse: :func:`process_names.iter_processed_names` splits every name
+  into apellidos and nombres;
+* render: :func:`generate_sql.write_alumnos_sql` writes the INSERT (or
+  batched INSERT, or COPY) statements.
+
+Rows flow through the stages one at a time and only the final
+``insert_students_*.sql`` file is written.  The text round trips the old
+files performed (a cell with line breaks becomes several lines, the
+processed line is re-split as CSV) are reproduced in memory, so the SQL
+is the same as the three-step output apart from the ``FechaCreacion``
+timestamps.  The three scripts remain available and now share these
+stage functions.  With ``--load <dsn>`` the render stage loads the
+students straight into PostgreSQL instead of writing the file, sharing
+one connection pool across all the classrooms of the run (see
+``pg_loader.py``).
+
+Many classrooms can be processed in the same run with a manifest CSV::
+
+    excel,sheet,grado_id,seccion
+    PrimeroPrimaria-A.xlsx,,5,A
+    Inscripciones-2025.xlsx,SegundoPrimaria-B,6,B
+
+``sheet`` is optional (the active sheet is used when it is empty) and
+relative ``excel`` paths are resolved against the manifest's directory.
+Every workbook is opened once per listed sheet, and all classrooms share
+the interpreter and the imported modules.
+
+Usage::
+
+    python alumnos_pipeline.py <excel_file> [grado_id] [seccion] [--sheet <name>] \
+        [--batch-size <n>] [--transaction] [--copy] [--output <file.sql>] [--profile]
+    python alumnos_pipeline.py --manifest <manifest.csv> [--output-dir <folder>] \
+        [--batch-size <n>] [--transaction] [--copy] [--profile]
+    python alumnos_pipeline.py (<excel_file> [grado_id] [seccion] | --manifest <manifest.csv>) \
+        --load <dsn> [--load-writers <n>] [--load-batch-size <n>] [--load-method copy|insert]
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import extract_names
+import generate_sql
+import process_names
+from pg_loader import LoadResult, PgLoader, add_load_arguments, load_options
+from profiling import NULL_PROFILER, StageProfiler, add_profile_arguments, profile_options, start_profiler
+
+
+def cell_lines(value) -> Iterator[str]:
+    """Lines the extract stage would have written for one cell.
+
+    ``extract_names.py`` writes ``f"{value}\\n"`` and ``process_names.py``
+    reads the file back in text mode, so a cell containing ``\\n``,
+    ``\\r\\n`` or ``\\r`` turns into several names.
+    """
+    text = f"{value}\n"
+    if '\r' not in text and text.count('\n') == 1:
+        yield text
+        return
+    # Universal newlines, exactly as open(..., "r") splits the file
+    yield from io.StringIO(text, newline=None)
+
+
+def iter_extracted_lines(excel_file: str, sheet_name: Optional[str] = None) -> Iterator[str]:
+    """Extract stage: the lines of ``extracted_names_*.txt``, without the file."""
+    for value in extract_names.iter_sheet_names(excel_file, sheet_name):
+        yield from cell_lines(value)
+
+
+def iter_name_rows(lines: Iterable[str]) -> Iterator[List[str]]:
+    """Parse stage: the rows ``generate_sql.py`` reads from ``processed_names_*.txt``.
+
+    Each parsed name is formatted as its processed line and re-split with
+    :func:`csv.reader`, so names containing commas or quotes produce the
+    same fields as they did through the file.
+    """
+    processed = (process_names.format_processed_name(name) for name in process_names.iter_processed_names(lines))
+    return csv.reader(processed)
+
+
+def output_file_for(excel_file: str, sheet_name: Optional[str] = None) -> str:
+    """``insert_students_*.sql`` name the three-step run would have produced."""
+    extracted = extract_names.output_file_for(excel_file, sheet_name)
+    return generate_sql.output_file_for(process_names.output_file_for(extracted))
+
+
+def run_classroom(
+    excel_file: str,
+    output_file: str,
+    grado_id: int = 4,
+    seccion: str = 'B',
+    sheet_name: Optional[str] = None,
+    batch_size: int = 0,
+    transaction: bool = False,
+    copy: bool = False,
+    profiler: StageProfiler = NULL_PROFILER,
+) -> int:
+    """Run extract, parse and render for one classroom.
+
+    Parameters
+    ----------
+    excel_file: str
+        Workbook with the student names in column A.
+    output_file: str
+        SQL file to write.
+    grado_id: int
+        ``GradoId`` for every student.
+    seccion: str
+        ``Seccion`` for every student.
+    sheet_name: Optional[str]
+        Sheet to read; the active sheet when ``None``.
+    batch_size, transaction, copy:
+        Output format, as in ``generate_sql.py``.
+    profiler: StageProfiler
+        Records the extract, parse and render stages for ``--profile``.
+        The stages are chained generators, so each one is reported
+        inside the stage that pulls from it.
+
+    Returns
+    -------
+    int
+        Number of students written.
+    """
+    lines = profiler.iterate('extract', iter_extracted_lines(excel_file, sheet_name))
+    rows = profiler.iterate('parse', iter_name_rows(lines))
+    with open(output_file, 'w', encoding='utf-8') as outfile:
+        return generate_sql.write_alumnos_sql(
+            outfile, rows, grado_id, seccion,
+            batch_size=batch_size, transaction=transaction, copy=copy, profiler=profiler,
+        )
+
+
+def load_classroom(
+    loader: PgLoader,
+    excel_file: str,
+    grado_id: int = 4,
+    seccion: str = 'B',
+    sheet_name: Optional[str] = None,
+    profiler: StageProfiler = NULL_PROFILER,
+) -> LoadResult:
+    """Run extract and parse for one classroom and load the students with ``loader``."""
+    lines = profiler.iterate('extract', iter_extracted_lines(excel_file, sheet_name))
+    rows = profiler.iterate('parse', iter_name_rows(lines))
+    return generate_sql.load_alumnos(loader, rows, grado_id, seccion, profiler)
+
+
+def load_manifest(manifest_path: str) -> List[Dict]:
+    """Read the ``excel,sheet,grado_id,seccion`` manifest into classroom jobs."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs: List[Dict] = []
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as f:
+        for entry in csv.DictReader(f):
+            excel = (entry.get('excel') or '').strip()
+            if not excel:
+                continue
+            grado_id = (entry.get('grado_id') or '').strip()
+            jobs.append({
+                'excel': excel if os.path.isabs(excel) else os.path.join(base_dir, excel),
+                'sheet': (entry.get('sheet') or '').strip() or None,
+                'grado_id': int(grado_id) if grado_id else 4,
+                'seccion': (entry.get('seccion') or '').strip() or 'B',
+            })
+    return jobs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate Alumnos INSERTs straight from classroom workbooks.')
+    parser.add_argument('excel', nargs='?', help='Workbook with the student names in column A')
+    parser.add_argument('grado_id', nargs='?', type=int, default=4, help='GradoId (default 4)')
+    parser.add_argument('seccion', nargs='?', default='B', help='Seccion (default B)')
+    parser.add_argument('--sheet', help='Sheet to read instead of the active one')
+    parser.add_argument('--manifest', help='CSV manifest with excel,sheet,grado_id,seccion columns')
+    parser.add_argument('--output', help='SQL file for a single workbook (default insert_students_<name>.sql)')
+    parser.add_argument('--output-dir', default='.', help='Folder for the per-classroom SQL files of a manifest run')
+    parser.add_argument('--batch-size', type=int, default=0, help='Rows per multi-row INSERT (0 = one INSERT per student)')
+    parser.add_argument('--transaction', action='store_true', help='Wrap every batch in BEGIN/COMMIT')
+    parser.add_argument('--copy', action='store_true', help='Write a COPY ... FROM STDIN stream instead of INSERTs')
+    add_load_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    if bool(args.excel) == bool(args.manifest):
+        parser.error('give either an excel file or --manifest')
+    if args.copy and args.batch_size:
+        parser.error('--copy cannot be combined with --batch-size')
+    load = load_options(args)
+    if load is not None and (args.copy or args.batch_size):
+        parser.error('--load cannot be combined with --copy or --batch-size')
+
+    if args.manifest:
+        jobs = load_manifest(args.manifest)
+        for job in jobs:
+            job['output'] = os.path.join(args.output_dir, output_file_for(job['excel'], job['sheet']))
+    else:
+        jobs = [{
+            'excel': args.excel,
+            'sheet': args.sheet,
+            'grado_id': args.grado_id,
+            'seccion': args.seccion,
+            'output': args.output or output_file_for(args.excel, args.sheet),
+        }]
+
+    missing = [job['excel'] for job in jobs if not os.path.exists(job['excel'])]
+    if missing:
+        print(f"Error: File(s) not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    total = 0
+    failed = 0
+    profiler = start_profiler(__file__, profile_options(args))
+    start = time.perf_counter()
+    loader = generate_sql.alumnos_loader(load) if load is not None else None
+    for job in jobs:
+        label = job['excel'] if job['sheet'] is None else f"{job['excel']} [{job['sheet']}]"
+        if loader is not None:
+            try:
+                with profiler.stage('classroom'):
+                    result = load_classroom(loader, job['excel'], job['grado_id'], job['seccion'], job['sheet'], profiler)
+            except Exception as e:
+                failed += 1
+                print(f"Error loading {label}: {e}")
+                continue
+            total += result.rows
+            print(f"{label} (grado_id={job['grado_id']}, seccion={job['seccion']}): {result.summary()}")
+            if not result.ok:
+                failed += 1
+            continue
+        try:
+            with profiler.stage('classroom'):
+                count = run_classroom(
+                    job['excel'], job['output'], job['grado_id'], job['seccion'], job['sheet'],
+                    args.batch_size, args.transaction, args.copy, profiler,
+                )
+        except Exception as e:
+            failed += 1
+            print(f"Error processing {label}: {e}")
+            continue
+        total += count
+        print(f"{label}: {count} alumnos (grado_id={job['grado_id']}, seccion={job['seccion']}) -> {job['output']}")
+    if loader is not None:
+        loader.close()
+    verb = 'Loaded' if loader is not None else 'Wrote'
+    print(f"{verb} {total} alumnos from {len(jobs) - failed} classroom(s) in {time.perf_counter() - start:.2f}s")
+    profiler.finish()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
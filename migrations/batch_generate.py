@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Run ``generate_sql_openai_v4.py`` over many classroom workbooks at once.
+
+``comandos.MD`` lists one ``generate_sql_openai_v4.py`` command per
+grade/section workbook.  This entry point takes either a directory of
+``Pagos-*.xlsx`` workbooks or a manifest CSV describing each workbook
+and fans them out over a ``ProcessPoolExecutor``.  The roster CSV and
+SQL template are loaded once in the parent process and handed to every
+worker.
+
+The manifest is a CSV with a header row and the columns::
+
+    excel,rubro_id,cell_range,fee_col,month,year
+
+Only ``excel`` is required; empty cells fall back to the command-line
+defaults.  Relative ``excel`` paths are resolved against the manifest's
+directory.  Example::
+
+    excel,rubro_id,cell_range,fee_col
+    Pagos-SegundoPrimaria-A.xlsx,17,B3:B21,H
+    Pagos-SegundoPrimaria-B.xlsx,17,B3:B22,H
+    Pagos-Parvulos2-Kinder-A.xlsx,19,B3:B21,H
+
+Results are merged into a single SQL file in manifest order (or sorted
+filename order for a directory), regardless of which worker finished
+first, so the output is deterministic.  A per-workbook summary CSV is
+written next to it, and the script exits with status 1 when any
+workbook failed.
+
+Usage::
+
+    python batch_generate.py (--manifest <manifest.csv> | --dir <folder>) \
+        --csv <data.csv> [--sql-template <file.sql>] [--rubro-id <id>] \
+        [--cell-range <start:end>] [--fee-col <column>] \
+        [--month <month>] [--year <year>] [--workers <n>] \
+        [--output <file.sql>] [--summary <file.csv>] [--streaming] \
+        [--compress gzip|zstd] [--write-buffer <bytes>] \
+        [--staging [--staging-dir <dir>]] \
+        [--batch-size <n>] [--transaction] [--copy] \
+        [--fuzzy-match [--match-threshold <0-1>]] \
+        [--roster-cache <dir> | --no-roster-cache] \
+        [--skip-stats] [--metrics-json <file.json>] [--metrics-prom <file.prom>] \
+        [--profile [--profile-report <file.json>] [--profile-cprofile <file>]]
+
+Skip counters and throughput of every workbook (see ``skip_metrics.py``)
+are collected from the workers and reported together with
+``--skip-stats``, ``--metrics-json`` and ``--metrics-prom``.  With
+``--profile`` every worker records its per-stage timings and the
+parent adds them, summed over all workbooks, as ``job.*`` rows below
+``workers`` (see ``profiling.py``).  ``--staging`` makes the workers
+read every workbook from its Arrow staging file (see
+``workbook_staging.py``), so re-running the batch, e.g. for another
+rubro, does not parse the workbooks again.
+"""
+
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from generate_sql_openai_v4 import (
+    generate_payment_statements,
+    load_template,
+    resolve_cell_range,
+)
+from name_matching import DEFAULT_MIN_SCORE, MATCH_THRESHOLD_HELP, NameMatcher
+from profiling import NULL_PROFILER, StageProfiler, add_profile_arguments, profile_options, start_profiler
+from roster import DEFAULT_CACHE_DIR, load_name_to_id_map
+from skip_metrics import GenerationMetrics, add_metrics_arguments, report_metrics
+from sql_output import DEFAULT_WRITE_BUFFER, RowCounter, add_output_arguments, compressed_name, open_sql_output
+from workbook_staging import add_staging_arguments, staging_dir_from_args
+
+SUMMARY_FIELDS = ['excel', 'rubro_id', 'cell_range', 'fee_col', 'rows', 'seconds', 'error']
+
+# Per-process state shared by every job a worker runs
+_worker_name_to_id: Dict[str, int] = {}
+_worker_template: str = ''
+_worker_matcher: Optional[NameMatcher] = None
+
+
+def _init_worker(name_to_id: Dict[str, int], template: str, match_threshold: Optional[float] = None) -> None:
+    global _worker_name_to_id, _worker_template, _worker_matcher
+    _worker_name_to_id = name_to_id
+    _worker_template = template
+    # The indexes are rebuilt per worker rather than pickled for every job
+    _worker_matcher = NameMatcher(name_to_id, min_score=match_threshold) if match_threshold is not None else None
+
+
+def _optional_int(value: Optional[str], default: Optional[int]) -> Optional[int]:
+    if value is None or str(value).strip() == '':
+        return default
+    return int(value)
+
+
+def load_jobs(args) -> List[Dict]:
+    """Build the ordered list of workbook jobs from ``--manifest`` or ``--dir``."""
+    defaults = {
+        'rubro_id': args.rubro_id,
+        'cell_range': args.cell_range,
+        'fee_col': args.fee_col,
+        'month': args.month,
+        'year': args.year,
+    }
+    jobs: List[Dict] = []
+    if args.manifest:
+        base_dir = os.path.dirname(os.path.abspath(args.manifest))
+        with open(args.manifest, 'r', encoding='utf-8', newline='') as f:
+            for entry in csv.DictReader(f):
+                excel = (entry.get('excel') or '').strip()
+                if not excel:
+                    continue
+                jobs.append({
+                    'excel': excel if os.path.isabs(excel) else os.path.join(base_dir, excel),
+                    'rubro_id': _optional_int(entry.get('rubro_id'), defaults['rubro_id']),
+                    'cell_range': (entry.get('cell_range') or '').strip() or defaults['cell_range'],
+                    'fee_col': (entry.get('fee_col') or '').strip() or defaults['fee_col'],
+                    'month': _optional_int(entry.get('month'), defaults['month']),
+                    'year': _optional_int(entry.get('year'), defaults['year']),
+                })
+    else:
+        for excel in sorted(glob.glob(os.path.join(args.dir, args.pattern))):
+            jobs.append(dict(defaults, excel=excel))
+    return jobs
+
+
+def run_job(job: Dict, options: Dict) -> Dict:
+    """Generate the statements for one workbook inside a worker process."""
+    start = time.perf_counter()
+    result = dict(job, statements=[], rows=0, error='', profile=[], metrics=[])
+    metrics = GenerationMetrics()
+    # With --batch-size or --copy a statement holds many rows
+    rows = RowCounter()
+    # Each worker profiles its own jobs; the parent merges the records
+    profiler = StageProfiler('job', options['profile']).start() if options['profile'] else NULL_PROFILER
+    try:
+        name_col, start_row, end_row, fee_col = resolve_cell_range(job['cell_range'], job['fee_col'])
+        result['statements'] = generate_payment_statements(
+            job['excel'],
+            _worker_name_to_id,
+            _worker_template,
+            job['rubro_id'],
+            name_col,
+            fee_col,
+            start_row,
+            end_row,
+            month=job['month'],
+            year=job['year'],
+            streaming=options['streaming'],
+            batch_size=options['batch_size'],
+            transaction=options['transaction'],
+            copy=options['copy'],
+            matcher=_worker_matcher,
+            profiler=profiler,
+            metrics=metrics,
+            staging=options['staging'],
+            rows=rows,
+        )
+        result['rows'] = rows.total
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    if profiler.enabled:
+        profiler.stop()
+        result['profile'] = profiler.results()
+    result['metrics'] = metrics.workbooks
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def write_merged_sql(
+    output_path: str,
+    results: List[Dict],
+    compression: Optional[str] = None,
+    buffer_size: int = DEFAULT_WRITE_BUFFER,
+    separator: str = '\n\n',
+) -> int:
+    """Write every workbook's statements, in job order, to ``output_path`` (see ``open_sql_output``).
+
+    ``separator`` goes between the statements of a workbook; ``'\\n'``
+    for ``--copy``, whose blocks come line by line.  Returns the number
+    of rows written.
+    """
+    total = 0
+    with open_sql_output(output_path, compression, buffer_size) as f:
+        first = True
+        for result in results:
+            if not result['statements']:
+                continue
+            if not first:
+                f.write('\n\n')
+            first = False
+            f.write(
+                f"-- {os.path.basename(result['excel'])} "
+                f"(RubroId {result['rubro_id']}, {result['cell_range']}, fee column {result['fee_col'] or 'default'})\n"
+            )
+            f.write(separator.join(result['statements']))
+            total += result['rows']
+    return total
+
+
+def write_summary(summary_path: str, results: List[Dict]) -> None:
+    with open(summary_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow({
+                'excel': result['excel'],
+                'rubro_id': result['rubro_id'],
+                'cell_range': result['cell_range'],
+                'fee_col': result['fee_col'] or '',
+                'rows': result['rows'],
+                'seconds': f"{result['seconds']:.3f}",
+                'error': result['error'],
+            })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate Pagos INSERT statements for many workbooks in parallel.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help='CSV manifest with excel,rubro_id,cell_range,fee_col[,month,year] columns')
+    source.add_argument('--dir', help='Directory containing the workbooks to process')
+    parser.add_argument('--pattern', default='Pagos-*.xlsx', help='Glob used with --dir (default: Pagos-*.xlsx)')
+    parser.add_argument('--csv', required=True, help='Path to the CSV file containing student IDs and names')
+    parser.add_argument('--sql-template', default='insert-pago-example.sql', help='Path to the SQL template file')
+    parser.add_argument('--rubro-id', type=int, default=8, help='Default RubroId for workbooks without one')
+    parser.add_argument('--cell-range', default='B3:B21', help='Default range of name cells (e.g. B3:B21)')
+    parser.add_argument('--fee-col', default=None, help='Default fee column letter (derived from B->I if omitted)')
+    parser.add_argument('--month', type=int, help='Default fallback month (1-12) for dates missing in comments')
+    parser.add_argument('--year', type=int, help='Default fallback year for dates missing in comments')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--output', default='pagos_batch.sql', help='Merged SQL output file')
+    parser.add_argument('--summary', default=None, help='Per-workbook summary CSV (default: <output>.summary.csv)')
+    parser.add_argument('--streaming', action='store_true', help='Read the workbooks in read-only streaming mode')
+    parser.add_argument('--batch-size', type=int, default=0, help='Rows per multi-row INSERT statement (0 = one INSERT per payment)')
+    parser.add_argument('--transaction', action='store_true', help='With --batch-size, wrap every batch in BEGIN/COMMIT')
+    parser.add_argument('--copy', action='store_true', help='Write one COPY ... FROM STDIN block per workbook instead of INSERTs')
+    parser.add_argument('--fuzzy-match', action='store_true', help='Resolve names without an exact roster match (reordered, missing surname, typos)')
+    parser.add_argument('--match-threshold', type=float, default=DEFAULT_MIN_SCORE, help=MATCH_THRESHOLD_HELP)
+    parser.add_argument('--roster-cache', default=DEFAULT_CACHE_DIR, help='Directory (relative to the CSV) for the cached name -> Id index')
+    parser.add_argument('--no-roster-cache', action='store_true', help='Always re-read the CSV instead of using the roster cache')
+    add_output_arguments(parser)
+    add_staging_arguments(parser)
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if args.copy and args.batch_size:
+        parser.error('--copy cannot be combined with --batch-size')
+
+    jobs = load_jobs(args)
+    if not jobs:
+        print('No workbooks to process.')
+        return
+
+    profiler = start_profiler(__file__, profile_options(args))
+    with profiler.stage('roster_load'):
+        name_to_id = load_name_to_id_map(args.csv, None if args.no_roster_cache else args.roster_cache)
+    with profiler.stage('template_load'):
+        template = load_template(args.sql_template)
+
+    start = time.perf_counter()
+    with profiler.stage('workers'), ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(name_to_id, template, args.match_threshold if args.fuzzy_match else None),
+    ) as pool:
+        # ``map`` yields results in submission order, which keeps the
+        # merged output deterministic.
+        options = {
+            'streaming': args.streaming,
+            'batch_size': args.batch_size,
+            'transaction': args.transaction,
+            'copy': args.copy,
+            'staging': staging_dir_from_args(args),
+            # Workers skip cProfile; it only covers the parent process
+            'profile': profiler.options._replace(cprofile=None) if profiler.enabled else None,
+        }
+        results = list(pool.map(run_job, jobs, [options] * len(jobs)))
+    elapsed = time.perf_counter() - start
+    metrics = GenerationMetrics('batch_generate')
+    for result in results:
+        profiler.merge(result['profile'], prefix='job.', depth=1)
+        for workbook_metrics in result['metrics']:
+            metrics.add(workbook_metrics)
+
+    output_path = compressed_name(args.output, args.compress)
+    with profiler.stage('write'):
+        total = write_merged_sql(output_path, results, args.compress, args.write_buffer, '\n' if args.copy else '\n\n')
+        summary_path = args.summary or f"{os.path.splitext(args.output)[0]}.summary.csv"
+        write_summary(summary_path, results)
+
+    for result in results:
+        status = result['error'] or f"{result['rows']} rows"
+        print(f"{os.path.basename(result['excel'])}: {status} ({result['seconds']:.2f}s)")
+    failed = sum(1 for r in results if r['error'])
+    print(
+        f"Generated {total} rows from {len(results) - failed}/{len(results)} workbooks "
+        f"in {elapsed:.2f}s and wrote them to {output_path}"
+    )
+    print(f"Summary written to {summary_path}")
+    report_metrics(metrics, args)
+    profiler.finish()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: NFKD accent stripping versus ``accents.fold_accents``.
+
+Folds one million synthetic student names (upper-cased the way
+``normalize_name`` sees them) and one million fee comments with both
+implementations and checks that every result is identical.
+
+Usage::
+
+    python bench_accent_fold.py [--count 1000000]
+
+Reference run (1,000,000 strings each, Python 3.11)::
+
+    input         nfkd s   table s  strings/s nfkd strings/s table   speedup
+    names           5.11      0.89         195,860       1,124,640      5.7x
+    comments        3.26      0.43         307,087       2,345,051      7.6x
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from accents import fold_accents, nfkd_fold  # noqa: E402
+from synthetic import COMMENT_MONTHS, synthetic_names  # noqa: E402
+
+
+def sample_names(count: int):
+    distinct = [roster_name.upper() for _, roster_name in synthetic_names(min(count, 100000))]
+    return (distinct * (count // len(distinct) + 1))[:count]
+
+
+def sample_comments(count: int, seed: int = 5):
+    rng = random.Random(seed)
+    notes = ['transferencia', 'depósito', 'efectivo', 'Boleta nº 4471', 'pagó mamá', '']
+    comments = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            text = f"{rng.randint(1, 28)} {rng.choice(COMMENT_MONTHS)} 2024 {rng.choice(notes)}"
+        else:
+            text = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025 {rng.choice(notes)}"
+        comments.append(text)
+    return comments
+
+
+def run(label: str, data) -> None:
+    start = time.perf_counter()
+    legacy = [nfkd_fold(s) for s in data]
+    nfkd_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    folded = [fold_accents(s) for s in data]
+    table_s = time.perf_counter() - start
+
+    if legacy != folded:
+        raise SystemExit(f"{label}: folded strings differ")
+    n = len(data)
+    print(
+        f"{label:<11}{nfkd_s:>9.2f}{table_s:>10.2f}"
+        f"{n / nfkd_s:>16,.0f}{n / table_s:>16,.0f}{nfkd_s / table_s:>9.1f}x"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare NFKD accent stripping with the translation tables.')
+    parser.add_argument('--count', type=int, default=1000000, help='Number of strings per input kind')
+    args = parser.parse_args()
+
+    print(f"{'input':<11}{'nfkd s':>9}{'table s':>10}{'strings/s nfkd':>16}{'strings/s table':>16}{'speedup':>10}")
+    run('names', sample_names(args.count))
+    run('comments', sample_comments(args.count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark roster loading: ``iterrows``, the vectorised loader and the cache.
+
+Writes a synthetic ``data-*.csv`` export (100,000 students by default,
+plus an ``Extra`` column standing in for the rest of the export) and
+builds the normalised name -> Id map three ways: with the per-row
+``DataFrame.iterrows()`` loop the generators used to run, with
+:func:`roster.build_name_to_id_map`, and from a warm on-disk cache via
+:func:`roster.load_name_to_id_map`.  The maps are compared so the run
+doubles as an equivalence check.
+
+Usage::
+
+    python bench_roster_load.py [--rows 100000] [--repeat 3]
+
+Reference run (best of 2, Python 3.11, pandas 3.0 without pyarrow)::
+
+    rows      iterrows s   vectorised s   cached s
+    100000          4.28           0.63      0.033
+
+With pyarrow 26 installed (pandas then backs ``str`` columns with Arrow)
+the vectorised load takes the same time, 0.73 s against 4.85 s for
+``iterrows``: the accent folding is a per-element ``map`` either way.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+from generate_sql_openai_v4 import normalize_name  # noqa: E402
+from roster import build_name_to_id_map, load_name_to_id_map  # noqa: E402
+from synthetic import synthetic_names  # noqa: E402
+
+
+def iterrows_name_to_id_map(csv_path: str):
+    """The loader the generators used before ``roster.py``."""
+    df = pd.read_csv(csv_path)
+    name_to_id = {}
+    for _, row in df.iterrows():
+        name_to_id[normalize_name(str(row['NombreCompleto']))] = int(row['Id'])
+    return name_to_id
+
+
+def write_export(path: str, rows: int) -> None:
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Id', 'NombreCompleto', 'Extra'])
+        for offset, (_, roster_name) in enumerate(synthetic_names(rows)):
+            writer.writerow([offset + 1, roster_name.title(), f'Grado {offset % 12}'])
+
+
+def best_of(repeat: int, fn, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare iterrows and vectorised roster loading.')
+    parser.add_argument('--rows', type=int, default=100000, help='Number of students in the export')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per loader (best time is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f'data-{args.rows}.csv')
+        write_export(path, args.rows)
+        legacy_s, legacy = best_of(args.repeat, iterrows_name_to_id_map, path)
+        vector_s, vector = best_of(args.repeat, build_name_to_id_map, path)
+        cache_dir = os.path.join(tmp, 'cache')
+        load_name_to_id_map(path, cache_dir)
+        cached_s, cached = best_of(args.repeat, load_name_to_id_map, path, cache_dir)
+
+    if not legacy == vector == cached:
+        raise SystemExit('name -> Id maps differ')
+    print(f"{'rows':<10}{'iterrows s':>12}{'vectorised s':>15}{'cached s':>11}")
+    print(f"{args.rows:<10}{legacy_s:>12.2f}{vector_s:>15.2f}{cached_s:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
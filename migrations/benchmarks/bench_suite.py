@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the payment generators, with JSON results.
+
+Builds a synthetic ``Pagos-*.xlsx`` workbook (names in column ``B``,
+twelve monthly fee columns headed ``Enero``... from column ``I``, most
+fee cells commented with a payment date) and ``data-*.csv`` rosters of
+1k, 10k and 100k students with :mod:`synthetic`, then times:
+
+* ``roster.build_name_to_id_map`` for every roster size;
+* ``parse_date_from_comment``, ``parse_amount`` and
+  ``generate_statement`` of every generator module, over the same
+  sample comments, fee values and payments;
+* the end-to-end ``main()`` of every generator, run in a scratch
+  directory with the same arguments one would type on the command line
+  (``generate_sql_openai.py`` and ``generate_sql_openai_v2.py`` only
+  read rows 3-21 of column ``I``).
+
+Each case is run ``--repeat`` times; every run time is kept and the best
+and mean are reported.  The parse caches of ``generate_sql_openai_v4.py``
+and ``generate_sql_multi_mes.py`` are cleared before every end-to-end
+run, and the roster cache lives in the scratch directory, so only the
+first end-to-end run of those two starts from a cold roster cache.
+
+Results are printed as a table and written to ``--output`` as JSON
+together with the Python, platform and package versions.  ``--compare``
+takes an earlier JSON file and adds the ratio of the best time per item
+against it for every case present in both runs (below 1.0 is faster).
+
+Usage::
+
+    python bench_suite.py [--rows 2000] [--roster-sizes 1000,10000,100000] \
+        [--samples 20000] [--repeat 3] [--e2e-roster 10000] [--skip-e2e] \
+        [--only roster,parse,render,end_to_end] [--output bench-results.json] \
+        [--compare <previous.json>] [--keep <dir>]
+
+Reference run (``--repeat 2``, Python 3.11, openpyxl 3.1, pandas 3.0;
+"per item" is per roster row, comment, value or payment, and per
+student row for the end-to-end cases)::
+
+    case                                            best s   mean s   per item
+    roster.build_name_to_id_map[1000]                0.012    0.013    11.8 us
+    roster.build_name_to_id_map[10000]               0.081    0.083     8.1 us
+    roster.build_name_to_id_map[100000]              0.710    0.723     7.1 us
+    openai.parse_date_from_comment                   0.062    0.068     3.1 us
+    openai.generate_statement                        0.639    0.655    32.0 us
+    openai_v2.generate_statement                     1.185    1.267    59.3 us
+    openai_v4.parse_date_from_comment                0.085    0.085     4.2 us
+    openai_v4.generate_statement                     0.163    0.164     8.1 us
+    multi_mes.parse_date_from_comment                0.086    0.088     4.3 us
+    multi_mes.generate_statement                     0.186    0.187     9.3 us
+    openai_v4.main                                   2.956    2.991  1477.9 us
+    multi_mes.main                                   3.631    3.665  1815.7 us
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import generate_sql_multi_mes as multi_mes  # noqa: E402
+import generate_sql_openai as openai_v1  # noqa: E402
+import generate_sql_openai_v2 as openai_v2  # noqa: E402
+import generate_sql_openai_v4 as openai_v4  # noqa: E402
+from roster import build_name_to_id_map  # noqa: E402
+from synthetic import ROSTER_SIZES, fee_range, sample_comments, sample_fee_values, write_pagos_workbook, write_roster_sizes  # noqa: E402
+
+MIGRATIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_PATH = os.path.join(MIGRATIONS_DIR, 'insert-pago-example.sql')
+GENERATORS = {
+    'openai': openai_v1,
+    'openai_v2': openai_v2,
+    'openai_v4': openai_v4,
+    'multi_mes': multi_mes,
+}
+
+
+def time_case(fn: Callable[[], object], repeat: int, setup: Optional[Callable[[], None]] = None) -> List[float]:
+    """Run ``fn`` ``repeat`` times and return the wall time of every run."""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def record(name: str, group: str, runs: List[float], items: int, **params) -> Dict:
+    best = min(runs)
+    return {
+        'name': name,
+        'group': group,
+        'params': params,
+        'items': items,
+        'runs_s': runs,
+        'best_s': best,
+        'mean_s': sum(runs) / len(runs),
+        'items_per_s': items / best if best else None,
+    }
+
+
+def statement_call(label: str, module) -> Callable[[str, float, int], str]:
+    """``generate_statement`` of ``module`` bound to the arguments its signature takes."""
+    template = module.load_template(TEMPLATE_PATH)
+    if label == 'openai':
+        return lambda fecha, monto, alumno_id: module.generate_statement(template, fecha, monto, alumno_id)
+    if label == 'multi_mes':
+        return lambda fecha, monto, alumno_id: module.generate_statement(
+            template, fecha, monto, alumno_id, 8, int(fecha[5:7]), int(fecha[:4]), True, 'Pagado 13 NOVIEMBRE 2024'
+        )
+    return lambda fecha, monto, alumno_id: module.generate_statement(template, fecha, monto, alumno_id, 8)
+
+
+def bench_roster(paths: Dict[int, str], repeat: int) -> List[Dict]:
+    results = []
+    for size, path in sorted(paths.items()):
+        runs = time_case(lambda: build_name_to_id_map(path, warn_duplicates=False), repeat)
+        results.append(record(f'roster.build_name_to_id_map[{size}]', 'roster', runs, size, rows=size))
+    return results
+
+
+def bench_parsers(samples: int, repeat: int) -> List[Dict]:
+    comments = sample_comments(samples)
+    amounts = sample_fee_values(samples)
+    payments = [
+        (f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}", (150.0, 250.0, 1250.0, 175.5)[i % 4], i % 50000 + 1)
+        for i in range(samples)
+    ]
+    results = []
+    for label, module in GENERATORS.items():
+        parse_date = module.parse_date_from_comment
+        parse_amount = module.parse_amount
+        render = statement_call(label, module)
+        runs = time_case(lambda: [parse_date(c) for c in comments], repeat)
+        results.append(record(f'{label}.parse_date_from_comment', 'parse', runs, samples))
+        runs = time_case(lambda: [parse_amount(v) for v in amounts], repeat)
+        results.append(record(f'{label}.parse_amount', 'parse', runs, samples))
+        runs = time_case(lambda: [render(*p) for p in payments], repeat)
+        results.append(record(f'{label}.generate_statement', 'render', runs, samples))
+    return results
+
+
+def _clear_parse_caches() -> None:
+    for module in (openai_v4, multi_mes):
+        module.cached_parse_date.cache_clear()
+        module.cached_parse_amount.cache_clear()
+
+
+def run_main(module, argv: List[str], workdir: str) -> None:
+    """Call ``module.main()`` as if run from ``workdir`` with ``argv``, discarding its output."""
+    saved_argv, saved_cwd = sys.argv, os.getcwd()
+    sys.argv = [module.__file__] + argv
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.main()
+    finally:
+        sys.argv = saved_argv
+        os.chdir(saved_cwd)
+
+
+def bench_end_to_end(workbook: str, roster: str, rows: int, repeat: int, workdir: str) -> List[Dict]:
+    cell_range, fee_cols = fee_range(rows)
+    common = ['--excel', workbook, '--csv', roster, '--sql-template', TEMPLATE_PATH]
+    cases = [
+        ('openai', common, 19),
+        ('openai_v2', common + ['--rubro-id', '8'], 19),
+        ('openai_v4', common + ['--rubro-id', '8', '--month', '1', '--year', '2025', '--cell-range', cell_range, '--fee-col', 'I'], rows),
+        ('multi_mes', common + ['--rubro-id', '8', '--cell-range', cell_range, '--fee-cols', fee_cols], rows),
+    ]
+    results = []
+    for label, argv, items in cases:
+        module = GENERATORS[label]
+        runs = time_case(lambda: run_main(module, argv, workdir), repeat, setup=_clear_parse_caches)
+        results.append(record(f'{label}.main', 'end_to_end', runs, items, rows=rows, roster=os.path.basename(roster)))
+    return results
+
+
+def compare(results: List[Dict], previous_path: str) -> Dict[str, float]:
+    """Ratio of each case's best time per item to the same case in an earlier results file."""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = {entry['name']: entry for entry in json.load(f)['results']}
+    ratios = {}
+    for entry in results:
+        before = previous.get(entry['name'])
+        if before and before['best_s'] and before['items'] and entry['items']:
+            ratios[entry['name']] = (entry['best_s'] / entry['items']) / (before['best_s'] / before['items'])
+    return ratios
+
+
+def print_table(results: List[Dict], ratios: Dict[str, float]) -> None:
+    header = f"{'case':<45}{'best s':>9}{'mean s':>9}{'per item':>11}"
+    if ratios:
+        header += f"{'vs prev':>9}"
+    print(header)
+    for entry in results:
+        per_item = entry['best_s'] / entry['items'] * 1e6 if entry['items'] else 0.0
+        line = f"{entry['name']:<45}{entry['best_s']:>9.3f}{entry['mean_s']:>9.3f}{per_item:>8.1f} us"
+        if entry['name'] in ratios:
+            line += f"{ratios[entry['name']]:>8.2f}x"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Time the roster loader, parsers, renderers and generators.')
+    parser.add_argument('--rows', type=int, default=2000, help='Student rows in the synthetic workbook')
+    parser.add_argument(
+        '--roster-sizes',
+        default=','.join(str(size) for size in ROSTER_SIZES),
+        help='Comma separated roster sizes to generate and time',
+    )
+    parser.add_argument('--samples', type=int, default=20000, help='Comments, amounts and payments per parser/renderer case')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case')
+    parser.add_argument('--e2e-roster', type=int, default=10000, help='Roster size used by the end-to-end runs')
+    parser.add_argument('--skip-e2e', action='store_true', help='Skip the end-to-end generator runs')
+    parser.add_argument('--only', help='Only run cases whose group is one of roster, parse, render, end_to_end (comma separated)')
+    parser.add_argument('--output', default='bench-results.json', help='JSON file for the results')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--keep', help='Write the synthetic files to this directory and keep them')
+    args = parser.parse_args()
+
+    sizes = sorted({int(size) for size in args.roster_sizes.split(',') if size.strip()} | {args.e2e_roster})
+    if args.e2e_roster < args.rows:
+        parser.error('--e2e-roster must be at least --rows so every workbook name is in the roster')
+    groups = set(args.only.split(',')) if args.only else {'roster', 'parse', 'render', 'end_to_end'}
+    if args.skip_e2e:
+        groups.discard('end_to_end')
+
+    workdir = args.keep or tempfile.mkdtemp(prefix='bench-suite-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        rosters = write_roster_sizes(workdir, sizes)
+        results: List[Dict] = []
+        if 'roster' in groups:
+            requested = {int(size) for size in args.roster_sizes.split(',') if size.strip()}
+            results += bench_roster({size: path for size, path in rosters.items() if size in requested}, args.repeat)
+        if groups & {'parse', 'render'}:
+            results += [r for r in bench_parsers(args.samples, args.repeat) if r['group'] in groups]
+        if 'end_to_end' in groups:
+            workbook = os.path.join(workdir, f'Pagos-Synthetic-{args.rows}.xlsx')
+            write_pagos_workbook(workbook, args.rows)
+            results += bench_end_to_end(workbook, rosters[args.e2e_roster], args.rows, args.repeat, workdir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    ratios = compare(results, args.compare) if args.compare else {}
+    print_table(results, ratios)
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'packages': {'openpyxl': openpyxl.__version__, 'pandas': pd.__version__},
+        'config': {
+            'rows': args.rows,
+            'roster_sizes': sizes,
+            'samples': args.samples,
+            'repeat': args.repeat,
+            'e2e_roster': args.e2e_roster,
+        },
+        'results': results,
+    }
+    if ratios:
+        report['compared_to'] = args.compare
+        report['ratios'] = ratios
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Synthetic ``Pagos-*.xlsx`` workbooks and ``data-*.csv`` rosters.
+
+The real classroom workbooks cannot leave the school, so the benchmarks
+build look-alike files instead.  The layout mirrors the workbooks the
+generators are run against:
+
+* Row 2 holds the column headers.  Fee columns are headed with Spanish
+  month names (``Enero``, ``Febrero``...).
+* Student names live in column ``B`` starting at row 3, written as
+  ``APELLIDO APELLIDO, Nombre Nombre`` with the occasional accent.
+* Fee cells hold either numbers or strings such as ``Q250,00``,
+  ``Q1.250,00``, ``BECA`` or ``XX``.  Most of them carry a comment with
+  the payment date (``13 NOVIEMBRE 2024 transferencia`` or
+  ``05/01/2025``) the way treasury staff type them.
+
+The roster CSV has the ``Id`` and ``NombreCompleto`` columns of the
+database export, with names written without the comma so that only the
+normalised form matches.  :func:`synthetic_names` is deterministic and
+every shorter list is a prefix of a longer one, so the rosters written by
+:func:`write_roster_sizes` (1k, 10k and 100k students by default) all
+contain the students of a workbook with fewer rows.
+
+Usage::
+
+    python synthetic.py --rows 50000 --workbook Pagos-Synthetic.xlsx \
+        --csv data-synthetic.csv [--roster-sizes 1000,10000,100000]
+"""
+
+import argparse
+import csv
+import os
+import random
+from typing import Dict, List, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.comments import Comment
+from openpyxl.utils import get_column_letter
+
+SURNAMES = [
+    'GARCÍA', 'LÓPEZ', 'PÉREZ', 'GONZÁLEZ', 'RODRÍGUEZ', 'HERNÁNDEZ',
+    'MARTÍNEZ', 'RAMÍREZ', 'MORALES', 'CASTILLO', 'OROZCO', 'MÉNDEZ',
+    'JUÁREZ', 'ESTRADA', 'MUÑOZ', 'AGUILAR', 'VÁSQUEZ', 'CIFUENTES',
+    'SOLÍS', 'BARRIOS', 'MONTERROSO', 'DE LEÓN', 'ORDÓÑEZ', 'VELÁSQUEZ',
+]
+GIVEN_NAMES = [
+    'José', 'María', 'Ana', 'Luis', 'Sofía', 'Andrés', 'Lucía', 'Diego',
+    'Valentina', 'Mateo', 'Camila', 'Sebastián', 'Isabella', 'Ángel',
+    'Fernanda', 'Julián', 'Ximena', 'Tomás', 'Renata', 'Martín',
+]
+MONTH_HEADERS = [
+    'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+    'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre',
+]
+COMMENT_MONTHS = [
+    'ENERO', 'FEBRERO', 'MARZO', 'ABRIL', 'MAYO', 'JUNIO', 'JULIO',
+    'AGOSTO', 'SEPTIEMBRE', 'OCTUBRE', 'NOVIEMBRE', 'DICIEMBRE',
+]
+NAME_COL = 2  # column B
+FIRST_DATA_ROW = 3
+ROSTER_SIZES = (1000, 10000, 100000)
+
+
+def synthetic_names(count: int, seed: int = 7) -> List[Tuple[str, str]]:
+    """Return ``count`` unique ``(workbook_name, roster_name)`` pairs."""
+    rng = random.Random(seed)
+    seen = set()
+    names: List[Tuple[str, str]] = []
+    while len(names) < count:
+        apellidos = f"{rng.choice(SURNAMES)} {rng.choice(SURNAMES)}"
+        nombres = ' '.join(rng.sample(GIVEN_NAMES, rng.choice((1, 2, 2, 3))))
+        if (apellidos, nombres) in seen:
+            # Disambiguate large rosters with a numbered third given name
+            nombres = f"{nombres} {len(names)}"
+        seen.add((apellidos, nombres))
+        names.append((f"{apellidos}, {nombres}", f"{apellidos} {nombres}"))
+    return names
+
+
+def _fee_value(rng: random.Random):
+    roll = rng.random()
+    if roll < 0.45:
+        return rng.choice((150, 250, 300, 350.5))
+    if roll < 0.80:
+        return f"Q{rng.choice(('250,00', '300,00', '1.250,00', '175,50'))}"
+    if roll < 0.88:
+        return rng.choice(('BECA', 'XX', 'PENDIENTE'))
+    return None
+
+
+def _comment_text(rng: random.Random, month: int) -> str:
+    roll = rng.random()
+    day = rng.randint(1, 28)
+    if roll < 0.55:
+        medio = rng.choice(('transferencia', 'deposito', 'efectivo', 'boleta 4471'))
+        return f"{day} {COMMENT_MONTHS[month - 1]} 2025 {medio}"
+    if roll < 0.85:
+        return f"{day:02d}/{month:02d}/2025"
+    return rng.choice(('Pago pendiente de confirmar', 'Boleta extraviada'))
+
+
+def write_pagos_workbook(
+    path: str,
+    rows: int,
+    fee_cols: int = 12,
+    first_fee_col: int = 9,
+    comment_ratio: float = 0.8,
+    seed: int = 7,
+) -> List[Tuple[str, str]]:
+    """Write a synthetic payments workbook and return the names used.
+
+    The workbook is written in write-only mode so that generating
+    hundreds of thousands of rows does not itself need the memory the
+    benchmarks are trying to measure.
+
+    Parameters
+    ----------
+    path: str
+        Destination ``.xlsx`` path.
+    rows: int
+        Number of student rows.
+    fee_cols: int
+        Number of monthly fee columns (headed ``Enero``...).
+    first_fee_col: int
+        1-based index of the first fee column (``9`` is column ``I``).
+    comment_ratio: float
+        Fraction of fee cells that get a comment.
+    seed: int
+        Seed for the pseudo-random generator.
+
+    Returns
+    -------
+    List[Tuple[str, str]]
+        ``(workbook_name, roster_name)`` pairs in row order.
+    """
+    rng = random.Random(seed)
+    names = synthetic_names(rows, seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Pagos')
+    ws.append(['Colegio Manitas Creativas - Control de pagos'])
+    header = [None] * (first_fee_col + fee_cols - 1)
+    header[0] = 'No.'
+    header[NAME_COL - 1] = 'Nombre del Alumno'
+    for i in range(fee_cols):
+        header[first_fee_col - 1 + i] = MONTH_HEADERS[i % 12]
+    ws.append(header)
+    for idx, (wb_name, _) in enumerate(names, start=1):
+        row: list = [None] * (first_fee_col + fee_cols - 1)
+        row[0] = idx
+        row[NAME_COL - 1] = wb_name
+        for i in range(fee_cols):
+            value = _fee_value(rng)
+            if value is not None and rng.random() < comment_ratio:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.comment = Comment(_comment_text(rng, i % 12 + 1), 'Tesoreria')
+                value = cell
+            row[first_fee_col - 1 + i] = value
+        ws.append(row)
+    wb.save(path)
+    return names
+
+
+def write_roster_csv(path: str, names: List[Tuple[str, str]], first_id: int = 1) -> None:
+    """Write a ``data-*.csv`` style roster for ``names``."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Id', 'NombreCompleto'])
+        for offset, (_, roster_name) in enumerate(names):
+            writer.writerow([first_id + offset, roster_name.title()])
+
+
+def write_roster_sizes(directory: str, sizes=ROSTER_SIZES, seed: int = 7) -> Dict[int, str]:
+    """Write one ``data-<size>.csv`` roster per size and return their paths."""
+    names = synthetic_names(max(sizes), seed)
+    paths: Dict[int, str] = {}
+    for size in sizes:
+        path = os.path.join(directory, f'data-{size}.csv')
+        write_roster_csv(path, names[:size])
+        paths[size] = path
+    return paths
+
+
+def sample_comments(count: int, seed: int = 7) -> List[str]:
+    """Return ``count`` fee-cell comments in the formats treasury staff type."""
+    rng = random.Random(seed)
+    return [_comment_text(rng, rng.randint(1, 12)) for _ in range(count)]
+
+
+def sample_fee_values(count: int, seed: int = 7) -> list:
+    """Return ``count`` non-empty fee-cell values (numbers and ``Q...`` strings)."""
+    rng = random.Random(seed)
+    values = []
+    while len(values) < count:
+        value = _fee_value(rng)
+        if value is not None:
+            values.append(value)
+    return values
+
+
+def fee_range(rows: int, fee_cols: int = 12, first_fee_col: int = 9) -> Tuple[str, str]:
+    """Return the ``--cell-range`` and ``--fee-cols`` arguments for a synthetic workbook."""
+    name_col = get_column_letter(NAME_COL)
+    cell_range = f"{name_col}{FIRST_DATA_ROW}:{name_col}{FIRST_DATA_ROW + rows - 1}"
+    fees = f"{get_column_letter(first_fee_col)}-{get_column_letter(first_fee_col + fee_cols - 1)}"
+    return cell_range, fees
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Write a synthetic Pagos workbook and matching roster CSV.')
+    parser.add_argument('--rows', type=int, default=1000, help='Number of student rows')
+    parser.add_argument('--fee-cols', type=int, default=12, help='Number of monthly fee columns')
+    parser.add_argument('--workbook', default='Pagos-Synthetic.xlsx', help='Output workbook path')
+    parser.add_argument('--csv', default='data-synthetic.csv', help='Output roster CSV path')
+    parser.add_argument('--seed', type=int, default=7, help='Random seed')
+    parser.add_argument(
+        '--roster-sizes',
+        help='Also write data-<n>.csv rosters of these sizes next to --csv (e.g. 1000,10000,100000)',
+    )
+    args = parser.parse_args()
+
+    names = write_pagos_workbook(args.workbook, args.rows, args.fee_cols, seed=args.seed)
+    write_roster_csv(args.csv, names)
+    if args.roster_sizes:
+        sizes = [int(size) for size in args.roster_sizes.split(',') if size.strip()]
+        for size, path in write_roster_sizes(os.path.dirname(os.path.abspath(args.csv)), sizes, args.seed).items():
+            print(f"Wrote {size} students to {path}")
+    cell_range, fees = fee_range(args.rows, args.fee_cols)
+    print(f"Wrote {args.rows} rows to {args.workbook} and {args.csv}")
+    print(f"Use --cell-range {cell_range} --fee-cols {fees}")
+
+
+if __name__ == '__main__':
+    main()
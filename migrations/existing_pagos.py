@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Anti-join of generated payments against the rows already in ``Pagos``.
+
+The generators only see the workbook, so re-running one after its SQL
+was loaded inserts every payment a second time.  With::
+
+    --existing-pagos <export.csv>       an export of public."Pagos"
+    --existing-pagos-dsn <dsn>          or a query against the database
+
+the rows already in the table are loaded into an :class:`ExistingPagos`
+index keyed by::
+
+    (AlumnoId, RubroId, MesColegiatura, AnioColegiatura, Monto)
+
+and every candidate payment is looked up before it is rendered; payments
+whose key is already there are dropped and counted.  ``Fecha`` is left
+out of the key on purpose: the date parsed from a comment and the date
+typed in the admin UI for the same payment rarely agree.  Annulled rows
+(``EsAnulado``) are not indexed, so a voided payment can be re-issued.
+A ``NULL`` month or year matches ``NULL`` (the registration-fee
+payments of ``generate_sql_openai_v4.py`` carry neither).
+
+The export can be produced with ``psql``::
+
+    \\copy (SELECT "AlumnoId", "RubroId", "MesColegiatura", "AnioColegiatura", "Monto", "EsAnulado"
+           FROM public."Pagos") TO 'pagos-existentes.csv' CSV HEADER
+
+Any extra columns are ignored and the header names are matched without
+quotes or case.  Only the rows of the rubros being generated are kept,
+and the database query filters on ``RubroId`` as well and streams the
+result through a server-side cursor, so only the index itself is held
+in memory, never the rows of a table with millions of them.
+
+Each key is packed into a single integer (the ``Monto`` in cents in the
+low bits).  That keeps a million-row index at about 65 MB, lets two
+million rows be indexed in about six seconds and makes the per-payment
+check one ``set`` lookup on an integer built from the already formatted
+statement values.
+"""
+
+import csv
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Set, Tuple
+
+from pg_loader import require_psycopg
+
+KEY_COLUMNS = ('AlumnoId', 'RubroId', 'MesColegiatura', 'AnioColegiatura', 'Monto')
+
+# Bit widths of the packed key, from the low end: Monto in cents (offset
+# so negative amounts stay positive), AnioColegiatura, MesColegiatura,
+# RubroId; AlumnoId takes the remaining high bits.
+_CENTS_BITS = 48
+_CENTS_OFFSET = 1 << (_CENTS_BITS - 1)
+_ANIO_BITS = 16
+_MES_BITS = 4
+_RUBRO_BITS = 24
+
+_TRUE_TEXTS = frozenset(('t', 'true', '1', 'yes', 'y'))
+
+
+def pack_key(alumno_id: int, rubro_id: int, mes: int, anio: int, cents: int) -> Optional[int]:
+    """Pack one key into an integer, or ``None`` when a field does not fit its bits."""
+    if not (
+        0 <= mes < 1 << _MES_BITS
+        and 0 <= anio < 1 << _ANIO_BITS
+        and 0 <= rubro_id < 1 << _RUBRO_BITS
+        and -_CENTS_OFFSET <= cents < _CENTS_OFFSET
+        and alumno_id >= 0
+    ):
+        return None
+    return (
+        ((((alumno_id << _RUBRO_BITS | rubro_id) << _MES_BITS | mes) << _ANIO_BITS | anio) << _CENTS_BITS)
+        | (cents + _CENTS_OFFSET)
+    )
+
+
+def _int_or_zero(text) -> int:
+    if text is None or text == '' or text == 'NULL':
+        return 0
+    return int(text)
+
+
+def _cents(value) -> int:
+    if isinstance(value, str):
+        # Fast path for the plain decimals of a CSV export ("150", "150.5", "150.00")
+        whole, _, fraction = value.partition('.')
+        if len(fraction) <= 2 and whole.lstrip('-').isdigit() and (not fraction or fraction.isdigit()):
+            return int(whole + fraction.ljust(2, '0'))
+    return int((Decimal(str(value)) * 100).to_integral_value())
+
+
+class ExistingPagos:
+    """Hashed index of the payment keys already in ``Pagos``.
+
+    Parameters
+    ----------
+    rubro_ids: Optional[Iterable[int]]
+        Only rows of these rubros are indexed; ``None`` keeps all of them.
+    source: str
+        Where the rows came from, for :meth:`summary`.
+    """
+
+    def __init__(self, rubro_ids: Optional[Iterable[int]] = None, source: str = ''):
+        self.rubro_ids = frozenset(rubro_ids) if rubro_ids is not None else None
+        self.source = source
+        self._keys: Set[int] = set()
+        # Keys whose fields do not fit pack_key, kept as tuples
+        self._other: Set[Tuple[int, int, int, int, int]] = set()
+        self.rows = 0
+        self.checked = 0
+        self.matched = 0
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._other)
+
+    def add(self, alumno_id, rubro_id, mes, anio, monto) -> None:
+        """Index one existing row; ``mes``/``anio`` may be ``None`` and ``monto`` any decimal value."""
+        rubro_id = int(rubro_id)
+        if self.rubro_ids is not None and rubro_id not in self.rubro_ids:
+            return
+        self.rows += 1
+        fields = (int(alumno_id), rubro_id, _int_or_zero(mes), _int_or_zero(anio), _cents(monto))
+        key = pack_key(*fields)
+        if key is None:
+            self._other.add(fields)
+        else:
+            self._keys.add(key)
+
+    def contains(self, values: Dict[str, str]) -> bool:
+        """Whether a payment, given as its template slot values (see ``statement_values``), already exists."""
+        # Monto is always formatted with two decimals, so dropping the point gives cents
+        fields = (
+            int(values['AlumnoId']),
+            int(values['RubroId']),
+            _int_or_zero(values['MesColegiatura']),
+            _int_or_zero(values['AnioColegiatura']),
+            int(values['Monto'].replace('.', '')),
+        )
+        key = pack_key(*fields)
+        if key is None:
+            return fields in self._other
+        return key in self._keys
+
+    def filter(self, payments: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Yield the payments that are not in ``Pagos`` yet, counting the ones dropped."""
+        contains = self.contains
+        for values in payments:
+            self.checked += 1
+            if contains(values):
+                self.matched += 1
+                continue
+            yield values
+
+    def summary(self) -> str:
+        return (
+            f"Existing Pagos ({self.source}, {len(self)} keys): "
+            f"{self.matched} of {self.checked} payments already present (skipped)"
+        )
+
+    # -- sources -----------------------------------------------------------
+
+    @classmethod
+    def from_csv(cls, path: str, rubro_ids: Optional[Iterable[int]] = None) -> 'ExistingPagos':
+        """Index a CSV export of ``Pagos`` with at least the :data:`KEY_COLUMNS`."""
+        index = cls(rubro_ids, source=path)
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            header = [name.strip().strip('"').lower() for name in next(reader, [])]
+            try:
+                positions = [header.index(column.lower()) for column in KEY_COLUMNS]
+            except ValueError:
+                raise ValueError(f"{path} must have the columns {', '.join(KEY_COLUMNS)}") from None
+            anulado = header.index('esanulado') if 'esanulado' in header else None
+            add = index.add
+            for line_no, row in enumerate(reader, start=2):
+                if not row:
+                    continue
+                if anulado is not None and row[anulado].strip().lower() in _TRUE_TEXTS:
+                    continue
+                try:
+                    add(*[row[i].strip() or None for i in positions])
+                except (ValueError, TypeError, IndexError, InvalidOperation) as e:
+                    raise ValueError(f"{path}, line {line_no}: {e}") from None
+        return index
+
+    @classmethod
+    def from_database(
+        cls,
+        dsn: str,
+        rubro_ids: Optional[Sequence[int]] = None,
+        table: str = 'public."Pagos"',
+        fetch_size: int = 50000,
+    ) -> 'ExistingPagos':
+        """Index the non-annulled rows of ``table`` through a server-side cursor."""
+        psycopg = require_psycopg()
+        index = cls(rubro_ids, source=table)
+        columns = ', '.join(f'"{column}"' for column in KEY_COLUMNS)
+        query = f'SELECT {columns} FROM {table} WHERE NOT "EsAnulado"'
+        params: Tuple = ()
+        if rubro_ids is not None:
+            query += ' AND "RubroId" = ANY(%s)'
+            params = (list(rubro_ids),)
+        with psycopg.connect(dsn) as conn:
+            with conn.cursor(name='existing_pagos') as cur:
+                cur.itersize = fetch_size
+                cur.execute(query, params)
+                add = index.add
+                for row in cur:
+                    add(*row)
+        return index
+
+
+def add_existing_pagos_arguments(parser) -> None:
+    """Add ``--existing-pagos`` and ``--existing-pagos-dsn`` to an ``argparse`` parser."""
+    parser.add_argument('--existing-pagos', help='CSV export of public."Pagos"; payments already there are not generated again')
+    parser.add_argument('--existing-pagos-dsn', help='Read the existing Pagos from this PostgreSQL database instead of a CSV export')
+
+
+def existing_pagos_from_args(args, rubro_ids: Optional[Sequence[int]] = None) -> Optional[ExistingPagos]:
+    """:class:`ExistingPagos` for the parsed flags, or ``None`` when neither was given."""
+    if args.existing_pagos_dsn:
+        return ExistingPagos.from_database(args.existing_pagos_dsn, rubro_ids)
+    if args.existing_pagos:
+        return ExistingPagos.from_csv(args.existing_pagos, rubro_ids)
+    return None
@@ -1,50 +1,120 @@
-
 import openpyxl
+import re
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from profiling import NULL_PROFILER, pop_profile_options, start_profiler
+from workbook_stream import list_sheet_names
+
+def iter_sheet_names(file_path, sheet_name=None):
+    # Read-only mode streams the sheet XML instead of loading every cell
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.active
+        # Column A is index 1
+        for (value,) in sheet.iter_rows(min_row=1, min_col=1, max_col=1, values_only=True):
+            if value:
+                yield value
+    finally:
+        workbook.close()
 
-def extract_names_from_excel(file_path):
-    workbook = openpyxl.load_workbook(file_path)
-    sheet = workbook.active
-    names = []
-    # Column A is index 1
-    for row in sheet.iter_rows(min_row=1, min_col=1, max_col=1):
-        for cell in row:
-            if cell.value:
-                names.append(cell.value)
-    return names
+def extract_names_from_excel(file_path, sheet_name=None):
+    return list(iter_sheet_names(file_path, sheet_name))
+
+def output_file_for(excel_file, sheet_name=None):
+    base_name = os.path.splitext(os.path.basename(excel_file))[0]
+    if sheet_name is None:
+        return f"extracted_names_{base_name}.txt"
+    # One file per tab, e.g. extracted_names_Inscripciones_PrimeroPrimaria-A.txt
+    safe_sheet = re.sub(r'[^\w.-]+', '_', sheet_name.strip()).strip('_') or "sheet"
+    return f"extracted_names_{base_name}_{safe_sheet}.txt"
+
+def extract_sheet_to_file(excel_file, sheet_name, output_file, profiler=NULL_PROFILER):
+    # Names are written as they are read, nothing is accumulated in memory
+    count = 0
+    with open(output_file, "w", encoding="utf-8") as f:
+        write = profiler.wrap("write", f.write)
+        for name in profiler.iterate("read_names", iter_sheet_names(excel_file, sheet_name)):
+            write(f"{name}\n")
+            count += 1
+    return sheet_name, output_file, count
+
+def extract_sheets(excel_file, sheet_names, workers=None):
+    # Every worker opens its own read-only handle on the workbook
+    jobs = [(sheet_name, output_file_for(excel_file, sheet_name)) for sheet_name in sheet_names]
+    if workers == 1 or len(jobs) == 1:
+        for sheet_name, output_file in jobs:
+            yield extract_sheet_to_file(excel_file, sheet_name, output_file)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extract_sheet_to_file, excel_file, sheet_name, output_file) for sheet_name, output_file in jobs]
+        for future in as_completed(futures):
+            yield future.result()
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python extract_names.py <excel_file_path>")
+    # Optional flags: --all-sheets extracts every tab, --sheets "A,B" a subset,
+    # --workers <n> limits the number of worker processes, --profile reports
+    # time and memory per stage (see profiling.py)
+    argv = sys.argv[1:]
+    profile = pop_profile_options(argv)
+    all_sheets = False
+    sheets = None
+    workers = None
+    if "--all-sheets" in argv:
+        argv.remove("--all-sheets")
+        all_sheets = True
+    if "--sheets" in argv:
+        idx = argv.index("--sheets")
+        sheets = [s.strip() for s in argv[idx + 1].split(",") if s.strip()]
+        del argv[idx:idx + 2]
+    if "--workers" in argv:
+        idx = argv.index("--workers")
+        workers = int(argv[idx + 1])
+        del argv[idx:idx + 2]
+
+    if len(argv) < 1:
+        print("Usage: python extract_names.py <excel_file_path> [--all-sheets | --sheets <name1,name2>] [--workers <n>] [--profile]")
         print("Example: python extract_names.py 'C:\\path\\to\\your\\file.xlsx'")
+        print("Example: python extract_names.py 'C:\\path\\to\\Inscripciones.xlsx' --all-sheets")
         sys.exit(1)
-    
-    excel_file = sys.argv[1]
-    
+
+    excel_file = argv[0]
+
     if not os.path.exists(excel_file):
         print(f"Error: File '{excel_file}' not found")
         print("Please check the file path and try again")
         sys.exit(1)
-    
+
     print(f"Processing Excel file: {excel_file}")
-    
+    profiler = start_profiler(__file__, profile)
+
     try:
-        extracted_names = extract_names_from_excel(excel_file)
-        
-        # Generate output filename based on input filename
-        base_name = os.path.splitext(os.path.basename(excel_file))[0]
-        output_file = f"extracted_names_{base_name}.txt"
-        
-        with open(output_file, "w", encoding="utf-8") as f:
-            for name in extracted_names:
-                f.write(name + "\n")
-        
-        print(f"Successfully extracted {len(extracted_names)} names from {excel_file}")
-        print(f"Output saved to: {output_file}")
-        
+        if all_sheets or sheets:
+            with profiler.stage("list_sheets"):
+                available = list_sheet_names(excel_file)
+            if sheets:
+                missing = [s for s in sheets if s not in available]
+                if missing:
+                    print(f"Error: Sheet(s) not found: {', '.join(missing)}")
+                    print(f"Available sheets: {', '.join(available)}")
+                    sys.exit(1)
+            selected = sheets or available
+            total = 0
+            for sheet_name, output_file, count in profiler.iterate("extract_sheet", extract_sheets(excel_file, selected, workers)):
+                print(f"Extracted {count} names from sheet '{sheet_name}' to {output_file}")
+                total += count
+            print(f"Successfully extracted {total} names from {len(selected)} sheets of {excel_file}")
+        else:
+            # Generate output filename based on input filename
+            output_file = output_file_for(excel_file)
+            with profiler.stage("extract"):
+                _, _, count = extract_sheet_to_file(excel_file, None, output_file, profiler)
+
+            print(f"Successfully extracted {count} names from {excel_file}")
+            print(f"Output saved to: {output_file}")
+        profiler.finish()
+
     except Exception as e:
         print(f"Error processing file: {e}")
         sys.exit(1)
-
-
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Content digests of input and output files.
+
+The roster cache (``roster.py``) and the workbook staging files
+(``workbook_staging.py``) are keyed by the SHA-256 of the file they
+were built from, and the shard manifests (``sql_shards.py``) record the
+SHA-256 of every shard so a copy can be checked before it is loaded.
+"""
+
+import hashlib
+
+
+def file_digest(path: str) -> str:
+    """Return the hex SHA-256 of a file's contents, read in 1 MiB chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
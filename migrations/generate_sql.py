@@ -4,6 +4,10 @@ import pytz
 import sys
 import os
 
+from pg_loader import PgLoader, pop_load_options
+from profiling import NULL_PROFILER, pop_profile_options, start_profiler
+from sql_output import format_copy_block, format_copy_row, format_insert_batches, parse_insert_head, sql_literal_to_copy
+
 def generate_sql_inserts(input_file, output_file, table_name="public.\"Alumnos\""):
     print(f"Intentando generar SQL desde {input_file} a {output_file}")
     try:
@@ -52,60 +56,150 @@ def generate_sql_inserts(input_file, output_file, table_name="public.\"Alumnos\"
     except Exception as e:
         print(f"Error al generar SQL: {e}")
 
-def generate_sql_inserts_with_params(input_file, output_file, grado_id=4, seccion="B", table_name="public.\"Alumnos\""):
-    print(f"Intentando generar SQL desde {input_file} a {output_file}")
-    try:
-        with open(input_file, "r", encoding="utf-8") as infile, open(output_file, "w", encoding="utf-8") as outfile:
-            reader = csv.reader(infile)
-            for row in reader:
-                # Extracting names from processed_names.txt
-                primer_apellido = row[0].strip().replace("\"", "\"\"") if len(row) > 0 else ""
-                segundo_apellido = row[1].strip().replace("\"", "\"\"") if len(row) > 1 else ""
-                primer_nombre = row[2].strip().replace("\"", "\"\"") if len(row) > 2 else ""
-                segundo_nombre = row[3].strip().replace("\"", "\"\"") if len(row) > 3 else ""
-                tercer_nombre = row[4].strip().replace("\"", "\"\"") if len(row) > 4 else ""
+ALUMNOS_COLUMNS = "\t\"PrimerNombre\", \"SegundoNombre\", \"PrimerApellido\", \"SegundoApellido\", \"SedeId\", \"GradoId\", \"Becado\", \"BecaParcialPorcentaje\", \"Codigo\", \"Estado\", \"FechaActualizacion\", \"FechaCreacion\", \"Seccion\", \"UsuarioActualizacionId\", \"UsuarioCreacionId\", \"Observaciones\", \"Direccion\", \"TercerNombre\")\n"
 
-                # Predefined values
-                sede_id = 1
-                becado = "NULL"
-                beca_parcial_porcentaje = "NULL"
-                codigo = "\"codigo\"" # Static code as requested
-                estado = 1
-                fecha_actualizacion = "NULL"
+def insert_head(table_name="public.\"Alumnos\""):
+    # Statement text up to and including VALUES, shared by every row
+    return f"INSERT INTO {table_name}(\n" + ALUMNOS_COLUMNS + "\tVALUES"
 
-                # Get current date time in GMT-6 (Central Standard Time without daylight saving)
-                tz = pytz.timezone("America/Guatemala") # Example timezone for GMT-6
-                fecha_creacion_dt = datetime.now(tz)
-                fecha_creacion = f"\'{fecha_creacion_dt.isoformat()}\'"
+def alumno_fields(row, grado_id=4, seccion="B"):
+    # Extracting names from processed_names.txt
+    primer_apellido = row[0].strip().replace("\"", "\"\"") if len(row) > 0 else ""
+    segundo_apellido = row[1].strip().replace("\"", "\"\"") if len(row) > 1 else ""
+    primer_nombre = row[2].strip().replace("\"", "\"\"") if len(row) > 2 else ""
+    segundo_nombre = row[3].strip().replace("\"", "\"\"") if len(row) > 3 else ""
+    tercer_nombre = row[4].strip().replace("\"", "\"\"") if len(row) > 4 else ""
 
-                usuario_actualizacion_id = "NULL"
-                usuario_creacion_id = 1
-                observaciones = "NULL"
-                direccion = "NULL"
+    # Predefined values
+    sede_id = 1
+    becado = "NULL"
+    beca_parcial_porcentaje = "NULL"
+    codigo = "\"codigo\"" # Static code as requested
+    estado = 1
+    fecha_actualizacion = "NULL"
 
-                # Handle empty strings for optional fields by inserting NULL or empty string
-                segundo_nombre_sql = f"\'{segundo_nombre}\'" if segundo_nombre else "NULL"
-                segundo_apellido_sql = f"\'{segundo_apellido}\'" if segundo_apellido else "NULL"
-                tercer_nombre_sql = f"\'{tercer_nombre}\'" if tercer_nombre else "NULL"
+    # Get current date time in GMT-6 (Central Standard Time without daylight saving)
+    tz = pytz.timezone("America/Guatemala") # Example timezone for GMT-6
+    fecha_creacion_dt = datetime.now(tz)
+    fecha_creacion = f"\'{fecha_creacion_dt.isoformat()}\'"
 
-                # SQL INSERT statement
-                sql_command = f"INSERT INTO {table_name}(\n"
-                sql_command += "\t\"PrimerNombre\", \"SegundoNombre\", \"PrimerApellido\", \"SegundoApellido\", \"SedeId\", \"GradoId\", \"Becado\", \"BecaParcialPorcentaje\", \"Codigo\", \"Estado\", \"FechaActualizacion\", \"FechaCreacion\", \"Seccion\", \"UsuarioActualizacionId\", \"UsuarioCreacionId\", \"Observaciones\", \"Direccion\", \"TercerNombre\")\n"
-                sql_command += f"\tVALUES (\'{primer_nombre}\'\n\t, {segundo_nombre_sql}\n\t, \'{primer_apellido}\'\n\t, {segundo_apellido_sql}\n\t, {sede_id}\n\t, {grado_id}\n\t, {becado}\n\t, {beca_parcial_porcentaje}\n\t, \'codigo\'\n\t, {estado}\n\t, {fecha_actualizacion}\n\t, {fecha_creacion}\n\t, \'{seccion}\'\n\t, {usuario_actualizacion_id}\n\t, {usuario_creacion_id}\n\t, {observaciones}\n\t, {direccion}\n\t, {tercer_nombre_sql}\n\t);\n\n"
-                
-                outfile.write(sql_command)
+    usuario_actualizacion_id = "NULL"
+    usuario_creacion_id = 1
+    observaciones = "NULL"
+    direccion = "NULL"
+
+    # Handle empty strings for optional fields by inserting NULL or empty string
+    segundo_nombre_sql = f"\'{segundo_nombre}\'" if segundo_nombre else "NULL"
+    segundo_apellido_sql = f"\'{segundo_apellido}\'" if segundo_apellido else "NULL"
+    tercer_nombre_sql = f"\'{tercer_nombre}\'" if tercer_nombre else "NULL"
+
+    # SQL literal for each column, in ALUMNOS_COLUMNS order
+    return [
+        f"\'{primer_nombre}\'", segundo_nombre_sql, f"\'{primer_apellido}\'", segundo_apellido_sql,
+        f"{sede_id}", f"{grado_id}", becado, beca_parcial_porcentaje, "\'codigo\'", f"{estado}",
+        fecha_actualizacion, fecha_creacion, f"\'{seccion}\'", usuario_actualizacion_id,
+        f"{usuario_creacion_id}", observaciones, direccion, tercer_nombre_sql,
+    ]
+
+def build_alumno_values(row, grado_id=4, seccion="B"):
+    # Parenthesised VALUES tuple for this student
+    return "(" + "\n\t, ".join(alumno_fields(row, grado_id, seccion)) + "\n\t)"
+
+def alumno_copy_values(row, grado_id=4, seccion="B"):
+    # Unescaped column values for COPY and --load; FechaCreacion is already
+    # a literal timestamp, so no CURRENT_TIMESTAMP stand-in is needed
+    return [sql_literal_to_copy(field, None) for field in alumno_fields(row, grado_id, seccion)]
+
+def build_alumno_copy_row(row, grado_id=4, seccion="B"):
+    # Tab separated COPY text-format row for this student
+    return format_copy_row(alumno_copy_values(row, grado_id, seccion))
+
+def write_alumnos_sql(outfile, rows, grado_id=4, seccion="B", table_name="public.\"Alumnos\"", batch_size=0, transaction=False, copy=False, profiler=NULL_PROFILER):
+    # Renders name rows ([primer_apellido, segundo_apellido, primer_nombre,
+    # segundo_nombre, tercer_nombre]) into outfile and returns how many were written
+    count = 0
+    def counted():
+        nonlocal count
+        for row in profiler.iterate("read_rows", rows):
+            count += 1
+            yield row
+    head = insert_head(table_name)
+    write = profiler.wrap("write", outfile.write)
+    if copy:
+        # COPY ... FROM STDIN stream for psql, one tab separated line per student
+        table, columns = parse_insert_head(head)
+        render_copy = profiler.wrap("render", build_alumno_copy_row)
+        copy_rows = (render_copy(row, grado_id, seccion) for row in counted())
+        write(format_copy_block(table, columns, copy_rows) + "\n")
+        return count
+    render = profiler.wrap("render", build_alumno_values)
+    values_rows = (render(row, grado_id, seccion) for row in counted())
+    if batch_size > 0:
+        # Multi-row INSERT ... VALUES (...),(...) statements, optionally one transaction per batch
+        for batch in format_insert_batches(head, values_rows, batch_size, transaction):
+            write(batch + "\n\n")
+    else:
+        for values in values_rows:
+            # SQL INSERT statement
+            write(f"{head} {values};\n\n")
+    return count
+
+def alumnos_loader(options, table_name="public.\"Alumnos\""):
+    # PgLoader for the Alumnos columns, reusable for several classrooms (see pg_loader.py)
+    table, columns = parse_insert_head(insert_head(table_name))
+    return PgLoader.from_options(options, table, columns)
+
+def load_alumnos(loader, rows, grado_id=4, seccion="B", profiler=NULL_PROFILER):
+    # Streams name rows into PostgreSQL instead of a file; returns the LoadResult
+    render = profiler.wrap("render", alumno_copy_values)
+    return loader.load(render(row, grado_id, seccion) for row in profiler.iterate("read_rows", rows))
+
+def output_file_for(input_file):
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    # Remove 'processed_names_' prefix if present
+    if base_name.startswith('processed_names_'):
+        base_name = base_name[len('processed_names_'):]
+    return f"insert_students_{base_name}.sql"
+
+def generate_sql_inserts_with_params(input_file, output_file, grado_id=4, seccion="B", table_name="public.\"Alumnos\"", batch_size=0, transaction=False, copy=False, profiler=NULL_PROFILER):
+    print(f"Intentando generar SQL desde {input_file} a {output_file}")
+    try:
+        with open(input_file, "r", encoding="utf-8") as infile, open(output_file, "w", encoding="utf-8") as outfile:
+            write_alumnos_sql(outfile, csv.reader(infile), grado_id, seccion, table_name, batch_size, transaction, copy, profiler)
         print(f"SQL generado exitosamente en {output_file}")
     except Exception as e:
         print(f"Error al generar SQL: {e}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python generate_sql.py <processed_names_file> [grado_id] [seccion]")
+    # Optional flags: --batch-size <n> groups rows into multi-row INSERTs,
+    # --transaction wraps every batch in BEGIN/COMMIT, --copy writes a
+    # COPY ... FROM STDIN stream instead of INSERT statements, --profile
+    # reports time and memory per stage (see profiling.py), --load <dsn>
+    # loads the students straight into PostgreSQL (see pg_loader.py)
+    argv = sys.argv[1:]
+    profile = pop_profile_options(argv)
+    load = pop_load_options(argv)
+    batch_size = 0
+    transaction = False
+    copy = False
+    if "--copy" in argv:
+        argv.remove("--copy")
+        copy = True
+    if "--transaction" in argv:
+        argv.remove("--transaction")
+        transaction = True
+    if "--batch-size" in argv:
+        idx = argv.index("--batch-size")
+        batch_size = int(argv[idx + 1])
+        del argv[idx:idx + 2]
+
+    if len(argv) < 1:
+        print("Usage: python generate_sql.py <processed_names_file> [grado_id] [seccion] [--batch-size <n>] [--transaction] [--copy] [--load <dsn> [--load-writers <n>] [--load-batch-size <n>] [--load-method copy|insert] [--load-retries <n>]] [--profile]")
         print("Example: python generate_sql.py processed_names_KinderA.txt 4 B")
-        print("Default values: grado_id=4, seccion=B")
+        print("Default values: grado_id=4, seccion=B, one INSERT per student")
         sys.exit(1)
     
-    input_names_file = sys.argv[1]
+    input_names_file = argv[0]
     
     if not os.path.exists(input_names_file):
         print(f"Error: File '{input_names_file}' not found")
@@ -113,22 +207,26 @@ if __name__ == "__main__":
         sys.exit(1)
     
     # Optional parameters with defaults
-    grado_id = int(sys.argv[2]) if len(sys.argv) > 2 else 4
-    seccion = sys.argv[3] if len(sys.argv) > 3 else "B"
+    grado_id = int(argv[1]) if len(argv) > 1 else 4
+    seccion = argv[2] if len(argv) > 2 else "B"
     
     print(f"Processing file: {input_names_file}")
     print(f"Using grado_id: {grado_id}, seccion: {seccion}")
     
     try:
         # Generate output filename based on input filename
-        base_name = os.path.splitext(os.path.basename(input_names_file))[0]
-        # Remove 'processed_names_' prefix if present
-        if base_name.startswith('processed_names_'):
-            base_name = base_name[len('processed_names_'):]
-        output_sql_file = f"insert_students_{base_name}.sql"
+        output_sql_file = output_file_for(input_names_file)
         
         # Update the function to accept grado_id and seccion as parameters
-        generate_sql_inserts_with_params(input_names_file, output_sql_file, grado_id, seccion)
+        profiler = start_profiler(__file__, profile)
+        if load is not None:
+            with open(input_names_file, "r", encoding="utf-8") as infile, alumnos_loader(load) as loader:
+                result = load_alumnos(loader, csv.reader(infile), grado_id, seccion, profiler)
+            print(result.summary())
+            profiler.finish()
+            sys.exit(0 if result.ok else 1)
+        generate_sql_inserts_with_params(input_names_file, output_sql_file, grado_id, seccion, batch_size=batch_size, transaction=transaction, copy=copy, profiler=profiler)
+        profiler.finish()
         
     except Exception as e:
         print(f"Error generating SQL: {e}")
@@ -29,7 +29,7 @@ Usage::
     python generate_sql_multi_mes.py --excel <xlsx> --csv <csv> \
         [--sql-template <file.sql>] [--rubro-id <id>] \
         [--month <month>] [--year <year>] \
-        [--cell-range <start:end>] [--fee-cols <start:end>]
+        [--cell-range <start:end>] [--fee-cols <start:end>] [--streaming]
 
 ``--cell-range`` defines the range of name cells (e.g. ``B3:B21``).
 ``--fee-cols`` defines the start and end columns (e.g. ``J-L``).  All
@@ -38,22 +38,92 @@ script reads its header text (in row 2) and maps the Spanish month
 name to a numeric ``MesColegiatura`` (e.g. ``Abril`` → ``4``).  If
 ``--fee-cols`` is omitted, the first fee column is derived from the
 name column using the sample template offset (B→I) and only that
-single column is processed.
+single column is processed.  ``--streaming`` opens the workbook
+read-only, reads the month headers once and streams only the name and
+fee columns (see ``workbook_stream.py``).  ``--profile`` prints the
+time, call count and peak memory of every stage (workbook, roster,
+parsing, rendering, writing) and writes them to a JSON report (see
+``profiling.py``).  Rows and fee cells that produce no payment are
+counted by reason and fee column; ``--skip-stats``, ``--metrics-json``
+and ``--metrics-prom`` report them (see ``skip_metrics.py``).
+``--ledger <file.sqlite>`` records every payment written and makes later
+runs on an updated workbook emit only new or changed payments (see
+``payment_ledger.py``).
+``--load <dsn>`` streams the payments into PostgreSQL with a pool of
+writer connections, one transaction per batch, instead of writing the
+``.sql`` file (see ``pg_loader.py``).  ``--existing-pagos <export.csv>``
+or ``--existing-pagos-dsn <dsn>`` skips the payments whose AlumnoId,
+RubroId, month, year and amount are already in ``public."Pagos"`` (see
+``existing_pagos.py``).  Statements are written to the output file as
+they are generated, through a 1 MiB buffer (``--write-buffer``);
+``--compress gzip`` or ``--compress zstd`` writes ``.sql.gz`` or
+``.sql.zst`` instead.  ``--shards <n>`` or ``--shard-size <size>`` split
+the output into self-contained ``BEGIN``/``COMMIT`` shard files plus a
+``.shards.json`` manifest, for loading over several connections (see
+``sql_shards.py``).  ``--all-sheets`` or ``--sheets <names>`` reads
+several worksheets instead of the active one, in parallel worker
+processes (``--workers``), with per-sheet name ranges, fee columns and
+rubros from ``--sheet-config``; the payments are written in sheet order
+to the same output (see ``sheet_jobs.py``).  The month headers are
+read once per sheet rather than once per student row.
+``--infer-layout`` detects the name column, data rows and fee columns
+with their months from the header row and keeps them as a layout
+profile keyed by the header's fingerprint, so workbooks of a known
+template skip both the inference and the header reads (see
+``workbook_layout.py``).  ``--staging`` reads the cells from a
+memory-mapped Arrow staging file keyed by the workbook's hash, created
+on the first run, so later runs skip openpyxl (see
+``workbook_staging.py``).
 """
 
 import argparse
-import unicodedata
 import re
-from typing import Dict, Optional, List
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple
 
-import pandas as pd
 import openpyxl
 from openpyxl.utils import column_index_from_string, get_column_letter
 
+from accents import fold_accents
+from migration_db import SOURCE_CELL, SOURCE_NAME, add_ingest_arguments
+from name_matching import DEFAULT_MIN_SCORE, MATCH_THRESHOLD_HELP, NameMatcher, lookup_student_id
+from existing_pagos import add_existing_pagos_arguments
+from payment_run import PaymentRun
+from pg_loader import LoadOptions, LoadResult, PgLoader, add_load_arguments
+from parse_cache import DEFAULT_PARSE_CACHE_SIZE, MemoizedParser
+from profiling import NULL_PROFILER, StageProfiler, add_profile_arguments, profile_options, start_profiler
+from roster import DEFAULT_CACHE_DIR, load_name_to_id_map
+from skip_metrics import (
+    SKIP_EMPTY_NAME,
+    SKIP_MISSING_DATE,
+    SKIP_MISSING_HEADER,
+    SKIP_UNKNOWN_MONTH,
+    SKIP_UNKNOWN_NAME,
+    GenerationMetrics,
+    add_metrics_arguments,
+    amount_skip_reason,
+)
+from sql_output import CopyRowPlan, RowCounter, add_output_arguments, compressed_name, format_insert_batches
+from sql_shards import add_shard_arguments, output_exists
+from sheet_jobs import (
+    add_sheet_arguments,
+    build_sheet_jobs,
+    collect_sheet_payments,
+    sheet_label,
+    sheet_mode,
+    sheet_patterns,
+)
+from statement_render import RenderPlan, compile_plan
+from workbook_layout import WorkbookLayout, add_layout_arguments, header_month, layout_from_args
+from workbook_staging import add_staging_arguments, iter_staged_rows, open_staged_workbook, staging_dir_from_args
+from workbook_stream import MAX_SHEET_ROW, iter_loaded_rows, iter_payment_rows, open_streaming_workbook, read_row_values
+
+DEFAULT_CELL_RANGE = 'B3:B21'
+
 
 def remove_accents(text: str) -> str:
-    nfkd_form = unicodedata.normalize('NFKD', text)
-    return ''.join(c for c in nfkd_form if not unicodedata.combining(c))
+    return fold_accents(text)
 
 
 def normalize_name(name: str) -> str:
@@ -64,15 +134,6 @@ def normalize_name(name: str) -> str:
     return s
 
 
-def build_name_to_id_map(csv_path: str) -> Dict[str, int]:
-    df = pd.read_csv(csv_path)
-    name_to_id: Dict[str, int] = {}
-    for _, row in df.iterrows():
-        norm_name = normalize_name(str(row['NombreCompleto']))
-        name_to_id[norm_name] = int(row['Id'])
-    return name_to_id
-
-
 SPANISH_MONTH_NAMES = {
     1: 'ENERO', 2: 'FEBRERO', 3: 'MARZO', 4: 'ABRIL', 5: 'MAYO',
     6: 'JUNIO', 7: 'JULIO', 8: 'AGOSTO', 9: 'SEPTIEMBRE',
@@ -176,6 +237,19 @@ def parse_amount(value) -> Optional[float]:
         return None
 
 
+# Comment texts and textual amounts repeat across rows and fee columns,
+# so the per-cell parsers go through a bounded LRU cache.
+cached_parse_date = MemoizedParser(parse_date_from_comment)
+cached_parse_amount = MemoizedParser(parse_amount)
+
+
+def set_parse_cache_size(maxsize: int) -> None:
+    """Replace the parse caches with new ones holding up to ``maxsize`` texts (0 disables them)."""
+    global cached_parse_date, cached_parse_amount
+    cached_parse_date = MemoizedParser(parse_date_from_comment, maxsize)
+    cached_parse_amount = MemoizedParser(parse_amount, maxsize)
+
+
 def load_template(sql_path: str) -> str:
     with open(sql_path, 'r', encoding='utf-8') as f:
         contents = f.read()
@@ -188,81 +262,123 @@ def load_template(sql_path: str) -> str:
     return ''.join(lines[start_idx:])
 
 
-def generate_statement(
-    template: str,
-    fecha: str,
-    monto: float,
-    alumno_id: int,
-    rubro_id: int,
-    mes_colegiatura: int,
-    anio_colegiatura: int,
-    es_colegiatura: bool,
-    notas: str,
-) -> str:
-    """Customise the template with values for one payment."""
+def substitute_fields(template: str, values: Dict[str, str]) -> str:
+    """Apply the field substitutions to the template with regular expressions.
+
+    Run once per template by :func:`compile_statement_template`; the
+    values are the SQL text for each slot (see :func:`statement_values`).
+    """
     out = template
     # Replace CURRENT_TIMESTAMP (Fecha)
-    out = out.replace('CURRENT_TIMESTAMP', f"'{fecha}'", 1)
+    out = out.replace('CURRENT_TIMESTAMP', values['Fecha'], 1)
     # Replace first floating point number (Monto)
     out = re.sub(
         r'\b\d+\.\d+\b',
-        lambda m: f"{monto:.2f}" if m.group(0) else m.group(0),
+        lambda m: values['Monto'] if m.group(0) else m.group(0),
         out,
         count=1,
     )
     # Replace AlumnoId
     out = re.sub(
         r'\n(\s*)(\d+),\s*-- AlumnoId',
-        lambda m: f"\n{m.group(1)}{alumno_id},                              -- AlumnoId",
+        lambda m: f"\n{m.group(1)}{values['AlumnoId']},                              -- AlumnoId",
         out,
         count=1,
     )
     # Force MedioPago to 1
     out = re.sub(
         r'\n(\s*)(\d+),\s*-- MedioPago',
-        lambda m: f"\n{m.group(1)}1,                              -- MedioPago",
+        lambda m: f"\n{m.group(1)}{values['MedioPago']},                              -- MedioPago",
         out,
         count=1,
     )
-    # Replace Notas with provided comment text (escaping single quotes)
-    notas_escaped = notas.replace("'", "''") if notas is not None else ''
+    # Replace Notas with provided comment text
     out = re.sub(
         r"'[^']*',\s*-- Notas",
-        lambda m: f"'{notas_escaped}',              -- Notas",
+        lambda m: f"'{values['Notas']}',              -- Notas",
         out,
         count=1,
     )
     # Replace RubroId
     out = re.sub(
         r'\n(\s*)(\d+),\s*-- RubroId',
-        lambda m: f"\n{m.group(1)}{rubro_id},                              -- RubroId",
+        lambda m: f"\n{m.group(1)}{values['RubroId']},                              -- RubroId",
         out,
         count=1,
     )
     # Set EsColegiatura
     out = re.sub(
         r'\n(\s*)(true|false),\s*-- EsColegiatura',
-        lambda m: f"\n{m.group(1)}{'true' if es_colegiatura else 'false'},                           -- EsColegiatura",
+        lambda m: f"\n{m.group(1)}{values['EsColegiatura']},                           -- EsColegiatura",
         out,
         count=1,
     )
     # Set MesColegiatura
     out = re.sub(
         r'\n(\s*)([^,\n]+),\s*-- MesColegiatura',
-        lambda m: f"\n{m.group(1)}{mes_colegiatura},                              -- MesColegiatura",
+        lambda m: f"\n{m.group(1)}{values['MesColegiatura']},                              -- MesColegiatura",
         out,
         count=1,
     )
     # Set AnioColegiatura
     out = re.sub(
         r'\n(\s*)([^,\n]+),\s*-- AnioColegiatura',
-        lambda m: f"\n{m.group(1)}{anio_colegiatura},                              -- AnioColegiatura",
+        lambda m: f"\n{m.group(1)}{values['AnioColegiatura']},                              -- AnioColegiatura",
         out,
         count=1,
     )
     return out
 
 
+def statement_values(
+    fecha: str,
+    monto: float,
+    alumno_id: int,
+    rubro_id: int,
+    mes_colegiatura: int,
+    anio_colegiatura: int,
+    es_colegiatura: bool,
+    notas: str,
+) -> Dict[str, str]:
+    """Format the values of one payment as the SQL text for each slot."""
+    # Notas carries the comment text, so single quotes are escaped
+    notas_escaped = notas.replace("'", "''") if notas is not None else ''
+    return {
+        'Fecha': f"'{fecha}'",
+        'Monto': f"{monto:.2f}",
+        'AlumnoId': f"{alumno_id}",
+        'MedioPago': '1',
+        'Notas': notas_escaped,
+        'RubroId': f"{rubro_id}",
+        'EsColegiatura': 'true' if es_colegiatura else 'false',
+        'MesColegiatura': f"{mes_colegiatura}",
+        'AnioColegiatura': f"{anio_colegiatura}",
+    }
+
+
+@lru_cache(maxsize=8)
+def compile_statement_template(template: str) -> RenderPlan:
+    """Parse the template once into literal chunks and typed slots."""
+    return compile_plan(template, substitute_fields)
+
+
+def generate_statement(
+    template: str,
+    fecha: str,
+    monto: float,
+    alumno_id: int,
+    rubro_id: int,
+    mes_colegiatura: int,
+    anio_colegiatura: int,
+    es_colegiatura: bool,
+    notas: str,
+) -> str:
+    """Customise the template with values for one payment."""
+    return compile_statement_template(template).render(
+        statement_values(fecha, monto, alumno_id, rubro_id, mes_colegiatura, anio_colegiatura, es_colegiatura, notas)
+    )
+
+
 def parse_cell_range(cell_range: str):
     if ':' in cell_range:
         first_cell, last_cell = cell_range.split(':', 1)
@@ -304,6 +420,298 @@ def parse_fee_cols(fee_cols: Optional[str], name_col_letter: str) -> List[str]:
     return [get_column_letter(fee_idx)]
 
 
+def resolve_name_range(
+    cell_range: Optional[str],
+    layout: Optional[WorkbookLayout] = None,
+) -> Tuple[str, int, Optional[int]]:
+    """:func:`parse_cell_range` of ``cell_range``, or the name range of ``layout`` when it is ``None``.
+
+    Without either :data:`DEFAULT_CELL_RANGE` is used.
+    """
+    if cell_range is None and layout is not None:
+        return layout.name_col, layout.start_row, layout.end_row
+    return parse_cell_range(cell_range or DEFAULT_CELL_RANGE)
+
+
+def resolve_fee_cols(
+    fee_cols: Optional[str],
+    name_col_letter: str,
+    layout: Optional[WorkbookLayout] = None,
+) -> List[str]:
+    """:func:`parse_fee_cols`, or the fee columns of ``layout`` when ``fee_cols`` is not given."""
+    if not fee_cols and layout is not None:
+        return list(layout.fee_cols)
+    return parse_fee_cols(fee_cols, name_col_letter)
+
+
+def fee_column_months(
+    ws,
+    fee_cols_list: List[str],
+    header_row: int = 2,
+    months: Optional[Dict[str, Optional[int]]] = None,
+) -> Dict[str, Tuple[Optional[int], Optional[str]]]:
+    """``MesColegiatura`` of each fee column, or ``None`` with the skip reason.
+
+    ``months`` (a layout profile's) is used when it covers every column;
+    otherwise the header row is read once for all of them.
+    """
+    if months is not None and all(col in months for col in fee_cols_list):
+        return {
+            col: (months[col], None if months[col] is not None else SKIP_UNKNOWN_MONTH)
+            for col in fee_cols_list
+        }
+    headers = read_row_values(ws, fee_cols_list, header_row)
+    column_months: Dict[str, Tuple[Optional[int], Optional[str]]] = {}
+    for col in fee_cols_list:
+        header_val = headers[col]
+        if not header_val:
+            column_months[col] = (None, SKIP_MISSING_HEADER)
+            continue
+        mes_colegiatura = header_month(header_val)
+        column_months[col] = (mes_colegiatura, None if mes_colegiatura is not None else SKIP_UNKNOWN_MONTH)
+    return column_months
+
+
+def open_payment_rows(
+    excel_path: str,
+    name_col_letter: str,
+    fee_cols_list: List[str],
+    start_row: int,
+    end_row: Optional[int],
+    streaming: bool = False,
+    sheet_name: Optional[str] = None,
+    staging: Optional[str] = None,
+):
+    """Open a worksheet and the ``(row, name, fees)`` iterator over its name range.
+
+    Returns ``(wb, ws, rows)``; the caller closes ``wb``.  The arguments
+    are those of :func:`iter_payment_values`.
+    """
+    if staging is not None:
+        # Cells come from the workbook's Arrow staging file (see workbook_staging.py)
+        wb = open_staged_workbook(excel_path, staging)
+        ws = wb[sheet_name] if sheet_name is not None else wb.active
+        if end_row is None:
+            end_row = ws.max_row
+        return wb, ws, iter_staged_rows(ws, name_col_letter, fee_cols_list, start_row, end_row)
+    if streaming:
+        wb = open_streaming_workbook(excel_path)
+        ws = wb[sheet_name] if sheet_name is not None else wb.active
+        if end_row is None:
+            end_row = ws.max_row or MAX_SHEET_ROW
+        return wb, ws, iter_payment_rows(ws, name_col_letter, fee_cols_list, start_row, end_row)
+    wb = openpyxl.load_workbook(excel_path)
+    ws = wb[sheet_name] if sheet_name is not None else wb.active
+    if end_row is None:
+        end_row = ws.max_row
+    return wb, ws, iter_loaded_rows(ws, name_col_letter, fee_cols_list, start_row, end_row)
+
+
+def iter_payment_values(
+    excel_path: str,
+    name_to_id: Dict[str, int],
+    rubro_id: int,
+    name_col_letter: str,
+    fee_cols_list: List[str],
+    start_row: int,
+    end_row: Optional[int],
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    streaming: bool = False,
+    matcher: Optional[NameMatcher] = None,
+    profiler: StageProfiler = NULL_PROFILER,
+    metrics: Optional[GenerationMetrics] = None,
+    sheet_name: Optional[str] = None,
+    staging: Optional[str] = None,
+    months: Optional[Dict[str, Optional[int]]] = None,
+    header_row: int = 2,
+    source_cells: bool = False,
+) -> Iterator[Dict[str, str]]:
+    """Yield the template slot values (see :func:`statement_values`) of every payment.
+
+    ``profiler`` records the workbook, name lookup and parsing stages for
+    ``--profile`` (see ``profiling.py``); ``metrics`` receives the skip
+    counters and throughput of the workbook (see ``skip_metrics.py``).
+    ``sheet_name`` selects the worksheet; ``None`` reads the active one.
+    The month of every fee column is taken from its header in
+    ``header_row``, read once, unless ``months`` (from a layout profile,
+    see ``workbook_layout.py``) already gives it.  ``end_row`` may be
+    ``None`` to read to the last row of the sheet.  ``staging`` reads
+    the cells from the workbook's Arrow staging file in that directory
+    (see ``workbook_staging.py``).  ``source_cells`` adds the raw name
+    and the fee cell of every payment for ``--ingest-db`` (see
+    ``migration_db.py``).
+    """
+    counters = (metrics if metrics is not None else GenerationMetrics()).workbook(
+        excel_path, label=sheet_label(excel_path, sheet_name),
+    )
+    with profiler.stage('workbook_open'):
+        wb, ws, rows = open_payment_rows(
+            excel_path, name_col_letter, fee_cols_list, start_row, end_row,
+            streaming=streaming, sheet_name=sheet_name, staging=staging,
+        )
+        counters.sheet = ws.title
+        # Month (or skip reason) of every fee column, worked out once
+        column_months = fee_column_months(ws, fee_cols_list, header_row, months)
+    rows = profiler.iterate('workbook_rows', rows)
+    normalize = profiler.wrap('normalize_name', normalize_name)
+    lookup = profiler.wrap('name_lookup', lookup_student_id)
+    parse_amount_cell = profiler.wrap('parse_amount', cached_parse_amount)
+    parse_comment_date = profiler.wrap('parse_date', cached_parse_date)
+
+    try:
+        for row, name_val, fees in rows:
+            counters.rows += 1
+            if not name_val:
+                counters.skip(SKIP_EMPTY_NAME)
+                continue
+            norm_name = normalize(str(name_val))
+            alumno_id = lookup(name_to_id, norm_name, matcher)
+            if alumno_id is None:
+                counters.skip(SKIP_UNKNOWN_NAME)
+                continue
+            for fee_col_letter in fee_cols_list:
+                mes_colegiatura, header_skip = column_months[fee_col_letter]
+                if mes_colegiatura is None:
+                    # no header or no month in it: cannot determine month
+                    counters.skip(header_skip, fee_col_letter)
+                    continue
+                anio_colegiatura = 2025
+                es_colegiatura = True
+                fee_value, comment_text = fees[fee_col_letter]
+                monto = parse_amount_cell(fee_value)
+                if monto is None:
+                    counters.skip(amount_skip_reason(fee_value), fee_col_letter)
+                    continue
+                # Extract the date from the full comment
+                fecha = parse_comment_date(comment_text)
+                # Derive Notas: keep full comment but normalise whitespace (replace newlines with spaces)
+                notas = ' '.join(comment_text.split()) if comment_text else ''
+                if fecha is None:
+                    if month and year:
+                        fecha = f"{year}-{month:02d}-01"
+                    else:
+                        counters.skip(SKIP_MISSING_DATE, fee_col_letter)
+                        continue
+                counters.emit(fee_col_letter)
+                values = statement_values(
+                    fecha,
+                    monto,
+                    alumno_id,
+                    rubro_id,
+                    mes_colegiatura,
+                    anio_colegiatura,
+                    es_colegiatura,
+                    notas,
+                )
+                if source_cells:
+                    values[SOURCE_NAME] = str(name_val)
+                    values[SOURCE_CELL] = f"{fee_col_letter}{row}"
+                yield values
+    finally:
+        counters.finish()
+        wb.close()
+
+
+def render_payment_statements(
+    payments: Iterable[Dict[str, str]],
+    template: str,
+    batch_size: int = 0,
+    transaction: bool = False,
+    copy: bool = False,
+    profiler: StageProfiler = NULL_PROFILER,
+    rows: Optional[RowCounter] = None,
+) -> Iterator[str]:
+    """Render payment values into statements.
+
+    With a positive ``batch_size`` payments are grouped into multi-row
+    ``INSERT ... VALUES (...),(...)`` statements of up to that many rows,
+    each optionally wrapped in ``BEGIN``/``COMMIT``.  With ``copy`` a
+    single ``COPY ... FROM STDIN`` block (text format, columns taken from
+    the template) is yielded instead, one line at a time, to be joined
+    with ``'\\n'`` (see ``sql_output.iter_copy_lines``).  ``rows`` counts the payments as
+    they are rendered, so a caller can tell how many rows each yielded
+    statement holds.
+    """
+    plan = compile_statement_template(template)
+    if rows is not None:
+        payments = rows.wrap(payments)
+    if copy:
+        copy_plan = CopyRowPlan(plan, datetime.now().astimezone())
+        render = profiler.wrap('render', copy_plan.render)
+        # One line at a time, so the writer flushes the block as it grows
+        yield from copy_plan.lines(render(v) for v in payments)
+        return
+    if batch_size > 0:
+        head, row_plan = plan.split_values()
+        render = profiler.wrap('render', row_plan.render)
+        yield from format_insert_batches(head, (render(v) for v in payments), batch_size, transaction)
+        return
+    render = profiler.wrap('render', plan.render)
+    for v in payments:
+        yield render(v).strip()
+
+
+def load_payment_values(
+    options: LoadOptions,
+    payments: Iterable[Dict[str, str]],
+    template: str,
+    profiler: StageProfiler = NULL_PROFILER,
+) -> LoadResult:
+    """Load payment values through a :class:`~pg_loader.PgLoader` built from ``options``."""
+    copy_plan = CopyRowPlan(compile_statement_template(template), datetime.now().astimezone())
+    to_row = profiler.wrap('render', copy_plan.values)
+    with PgLoader.from_options(options, copy_plan.table, copy_plan.columns) as loader:
+        return loader.load(to_row(v) for v in payments)
+
+
+def sheet_jobs_from_args(args) -> List[Dict]:
+    """The jobs of ``--all-sheets``/``--sheets``, with name ranges and fee columns resolved.
+
+    With ``--infer-layout`` every sheet's layout is detected on its own.
+    Raises ``ValueError`` for an unknown sheet, an invalid per-sheet
+    setting (see ``sheet_jobs.py``) or a sheet whose layout cannot be
+    inferred.
+    """
+    defaults = {
+        'cell_range': args.cell_range,
+        'fee_cols': args.fee_cols,
+        'rubro_id': args.rubro_id,
+        'month': args.month,
+        'year': args.year,
+    }
+    jobs = build_sheet_jobs(args.excel, sheet_patterns(args), args.sheet_config, defaults, staging_dir_from_args(args))
+    for job in jobs:
+        layout = layout_from_args(args, job['excel'], job['sheet'])
+        if layout is not None:
+            print(f"{job['label']}: {layout.describe()}")
+        try:
+            name_col_letter, start_row, end_row = resolve_name_range(job['cell_range'], layout)
+        except ValueError:
+            raise ValueError(f"Invalid cell range '{job['cell_range']}' for sheet {job['sheet']!r}") from None
+        try:
+            fee_cols_list = resolve_fee_cols(job['fee_cols'], name_col_letter, layout)
+        except ValueError:
+            raise ValueError(f"Invalid fee column specification '{job['fee_cols']}' for sheet {job['sheet']!r}") from None
+        job['columns'] = (name_col_letter, fee_cols_list, start_row, end_row)
+        job['layout'] = layout
+    return jobs
+
+
+def sheet_payment_values(job: Dict, shared: Dict) -> Dict:
+    """Parse the payments of one sheet job inside a worker (see :func:`sheet_jobs.run_sheet_jobs`)."""
+    name_col_letter, fee_cols_list, start_row, end_row = job['columns']
+    layout = job['layout']
+    return collect_sheet_payments(job, shared, lambda profiler, metrics: iter_payment_values(
+        job['excel'], shared['name_to_id'], job['rubro_id'], name_col_letter, fee_cols_list,
+        start_row, end_row, month=job['month'], year=job['year'], streaming=shared['streaming'],
+        matcher=shared['matcher'], profiler=profiler, metrics=metrics, sheet_name=job['sheet'],
+        staging=shared['staging'], source_cells=shared['source_cells'],
+        months=layout.months if layout is not None else None,
+        header_row=layout.header_row if layout is not None else 2,
+    ))
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description='Generate INSERT statements from Excel and CSV data (multi fee columns with MesColegiatura).')
     parser.add_argument('--excel', required=True, help='Path to the Excel workbook (xlsx)')
@@ -312,106 +720,120 @@ def main() -> None:
     parser.add_argument('--rubro-id', type=int, default=8, help='RubroId for the generated statements')
     parser.add_argument('--month', type=int, help='Fallback month (1-12) for dates missing in comments')
     parser.add_argument('--year', type=int, help='Fallback year for dates missing in comments')
-    parser.add_argument('--cell-range', default='B3:B21', help='Range of name cells (e.g. B3:B21)')
+    parser.add_argument('--cell-range', default=None, help='Range of name cells (default B3:B21, or inferred with --infer-layout)')
     parser.add_argument('--fee-cols', default=None, help='Range of fee columns (e.g. J-L) or single column (J)')
+    parser.add_argument('--streaming', action='store_true', help='Read the workbook read-only in a single pass over the name/fee columns')
+    parser.add_argument('--batch-size', type=int, default=0, help='Rows per multi-row INSERT statement (0 = one INSERT per payment)')
+    parser.add_argument('--transaction', action='store_true', help='With --batch-size, wrap every batch in BEGIN/COMMIT')
+    parser.add_argument('--copy', action='store_true', help='Write a COPY ... FROM STDIN stream for psql instead of INSERT statements')
+    parser.add_argument('--fuzzy-match', action='store_true', help='Resolve names without an exact roster match (reordered, missing surname, typos)')
+    parser.add_argument('--match-threshold', type=float, default=DEFAULT_MIN_SCORE, help=MATCH_THRESHOLD_HELP)
+    parser.add_argument('--parse-cache-size', type=int, default=DEFAULT_PARSE_CACHE_SIZE, help='Distinct comment/amount texts kept by the parse caches (0 disables them)')
+    parser.add_argument('--parse-stats', action='store_true', help='Print hit rate and time saved by the parse caches')
+    parser.add_argument('--roster-cache', default=DEFAULT_CACHE_DIR, help='Directory (relative to the CSV) for the cached name -> Id index')
+    parser.add_argument('--no-roster-cache', action='store_true', help='Always re-read the CSV instead of using the roster cache')
+    parser.add_argument('--ledger', help='SQLite ledger of emitted payments; only new or changed payments are written')
+    parser.add_argument('--ledger-dry-run', action='store_true', help='With --ledger, write the SQL but do not record the payments')
+    add_output_arguments(parser)
+    add_shard_arguments(parser)
+    add_existing_pagos_arguments(parser)
+    add_load_arguments(parser)
+    add_sheet_arguments(parser)
+    add_layout_arguments(parser)
+    add_staging_arguments(parser)
+    add_ingest_arguments(parser)
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
-
-    name_to_id = build_name_to_id_map(args.csv)
-    wb = openpyxl.load_workbook(args.excel)
-    ws = wb.active
-    template = load_template(args.sql_template)
-    try:
-        name_col_letter, start_row, end_row = parse_cell_range(args.cell_range)
-    except Exception:
-        print(f"Invalid cell range '{args.cell_range}'.")
-        return
-    try:
-        fee_cols_list = parse_fee_cols(args.fee_cols, name_col_letter)
-    except Exception:
-        print(f"Invalid fee column specification '{args.fee_cols}'.")
-        return
+    if args.copy and args.batch_size:
+        parser.error('--copy cannot be combined with --batch-size')
+    if args.load and (args.copy or args.batch_size):
+        parser.error('--load cannot be combined with --copy or --batch-size')
+    if (args.shards or args.shard_size) and (args.copy or args.transaction or args.load):
+        parser.error('--shards/--shard-size cannot be combined with --copy, --transaction or --load')
+    if args.existing_pagos and args.existing_pagos_dsn:
+        parser.error('give either --existing-pagos or --existing-pagos-dsn')
+    if args.sheet_config and not sheet_mode(args):
+        parser.error('--sheet-config requires --all-sheets or --sheets')
+    if args.parse_cache_size != DEFAULT_PARSE_CACHE_SIZE:
+        set_parse_cache_size(args.parse_cache_size)
+    profiler = start_profiler(__file__, profile_options(args))
+
+    with profiler.stage('roster_load'):
+        name_to_id = load_name_to_id_map(args.csv, None if args.no_roster_cache else args.roster_cache)
+        matcher = NameMatcher(name_to_id, min_score=args.match_threshold) if args.fuzzy_match else None
+    with profiler.stage('template_load'):
+        template = load_template(args.sql_template)
+    jobs = None
+    if sheet_mode(args):
+        try:
+            jobs = sheet_jobs_from_args(args)
+        except ValueError as e:
+            print(e)
+            return
+    else:
+        try:
+            layout = layout_from_args(args, args.excel)
+        except ValueError as e:
+            print(f"Could not infer the layout of {args.excel}: {e}")
+            return
+        if layout is not None:
+            print(f"Layout of {args.excel}: {layout.describe()}")
+        try:
+            name_col_letter, start_row, end_row = resolve_name_range(args.cell_range, layout)
+        except Exception:
+            print(f"Invalid cell range '{args.cell_range}'.")
+            return
+        try:
+            fee_cols_list = resolve_fee_cols(args.fee_cols, name_col_letter, layout)
+        except Exception:
+            print(f"Invalid fee column specification '{args.fee_cols}'.")
+            return
 
     import os
     excel_basename = os.path.basename(args.excel)
     stem, _ = os.path.splitext(excel_basename)
     # Determine output filename; if a file with the base name exists, append
     # a counter suffix (e.g. "filename-2.sql", "filename-3.sql", etc.)
-    base_output = f"{stem}.sql"
+    base_output = compressed_name(f"{stem}.sql", args.compress)
     output_filename = base_output
-    if os.path.exists(output_filename):
+    if output_exists(output_filename):
         counter = 2
         while True:
-            candidate = f"{stem}-{counter}.sql"
-            if not os.path.exists(candidate):
+            candidate = compressed_name(f"{stem}-{counter}.sql", args.compress)
+            if not output_exists(candidate):
                 output_filename = candidate
                 break
             counter += 1
 
-    statements: List[str] = []
-    # row 2 contains the month headers for fee columns
-    header_row = 2
-    for row in range(start_row, end_row + 1):
-        name_val = ws[f"{name_col_letter}{row}"].value
-        if not name_val:
-            continue
-        norm_name = normalize_name(str(name_val))
-        alumno_id = name_to_id.get(norm_name)
-        if alumno_id is None:
-            continue
-        for fee_col_letter in fee_cols_list:
-            # Determine month number for this fee column by reading its header (row 2)
-            header_val = ws[f"{fee_col_letter}{header_row}"].value
-            if not header_val:
-                # no header: cannot determine month
-                continue
-            header_norm = remove_accents(str(header_val)).upper().strip()
-            # consider only the first word in case of extra text
-            first_word = header_norm.split()[0] if header_norm else ''
-            mes_colegiatura = SPANISH_MONTH_NUMBERS.get(first_word)
-            if mes_colegiatura is None:
-                # Attempt to parse numeric month from header
-                m = re.match(r'.*?(\d{1,2}).*', header_norm)
-                if m:
-                    mes_colegiatura = int(m.group(1))
-                else:
-                    # Unknown month name: skip this fee column
-                    continue
-            anio_colegiatura = 2025
-            es_colegiatura = True
-            fee_value = ws[f"{fee_col_letter}{row}"].value
-            monto = parse_amount(fee_value)
-            if monto is None:
-                continue
-            comment_obj = ws[f"{fee_col_letter}{row}"].comment
-            comment_text = comment_obj.text if comment_obj else ''
-            # Extract the date from the full comment
-            fecha = parse_date_from_comment(comment_text)
-            # Derive Notas: keep full comment but normalise whitespace (replace newlines with spaces)
-            notas = ' '.join(comment_text.split()) if comment_text else ''
-            if fecha is None:
-                if args.month and args.year:
-                    fecha = f"{args.year}-{args.month:02d}-01"
-                else:
-                    continue
-            stmt = generate_statement(
-                template,
-                fecha,
-                monto,
-                alumno_id,
-                args.rubro_id,
-                mes_colegiatura,
-                anio_colegiatura,
-                es_colegiatura,
-                notas,
-            )
-            statements.append(stmt.strip())
-
-    if statements:
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            f.write('\n\n'.join(statements))
-        print(f"Generated {len(statements)} statements and wrote them to {output_filename}")
+    rubro_ids = [job['rubro_id'] for job in jobs] if jobs is not None else [args.rubro_id]
+    run = PaymentRun(args, 'generate_sql_multi_mes', profiler, rubro_ids)
+    if jobs is not None:
+        payments = run.sheet_payments(sheet_payment_values, jobs, {'name_to_id': name_to_id, 'matcher': matcher})
     else:
-        print('No statements were generated.')
+        payments = run.workbook_payments(iter_payment_values(
+            args.excel,
+            name_to_id,
+            args.rubro_id,
+            name_col_letter,
+            fee_cols_list,
+            start_row,
+            end_row,
+            month=args.month,
+            year=args.year,
+            streaming=args.streaming,
+            matcher=matcher,
+            profiler=profiler,
+            metrics=run.metrics,
+            staging=staging_dir_from_args(args),
+            source_cells=run.source_cells,
+            months=layout.months if layout is not None else None,
+            header_row=layout.header_row if layout is not None else 2,
+        ))
+    run.finish(
+        payments, template, output_filename, render_payment_statements, load_payment_values,
+        parse_caches=[cached_parse_date, cached_parse_amount],
+    )
 
 
 if __name__ == '__main__':
@@ -35,24 +35,29 @@ Usage::
 
     python generate_sql.py --excel <path-to-xlsx> --csv <path-to-csv>
 
-The script prints the resulting SQL statements to stdout.
+The script prints the resulting SQL statements to stdout.  ``--profile``
+reports the time, call count and peak memory of every stage on stderr
+and in a JSON file (see ``profiling.py``).
 """
 
 import argparse
-import unicodedata
 import re
-from typing import Dict, Optional
+from typing import Optional
 
-import pandas as pd
 import openpyxl
 
+from accents import fold_accents
+from profiling import add_profile_arguments, profile_options, start_profiler
+from roster import build_name_to_id_map
+
 
 def remove_accents(text: str) -> str:
     """Remove accents and diacritics from a Unicode string.
 
-    Normalizes the string to NFKD form and drops combining characters
-    to produce an ASCII‐only representation.  Useful for matching
-    names irrespective of accents.
+    Equivalent to normalizing the string to NFKD form and dropping
+    combining characters, but uses the precomputed translation tables
+    in ``accents.py``.  Useful for matching names irrespective of
+    accents.
 
     Parameters
     ----------
@@ -64,8 +69,7 @@ def remove_accents(text: str) -> str:
     str
         The input string without any accents.
     """
-    nfkd_form = unicodedata.normalize('NFKD', text)
-    return ''.join(c for c in nfkd_form if not unicodedata.combining(c))
+    return fold_accents(text)
 
 
 def normalize_name(name: str) -> str:
@@ -96,30 +100,6 @@ def normalize_name(name: str) -> str:
     return s
 
 
-def build_name_to_id_map(csv_path: str) -> Dict[str, int]:
-    """Build a mapping from normalized student name to ID from the CSV.
-
-    The CSV is expected to contain columns ``Id`` and ``NombreCompleto``.
-
-    Parameters
-    ----------
-    csv_path: str
-        Path to the CSV file containing student IDs and names.
-
-    Returns
-    -------
-    Dict[str, int]
-        A dictionary mapping normalized names to their corresponding ID.
-    """
-    df = pd.read_csv(csv_path)
-    name_to_id = {}
-    for _, row in df.iterrows():
-        raw_name = str(row['NombreCompleto'])
-        norm_name = normalize_name(raw_name)
-        name_to_id[norm_name] = int(row['Id'])
-    return name_to_id
-
-
 # Mapping of Spanish month names to their numeric equivalent
 SPANISH_MONTH_NAMES = {
     1: 'ENERO',
@@ -382,17 +362,29 @@ def main() -> None:
     parser.add_argument('--csv', required=True, help='Path to the CSV file containing student IDs and names')
     parser.add_argument('--sql-template', default='insert-pago-example.sql', help='Path to the SQL template file')
     parser.add_argument('--rubro-id', type=int, default=8, help='RubroId to use in the generated statements')
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    profiler = start_profiler(__file__, profile_options(args))
 
     # Build name -> ID mapping
-    name_to_id = build_name_to_id_map(args.csv)
+    with profiler.stage('roster_load'):
+        name_to_id = build_name_to_id_map(args.csv)
 
     # Load workbook
-    wb = openpyxl.load_workbook(args.excel)
-    ws = wb.active
+    with profiler.stage('workbook_open'):
+        wb = openpyxl.load_workbook(args.excel)
+        ws = wb.active
 
     # Load template SQL
-    template = load_template(args.sql_template)
+    with profiler.stage('template_load'):
+        template = load_template(args.sql_template)
+
+    # Per-row steps, timed individually under --profile
+    normalize = profiler.wrap('normalize_name', normalize_name)
+    parse_amount_cell = profiler.wrap('parse_amount', parse_amount)
+    parse_comment_date = profiler.wrap('parse_date', parse_date_from_comment)
+    render = profiler.wrap('render', generate_statement)
+    write = profiler.wrap('write', print)
 
     # Iterate over the rows of interest (3 through 21 inclusive)
     for row in range(3, 22):
@@ -402,24 +394,24 @@ def main() -> None:
         if not name_cell:
             continue
         # Normalize name to look up ID
-        norm_name = normalize_name(str(name_cell))
+        norm_name = normalize(str(name_cell))
         alumno_id = name_to_id.get(norm_name)
         if alumno_id is None:
             print(f"-- WARNING: No ID found for '{name_cell.strip()}', skipping.")
             continue
         # Parse amount
-        monto = parse_amount(amount_cell)
+        monto = parse_amount_cell(amount_cell)
         if monto is None:
             print(f"-- WARNING: Could not parse amount '{amount_cell}' for '{name_cell.strip()}', skipping.")
             continue
         # Extract date from comment
         comment = ws[f'I{row}'].comment
-        fecha = parse_date_from_comment(comment.text if comment else '')
+        fecha = parse_comment_date(comment.text if comment else '')
         if fecha is None:
             print(f"-- WARNING: No valid date found in comment for '{name_cell.strip()}', skipping.")
             continue
         # Generate and print statement
-        stmt = generate_statement(
+        stmt = render(
             template,
             fecha,
             monto,
@@ -427,8 +419,9 @@ def main() -> None:
             args.rubro_id,
         )
         # Output statements separated by a blank line for readability
-        print(stmt.strip())
-        print()
+        write(stmt.strip())
+        write()
+    profiler.finish()
 
 
 if __name__ == '__main__':
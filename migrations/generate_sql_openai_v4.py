@@ -37,7 +37,21 @@ Usage::
     python generate_sql.py --excel <path-to-xlsx> --csv <path-to-csv> \
         [--sql-template <template.sql>] [--rubro-id <id>] \
         [--month <month>] [--year <year>] \
-        [--cell-range <start:end>] [--fee-col <column>]
+        [--cell-range <start:end>] [--fee-col <column>] [--streaming] \
+        [--fuzzy-match [--match-threshold <0-1>]] \
+        [--roster-cache <dir> | --no-roster-cache] \
+        [--parse-cache-size <n>] [--parse-stats] \
+        [--skip-stats] [--metrics-json <file.json>] [--metrics-prom <file.prom>] \
+        [--ledger <ledger.sqlite> [--ledger-dry-run]] \
+        [--existing-pagos <export.csv> | --existing-pagos-dsn <dsn>] \
+        [--compress gzip|zstd] [--write-buffer <bytes>] \
+        [--shards <n> | --shard-size <size>] \
+        [--all-sheets | --sheets <names>] [--sheet-config <file.csv>] [--workers <n>] \
+        [--infer-layout [--layout-cache <dir> | --no-layout-cache]] \
+        [--staging [--staging-dir <dir>]] \
+        [--load <dsn> [--load-method copy|insert] [--load-batch-size <n>] \
+         [--load-writers <n>] [--load-retries <n>]] \
+        [--profile [--profile-report <file.json>] [--profile-cprofile <file>]]
 
 The script writes the resulting SQL statements to a ``.sql`` file whose
 name is derived from the Excel filename.  Use ``--cell-range`` to
@@ -46,25 +60,99 @@ letter) and ``--fee-col`` to override the column used for fee
 amounts and comments.  The default behaviour uses the same offset
 between name and amount columns as the sample template (``B`` →
 ``I``).  Fallback month and year values may be provided to
-synthetically generate dates when comments are missing.
+synthetically generate dates when comments are missing.  ``--streaming``
+opens the workbook read-only and makes a single pass over the name and
+fee columns, keeping memory flat for large workbooks (see
+``workbook_stream.py``).  ``--fuzzy-match`` additionally resolves names
+that differ from ``NombreCompleto`` in word order, a missing surname or
+a typo (see ``name_matching.py``).  The normalised roster is cached in
+``.roster-cache`` next to the CSV, keyed by the CSV's content hash, so
+repeated runs against the same export skip re-reading it (see
+``roster.py``).  ``--profile`` prints the time, call count and peak
+memory of every stage and writes them to a JSON report (see
+``profiling.py``).  Rows and fee cells that produce no payment (unknown
+name, blank or unparsable amount, missing date) are counted by reason;
+``--skip-stats``, ``--metrics-json`` and ``--metrics-prom`` report them
+(see ``skip_metrics.py``).  ``--ledger`` keeps a SQLite record of the
+payments already written so a re-run only emits new or changed ones
+(see ``payment_ledger.py``).  ``--load <dsn>`` writes the payments
+straight into PostgreSQL in batched, concurrent transactions instead of
+producing the ``.sql`` file (see ``pg_loader.py``).  Payments already in
+``public."Pagos"`` (``--existing-pagos`` export or
+``--existing-pagos-dsn``) are left out (see ``existing_pagos.py``).
+Statements are streamed to the output file as they are rendered instead
+of being joined in memory; ``--compress gzip|zstd`` writes ``.sql.gz``
+or ``.sql.zst``.  ``--shards``/``--shard-size`` split it into
+self-contained shard files with a checksummed manifest (see
+``sql_shards.py``).  Only the active worksheet is read unless
+``--all-sheets`` or ``--sheets "Primero*,Kinder A"`` is given; the
+selected sheets are then parsed in parallel worker processes, each with
+its own cell range, fee column and rubro from ``--sheet-config``, and
+written to the one output in sheet order (see ``sheet_jobs.py``).
+``--infer-layout`` finds the name column, the data rows and the fee
+column (the first non-month header right of the names, or of a
+``Carnet`` column) from the header row instead of
+``--cell-range``/``--fee-col`` and caches the result as a layout
+profile keyed by the header's fingerprint (see ``workbook_layout.py``).
+When every such header is a month, ``--fee-col`` is required.
+``--staging`` parses the
+workbook once into a memory-mapped Arrow file keyed by its hash and
+reads the cells from there on later runs, without openpyxl (see
+``workbook_staging.py``).
 """
 
 import argparse
-import unicodedata
 import re
-from typing import Dict, Optional
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-import pandas as pd
 import openpyxl
 from openpyxl.utils import column_index_from_string, get_column_letter
 
+from accents import fold_accents
+from migration_db import SOURCE_CELL, SOURCE_NAME, add_ingest_arguments
+from name_matching import DEFAULT_MIN_SCORE, MATCH_THRESHOLD_HELP, NameMatcher, lookup_student_id
+from existing_pagos import ExistingPagos, add_existing_pagos_arguments
+from payment_ledger import PaymentLedger
+from payment_run import PaymentRun
+from pg_loader import LoadOptions, LoadResult, PgLoader, add_load_arguments
+from parse_cache import DEFAULT_PARSE_CACHE_SIZE, MemoizedParser
+from profiling import NULL_PROFILER, StageProfiler, add_profile_arguments, profile_options, start_profiler
+from roster import DEFAULT_CACHE_DIR, load_name_to_id_map
+from skip_metrics import (
+    SKIP_EMPTY_NAME,
+    SKIP_MISSING_DATE,
+    SKIP_UNKNOWN_NAME,
+    GenerationMetrics,
+    add_metrics_arguments,
+    amount_skip_reason,
+)
+from sql_output import CopyRowPlan, RowCounter, add_output_arguments, compressed_name, format_insert_batches
+from sql_shards import add_shard_arguments
+from sheet_jobs import (
+    add_sheet_arguments,
+    build_sheet_jobs,
+    collect_sheet_payments,
+    sheet_label,
+    sheet_mode,
+    sheet_patterns,
+)
+from statement_render import RenderPlan, compile_plan
+from workbook_layout import WorkbookLayout, add_layout_arguments, layout_from_args, single_fee_col
+from workbook_staging import add_staging_arguments, iter_staged_rows, open_staged_workbook, staging_dir_from_args
+from workbook_stream import MAX_SHEET_ROW, iter_loaded_rows, iter_payment_rows, open_streaming_workbook
+
+DEFAULT_CELL_RANGE = 'B3:B21'
+
 
 def remove_accents(text: str) -> str:
     """Remove accents and diacritics from a Unicode string.
 
-    Normalizes the string to NFKD form and drops combining characters
-    to produce an ASCII‐only representation.  Useful for matching
-    names irrespective of accents.
+    Equivalent to normalizing the string to NFKD form and dropping
+    combining characters, but uses the precomputed translation tables
+    in ``accents.py``.  Useful for matching names irrespective of
+    accents.
 
     Parameters
     ----------
@@ -76,8 +164,7 @@ def remove_accents(text: str) -> str:
     str
         The input string without any accents.
     """
-    nfkd_form = unicodedata.normalize('NFKD', text)
-    return ''.join(c for c in nfkd_form if not unicodedata.combining(c))
+    return fold_accents(text)
 
 
 def normalize_name(name: str) -> str:
@@ -108,30 +195,6 @@ def normalize_name(name: str) -> str:
     return s
 
 
-def build_name_to_id_map(csv_path: str) -> Dict[str, int]:
-    """Build a mapping from normalized student name to ID from the CSV.
-
-    The CSV is expected to contain columns ``Id`` and ``NombreCompleto``.
-
-    Parameters
-    ----------
-    csv_path: str
-        Path to the CSV file containing student IDs and names.
-
-    Returns
-    -------
-    Dict[str, int]
-        A dictionary mapping normalized names to their corresponding ID.
-    """
-    df = pd.read_csv(csv_path)
-    name_to_id = {}
-    for _, row in df.iterrows():
-        raw_name = str(row['NombreCompleto'])
-        norm_name = normalize_name(raw_name)
-        name_to_id[norm_name] = int(row['Id'])
-    return name_to_id
-
-
 # Mapping of Spanish month names to their numeric equivalent
 SPANISH_MONTH_NAMES = {
     1: 'ENERO',
@@ -243,6 +306,19 @@ def parse_amount(value) -> Optional[float]:
         return None
 
 
+# Comment texts and textual amounts repeat across rows and fee columns,
+# so the per-cell parsers go through a bounded LRU cache.
+cached_parse_date = MemoizedParser(parse_date_from_comment)
+cached_parse_amount = MemoizedParser(parse_amount)
+
+
+def set_parse_cache_size(maxsize: int) -> None:
+    """Replace the parse caches with new ones holding up to ``maxsize`` texts (0 disables them)."""
+    global cached_parse_date, cached_parse_amount
+    cached_parse_date = MemoizedParser(parse_date_from_comment, maxsize)
+    cached_parse_amount = MemoizedParser(parse_amount, maxsize)
+
+
 def load_template(sql_path: str) -> str:
     """Load the sample SQL insert statement.
 
@@ -281,14 +357,8 @@ def load_template(sql_path: str) -> str:
     return trimmed
 
 
-def generate_statement(
-    template: str,
-    fecha: str,
-    monto: float,
-    alumno_id: int,
-    rubro_id: int,
-) -> str:
-    """Produce a customized INSERT statement for one student.
+def substitute_fields(template: str, values: Dict[str, str]) -> str:
+    """Apply the field substitutions to the template with regular expressions.
 
     Starting from the provided template, this function substitutes
     values for several fields:
@@ -306,88 +376,567 @@ def generate_statement(
 
     Other fields are left untouched.  Regular expressions are used to
     perform targeted replacements while preserving indentation and
-    inline comments.
+    inline comments.  This routine is run once per template by
+    :func:`compile_statement_template`; use :func:`generate_statement`
+    to render individual payments.
 
     Parameters
     ----------
     template: str
         The raw SQL template.
-    fecha: str
-        ISO formatted date (YYYY-MM-DD) to substitute for the ``Fecha`` field.
-    monto: float
-        The amount to substitute for the ``Monto`` field.
-    alumno_id: int
-        Student ID to substitute for the ``AlumnoId`` field.
-    rubro_id: int
-        RubroId value to use in the statement.
+    values: Dict[str, str]
+        SQL text to insert, keyed by slot name (see
+        :func:`statement_values`).
 
     Returns
     -------
     str
-        A fully formatted INSERT statement customised for the given student.
+        The template with every field substituted.
     """
     out = template
     # 1. Replace the first occurrence of CURRENT_TIMESTAMP with the supplied date (Fecha)
-    out = out.replace('CURRENT_TIMESTAMP', f"'{fecha}'", 1)
+    out = out.replace('CURRENT_TIMESTAMP', values['Fecha'], 1)
     # 2. Replace the first floating point number (the amount placeholder) with our amount
     out = re.sub(
         r'\b\d+\.\d+\b',
-        lambda m: f"{monto:.2f}" if m.group(0) else m.group(0),
+        lambda m: values['Monto'] if m.group(0) else m.group(0),
         out,
         count=1,
     )
     # 3. Replace AlumnoId value
     out = re.sub(
         r'\n(\s*)(\d+),\s*-- AlumnoId',
-        lambda m: f"\n{m.group(1)}{alumno_id},                              -- AlumnoId",
+        lambda m: f"\n{m.group(1)}{values['AlumnoId']},                              -- AlumnoId",
         out,
         count=1,
     )
     # 4. Force MedioPago to 1
     out = re.sub(
         r'\n(\s*)(\d+),\s*-- MedioPago',
-        lambda m: f"\n{m.group(1)}1,                              -- MedioPago",
+        lambda m: f"\n{m.group(1)}{values['MedioPago']},                              -- MedioPago",
         out,
         count=1,
     )
     # 5. Set Notas to empty string
     out = re.sub(
         r"'[^']*',\s*-- Notas",
-        "'',              -- Notas",
+        lambda m: f"'{values['Notas']}',              -- Notas",
         out,
         count=1,
     )
     # 6. Replace RubroId with provided rubro_id
     out = re.sub(
         r'\n(\s*)(\d+),\s*-- RubroId',
-        lambda m: f"\n{m.group(1)}{rubro_id},                              -- RubroId",
+        lambda m: f"\n{m.group(1)}{values['RubroId']},                              -- RubroId",
         out,
         count=1,
     )
     # 7. Ensure EsColegiatura is false
     out = re.sub(
         r'\n(\s*)true,\s*-- EsColegiatura',
-        lambda m: f"\n{m.group(1)}false,                           -- EsColegiatura",
+        lambda m: f"\n{m.group(1)}{values['EsColegiatura']},                           -- EsColegiatura",
         out,
         count=1,
     )
     # 8. Set MesColegiatura to NULL
     out = re.sub(
         r'EXTRACT\(MONTH FROM CURRENT_DATE\),\s*-- MesColegiatura',
-        'NULL,                              -- MesColegiatura',
+        lambda m: f"{values['MesColegiatura']},                              -- MesColegiatura",
         out,
         count=1,
     )
     # 9. Set AnioColegiatura to NULL
     out = re.sub(
         r'EXTRACT\(YEAR FROM CURRENT_DATE\),\s*-- AnioColegiatura',
-        'NULL,                              -- AnioColegiatura',
+        lambda m: f"{values['AnioColegiatura']},                              -- AnioColegiatura",
         out,
         count=1,
     )
     return out
 
 
+def statement_values(fecha: str, monto: float, alumno_id: int, rubro_id: int) -> Dict[str, str]:
+    """Format the per-payment values as the SQL text for each template slot."""
+    return {
+        'Fecha': f"'{fecha}'",
+        'Monto': f"{monto:.2f}",
+        'AlumnoId': f"{alumno_id}",
+        'MedioPago': '1',
+        'Notas': '',
+        'RubroId': f"{rubro_id}",
+        'EsColegiatura': 'false',
+        'MesColegiatura': 'NULL',
+        'AnioColegiatura': 'NULL',
+    }
+
+
+@lru_cache(maxsize=8)
+def compile_statement_template(template: str) -> RenderPlan:
+    """Parse the template once into a :class:`RenderPlan`.
+
+    The regex substitutions of :func:`substitute_fields` are run a single
+    time with slot markers; every statement is then rendered by joining
+    the pre-split literal chunks with the formatted values.
+
+    Parameters
+    ----------
+    template: str
+        The raw SQL template.
+
+    Returns
+    -------
+    RenderPlan
+        Render plan producing the same text as :func:`substitute_fields`.
+    """
+    return compile_plan(template, substitute_fields)
+
+
+def generate_statement(
+    template: str,
+    fecha: str,
+    monto: float,
+    alumno_id: int,
+    rubro_id: int,
+) -> str:
+    """Produce a customized INSERT statement for one student.
+
+    The template is compiled once (see :func:`compile_statement_template`)
+    and each call only renders the pre-split plan, replacing the nine
+    regex passes per payment.  See :func:`substitute_fields` for the
+    fields that are substituted.
+
+    Parameters
+    ----------
+    template: str
+        The raw SQL template.
+    fecha: str
+        ISO formatted date (YYYY-MM-DD) to substitute for the ``Fecha`` field.
+    monto: float
+        The amount to substitute for the ``Monto`` field.
+    alumno_id: int
+        Student ID to substitute for the ``AlumnoId`` field.
+    rubro_id: int
+        RubroId value to use in the statement.
+
+    Returns
+    -------
+    str
+        A fully formatted INSERT statement customised for the given student.
+    """
+    return compile_statement_template(template).render(statement_values(fecha, monto, alumno_id, rubro_id))
+
+
+def resolve_cell_range(cell_range: str, fee_col: Optional[str] = None) -> Tuple[str, int, int, str]:
+    """Parse ``--cell-range``/``--fee-col`` into columns and row bounds.
+
+    Parameters
+    ----------
+    cell_range: str
+        Range of name cells in ``"<col><row>:<col><row>"`` format
+        (e.g. ``"B3:B21"``).  A dash is accepted as separator too.
+    fee_col: Optional[str]
+        Column letter holding the fee amounts and comments.  If omitted
+        it is derived from the name column using the template offset
+        (``B`` -> ``I``).
+
+    Returns
+    -------
+    Tuple[str, int, int, str]
+        ``(name_col_letter, start_row, end_row, amount_col_letter)``.
+
+    Raises
+    ------
+    ValueError
+        If the range cannot be parsed.
+    """
+    # Parse the cell range argument (e.g. "B3:B21").  Extract the column letter
+    # and start/end row numbers.  Use the first cell's column for names and
+    # compute the amount column by applying the offset between the template's
+    # name and amount columns (B -> I).  Accept either colon or dash as
+    # separator.
+    if ':' in cell_range:
+        first_cell, last_cell = cell_range.split(':', 1)
+    elif '-' in cell_range:
+        first_cell, last_cell = cell_range.split('-', 1)
+    else:
+        first_cell = last_cell = cell_range
+    # Extract column letters and row numbers from the cell references
+    cell_re = re.compile(r'(?i)([A-Z]+)(\d+)')
+    m_start = cell_re.fullmatch(first_cell.strip())
+    m_end = cell_re.fullmatch(last_cell.strip())
+    if not (m_start and m_end):
+        raise ValueError(f"Invalid cell range '{cell_range}'")
+    name_col_letter = m_start.group(1).upper()
+    start_row = int(m_start.group(2))
+    # We allow the end column to be omitted or different; rows from second cell
+    end_row = int(m_end.group(2))
+    if start_row > end_row:
+        start_row, end_row = end_row, start_row
+    # Determine the fee (amount) column letter.  If the user supplied
+    # --fee-col, use that directly; otherwise derive it from the
+    # name column by applying the same offset used in the original
+    # template (B -> I corresponds to an offset of 7 columns).
+    if fee_col:
+        amount_col_letter = fee_col.strip().upper()
+    else:
+        name_col_index = column_index_from_string(name_col_letter)
+        amount_col_index = name_col_index + (column_index_from_string('I') - column_index_from_string('B'))
+        amount_col_letter = get_column_letter(amount_col_index)
+    return name_col_letter, start_row, end_row, amount_col_letter
+
+
+def resolve_columns(
+    cell_range: Optional[str],
+    fee_col: Optional[str] = None,
+    layout: Optional[WorkbookLayout] = None,
+) -> Tuple[str, int, Optional[int], str]:
+    """:func:`resolve_cell_range`, with whatever was not given taken from ``layout``.
+
+    Without a layout a missing ``cell_range`` means
+    :data:`DEFAULT_CELL_RANGE`.  With one, the name range comes from the
+    layout unless ``cell_range`` is given and the fee column is the
+    layout's first amount column (see
+    :func:`workbook_layout.single_fee_col`) unless ``fee_col`` is given.
+    The end row is ``None`` when the layout does not know the sheet's
+    size.  Raises ``ValueError`` for an invalid range or when the fee
+    column cannot be inferred.
+    """
+    if layout is None:
+        return resolve_cell_range(cell_range or DEFAULT_CELL_RANGE, fee_col)
+    if cell_range is not None:
+        name_col_letter, start_row, end_row, _ = resolve_cell_range(cell_range, fee_col)
+    else:
+        name_col_letter, start_row, end_row = layout.name_col, layout.start_row, layout.end_row
+    amount_col_letter = fee_col.strip().upper() if fee_col else single_fee_col(layout)
+    return name_col_letter, start_row, end_row, amount_col_letter
+
+
+def iter_payment_values(
+    excel_path: str,
+    name_to_id: Dict[str, int],
+    rubro_id: int,
+    name_col_letter: str,
+    amount_col_letter: str,
+    start_row: int,
+    end_row: Optional[int],
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    streaming: bool = False,
+    matcher: Optional[NameMatcher] = None,
+    profiler: StageProfiler = NULL_PROFILER,
+    metrics: Optional[GenerationMetrics] = None,
+    sheet_name: Optional[str] = None,
+    staging: Optional[str] = None,
+    source_cells: bool = False,
+) -> Iterator[Dict[str, str]]:
+    """Yield the template slot values of every payment in one workbook.
+
+    Parameters
+    ----------
+    excel_path: str
+        Path to the Excel workbook (xlsx).
+    name_to_id: Dict[str, int]
+        Mapping loaded by :func:`roster.load_name_to_id_map`.
+    rubro_id: int
+        RubroId to use in the generated statements.
+    name_col_letter, amount_col_letter: str
+        Columns holding the student names and the fee amounts.
+    start_row, end_row: int
+        Row bounds (inclusive) of the name range.  ``end_row`` may be
+        ``None`` to read to the last row of the sheet (as with
+        ``--infer-layout``, see ``workbook_layout.py``).
+    month, year: Optional[int]
+        Fallback month/year used when a comment carries no date.
+    streaming: bool
+        Read the workbook in read-only streaming mode.
+    matcher: Optional[NameMatcher]
+        Fuzzy matcher used for names without an exact roster match
+        (see ``name_matching.py``).  ``None`` skips such rows.
+    profiler: StageProfiler
+        Records the workbook, name lookup and parsing stages for
+        ``--profile`` (see ``profiling.py``).
+    metrics: Optional[GenerationMetrics]
+        Receives the skip counters and throughput of this workbook (see
+        ``skip_metrics.py``).
+    sheet_name: Optional[str]
+        Worksheet to read; ``None`` reads the active sheet.
+    staging: Optional[str]
+        Read the cells from the workbook's Arrow staging file in this
+        directory, staging it first if needed (see ``workbook_staging.py``).
+    source_cells: bool
+        Add the raw name and the amount cell of every payment, for
+        ``--ingest-db`` (see ``migration_db.py``).
+
+    Yields
+    ------
+    Dict[str, str]
+        The output of :func:`statement_values` for each payment, in row
+        order.
+    """
+    counters = (metrics if metrics is not None else GenerationMetrics()).workbook(
+        excel_path, label=sheet_label(excel_path, sheet_name),
+    )
+    # Load workbook.  In streaming mode the workbook is opened read-only
+    # and only the name/fee columns (plus the fee comments) are read in a
+    # single pass; otherwise the whole workbook is loaded as before.
+    with profiler.stage('workbook_open'):
+        if staging is not None:
+            # Cells come from the workbook's Arrow staging file (see workbook_staging.py)
+            wb = open_staged_workbook(excel_path, staging)
+            ws = wb[sheet_name] if sheet_name is not None else wb.active
+            if end_row is None:
+                end_row = ws.max_row
+            rows = iter_staged_rows(ws, name_col_letter, [amount_col_letter], start_row, end_row)
+        elif streaming:
+            wb = open_streaming_workbook(excel_path)
+            ws = wb[sheet_name] if sheet_name is not None else wb.active
+            if end_row is None:
+                end_row = ws.max_row or MAX_SHEET_ROW
+            rows = iter_payment_rows(ws, name_col_letter, [amount_col_letter], start_row, end_row)
+        else:
+            wb = openpyxl.load_workbook(excel_path)
+            ws = wb[sheet_name] if sheet_name is not None else wb.active
+            if end_row is None:
+                end_row = ws.max_row
+            rows = iter_loaded_rows(ws, name_col_letter, [amount_col_letter], start_row, end_row)
+    counters.sheet = ws.title
+    rows = profiler.iterate('workbook_rows', rows)
+    normalize = profiler.wrap('normalize_name', normalize_name)
+    lookup = profiler.wrap('name_lookup', lookup_student_id)
+    parse_amount_cell = profiler.wrap('parse_amount', cached_parse_amount)
+    parse_comment_date = profiler.wrap('parse_date', cached_parse_date)
+
+    try:
+        # Iterate over the rows of interest based on the provided range
+        for row, name_cell, fees in rows:
+            counters.rows += 1
+            amount_cell, comment_text = fees[amount_col_letter]
+            # Skip rows without a student name
+            if not name_cell:
+                counters.skip(SKIP_EMPTY_NAME)
+                continue
+            # Normalize name to look up ID
+            norm_name = normalize(str(name_cell))
+            alumno_id = lookup(name_to_id, norm_name, matcher)
+            if alumno_id is None:
+                # Skip silently if no ID found
+                counters.skip(SKIP_UNKNOWN_NAME)
+                continue
+            # Parse amount
+            monto = parse_amount_cell(amount_cell)
+            if monto is None:
+                # Skip silently if amount cannot be parsed
+                counters.skip(amount_skip_reason(amount_cell), amount_col_letter)
+                continue
+            # Extract date from comment
+            fecha = parse_comment_date(comment_text)
+            # If no date found, use fallback month/year if provided
+            if fecha is None:
+                if month and year:
+                    # Use the first day of the specified month/year
+                    fecha = f"{year}-{month:02d}-01"
+                else:
+                    # If no fallback specified, skip this row
+                    counters.skip(SKIP_MISSING_DATE, amount_col_letter)
+                    continue
+            counters.emit(amount_col_letter)
+            values = statement_values(fecha, monto, alumno_id, rubro_id)
+            if source_cells:
+                values[SOURCE_NAME] = str(name_cell)
+                values[SOURCE_CELL] = f"{amount_col_letter}{row}"
+            yield values
+    finally:
+        counters.finish()
+        wb.close()
+
+
+def iter_payment_statements(
+    excel_path: str,
+    name_to_id: Dict[str, int],
+    template: str,
+    rubro_id: int,
+    name_col_letter: str,
+    amount_col_letter: str,
+    start_row: int,
+    end_row: int,
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    streaming: bool = False,
+    batch_size: int = 0,
+    transaction: bool = False,
+    copy: bool = False,
+    matcher: Optional[NameMatcher] = None,
+    profiler: StageProfiler = NULL_PROFILER,
+    metrics: Optional[GenerationMetrics] = None,
+    ledger: Optional[PaymentLedger] = None,
+    existing: Optional[ExistingPagos] = None,
+    rows: Optional[RowCounter] = None,
+    sheet_name: Optional[str] = None,
+    staging: Optional[str] = None,
+) -> Iterator[str]:
+    """Generate the INSERT statements for one workbook, one at a time.
+
+    Parameters
+    ----------
+    excel_path: str
+        Path to the Excel workbook (xlsx).
+    name_to_id: Dict[str, int]
+        Mapping loaded by :func:`roster.load_name_to_id_map`.
+    template: str
+        SQL template returned by :func:`load_template`.
+    rubro_id: int
+        RubroId to use in the generated statements.
+    name_col_letter, amount_col_letter: str
+        Columns holding the student names and the fee amounts.
+    start_row, end_row: int
+        Row bounds (inclusive) of the name range.
+    month, year: Optional[int]
+        Fallback month/year used when a comment carries no date.
+    streaming: bool
+        Read the workbook in read-only streaming mode.
+    batch_size: int
+        When positive, group up to this many payments into each
+        multi-row ``INSERT ... VALUES (...),(...)`` statement.  ``0``
+        keeps one statement per payment.
+    transaction: bool
+        Wrap every batch in ``BEGIN``/``COMMIT`` (only with ``batch_size``).
+    copy: bool
+        Return a single ``COPY public."Pagos" (...) FROM STDIN`` block in
+        PostgreSQL text format instead of ``INSERT`` statements, one line
+        at a time (join them with ``'\\n'``).  The column list is taken
+        from the template.
+    matcher: Optional[NameMatcher]
+        Fuzzy matcher for names without an exact roster match.
+    profiler: StageProfiler
+        Records the per-stage timings for ``--profile``.
+    metrics: Optional[GenerationMetrics]
+        Receives the skip counters and throughput of this workbook.
+    ledger: Optional[PaymentLedger]
+        Drops the payments already recorded in the ledger (see
+        ``payment_ledger.py``).
+    existing: Optional[ExistingPagos]
+        Drops the payments already present in ``Pagos`` (see
+        ``existing_pagos.py``).
+    rows: Optional[RowCounter]
+        Counts the payments as they are rendered, so a caller can tell
+        how many rows each yielded statement holds.
+    sheet_name: Optional[str]
+        Worksheet to read; ``None`` reads the active sheet.
+    staging: Optional[str]
+        Read the cells from the workbook's Arrow staging file in this
+        directory, staging it first if needed (see ``workbook_staging.py``).
+
+    Yields
+    ------
+    str
+        The generated statements, in row order.
+    """
+    payments = iter_payment_values(
+        excel_path, name_to_id, rubro_id, name_col_letter, amount_col_letter,
+        start_row, end_row, month=month, year=year, streaming=streaming,
+        matcher=matcher, profiler=profiler, metrics=metrics, sheet_name=sheet_name,
+        staging=staging,
+    )
+    if existing is not None:
+        payments = existing.filter(payments)
+    if ledger is not None:
+        # Only payments not emitted by an earlier run reach the renderer
+        payments = ledger.filter(payments, source=excel_path)
+    if metrics is not None:
+        payments = metrics.count_written(payments)
+    yield from render_payment_statements(payments, template, batch_size, transaction, copy, profiler, rows)
+
+
+def render_payment_statements(
+    payments: Iterable[Dict[str, str]],
+    template: str,
+    batch_size: int = 0,
+    transaction: bool = False,
+    copy: bool = False,
+    profiler: StageProfiler = NULL_PROFILER,
+    rows: Optional[RowCounter] = None,
+) -> Iterator[str]:
+    """Render payment values into statements; the arguments are those of :func:`iter_payment_statements`."""
+    plan = compile_statement_template(template)
+    if rows is not None:
+        payments = rows.wrap(payments)
+    if copy:
+        copy_plan = CopyRowPlan(plan, datetime.now().astimezone())
+        render = profiler.wrap('render', copy_plan.render)
+        # One line at a time, so the writer flushes the block as it grows
+        yield from copy_plan.lines(render(v) for v in payments)
+        return
+    if batch_size > 0:
+        head, row_plan = plan.split_values()
+        render = profiler.wrap('render', row_plan.render)
+        yield from format_insert_batches(head, (render(v) for v in payments), batch_size, transaction)
+        return
+    render = profiler.wrap('render', plan.render)
+    for v in payments:
+        yield render(v).strip()
+
+
+def generate_payment_statements(*args, **kwargs) -> List[str]:
+    """:func:`iter_payment_statements` as a list, for callers that need all of them at once."""
+    return list(iter_payment_statements(*args, **kwargs))
+
+
+def load_payment_values(
+    options: LoadOptions,
+    payments: Iterable[Dict[str, str]],
+    template: str,
+    profiler: StageProfiler = NULL_PROFILER,
+) -> LoadResult:
+    """Load payment values through a :class:`~pg_loader.PgLoader` built from ``options``."""
+    copy_plan = CopyRowPlan(compile_statement_template(template), datetime.now().astimezone())
+    to_row = profiler.wrap('render', copy_plan.values)
+    with PgLoader.from_options(options, copy_plan.table, copy_plan.columns) as loader:
+        return loader.load(to_row(v) for v in payments)
+
+
+def sheet_jobs_from_args(args) -> List[Dict]:
+    """The jobs of ``--all-sheets``/``--sheets``, with their cell ranges resolved.
+
+    With ``--infer-layout`` every sheet's layout is detected on its own.
+    Raises ``ValueError`` for an unknown sheet, an invalid per-sheet
+    setting (see ``sheet_jobs.py``) or a sheet whose layout cannot be
+    inferred.
+    """
+    defaults = {
+        'cell_range': args.cell_range,
+        'fee_col': args.fee_col,
+        'rubro_id': args.rubro_id,
+        'month': args.month,
+        'year': args.year,
+    }
+    jobs = build_sheet_jobs(args.excel, sheet_patterns(args), args.sheet_config, defaults, staging_dir_from_args(args))
+    for job in jobs:
+        layout = layout_from_args(args, job['excel'], job['sheet'])
+        if layout is not None:
+            print(f"{job['label']}: {layout.describe()}")
+            if not job['fee_col']:
+                try:
+                    job['fee_col'] = single_fee_col(layout)
+                except ValueError as e:
+                    raise ValueError(f"Could not infer the fee column of {job['label']}: {e}") from None
+        try:
+            job['columns'] = resolve_columns(job['cell_range'], job['fee_col'], layout)
+        except ValueError:
+            raise ValueError(f"Invalid cell range '{job['cell_range']}' for sheet {job['sheet']!r}") from None
+    return jobs
+
+
+def sheet_payment_values(job: Dict, shared: Dict) -> Dict:
+    """Parse the payments of one sheet job inside a worker (see :func:`sheet_jobs.run_sheet_jobs`)."""
+    name_col_letter, start_row, end_row, amount_col_letter = job['columns']
+    return collect_sheet_payments(job, shared, lambda profiler, metrics: iter_payment_values(
+        job['excel'], shared['name_to_id'], job['rubro_id'], name_col_letter, amount_col_letter,
+        start_row, end_row, month=job['month'], year=job['year'], streaming=shared['streaming'],
+        matcher=shared['matcher'], profiler=profiler, metrics=metrics, sheet_name=job['sheet'],
+        staging=shared['staging'], source_cells=shared['source_cells'],
+    ))
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description='Generate INSERT statements from Excel and CSV data.')
     parser.add_argument('--excel', required=True, help='Path to the Excel workbook (xlsx)')
@@ -398,11 +947,12 @@ def main() -> None:
     parser.add_argument('--year', type=int, help='Fallback year to use when a payment date is missing')
     parser.add_argument(
         '--cell-range',
-        default='B3:B21',
+        default=None,
         help=(
             'Cell range for the student names in "<col><row>:<col><row>" format '
-            '(e.g. "B3:B21").  The amount/comment column is derived from '
-            'the same relative offset used in the example template (B -> I).'
+            '(default "B3:B21", or inferred with --infer-layout).  The '
+            'amount/comment column is derived from the same relative offset '
+            'used in the example template (B -> I).'
         ),
     )
     parser.add_argument(
@@ -414,117 +964,181 @@ def main() -> None:
             'offset in the template (e.g. B->I).'
         ),
     )
+    parser.add_argument(
+        '--streaming',
+        action='store_true',
+        help=(
+            'Open the workbook read-only and stream only the name and fee '
+            'columns (and the fee comments) instead of loading every cell.'
+        ),
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=0,
+        help=(
+            'Group up to this many payments into each multi-row '
+            'INSERT ... VALUES (...),(...) statement.  0 (default) writes '
+            'one INSERT per payment.'
+        ),
+    )
+    parser.add_argument(
+        '--transaction',
+        action='store_true',
+        help='With --batch-size, wrap every batch in its own BEGIN/COMMIT block.',
+    )
+    parser.add_argument(
+        '--copy',
+        action='store_true',
+        help=(
+            'Write a COPY ... FROM STDIN stream (PostgreSQL text format) for '
+            'psql instead of INSERT statements.  The columns come from the '
+            'SQL template; CURRENT_TIMESTAMP is replaced by the generation time.'
+        ),
+    )
+    parser.add_argument(
+        '--fuzzy-match',
+        action='store_true',
+        help=(
+            'Resolve names without an exact match in the CSV (reordered '
+            'names, a missing second surname, typos) through the indexed '
+            'matcher in name_matching.py.  Every such match is printed with '
+            'its score and reason.'
+        ),
+    )
+    parser.add_argument(
+        '--match-threshold',
+        type=float,
+        default=DEFAULT_MIN_SCORE,
+        help=MATCH_THRESHOLD_HELP,
+    )
+    parser.add_argument(
+        '--parse-cache-size',
+        type=int,
+        default=DEFAULT_PARSE_CACHE_SIZE,
+        help=(
+            'Number of distinct comment and amount texts whose parsed value '
+            'is kept in an LRU cache (0 disables the cache).'
+        ),
+    )
+    parser.add_argument(
+        '--parse-stats',
+        action='store_true',
+        help='Print the hit rate and estimated time saved by the parse caches.',
+    )
+    parser.add_argument(
+        '--roster-cache',
+        default=DEFAULT_CACHE_DIR,
+        help=(
+            'Directory (relative to the CSV) for the cached name -> Id index. '
+            'Entries are keyed by the CSV content hash, so a new export is '
+            'picked up automatically.'
+        ),
+    )
+    parser.add_argument(
+        '--no-roster-cache',
+        action='store_true',
+        help='Always re-read and re-normalise the CSV instead of using the roster cache.',
+    )
+    parser.add_argument('--ledger', help='SQLite ledger of emitted payments; only new or changed payments are written')
+    parser.add_argument('--ledger-dry-run', action='store_true', help='With --ledger, write the SQL but do not record the payments')
+    add_output_arguments(parser)
+    add_shard_arguments(parser)
+    add_existing_pagos_arguments(parser)
+    add_load_arguments(parser)
+    add_sheet_arguments(parser)
+    add_layout_arguments(parser)
+    add_staging_arguments(parser)
+    add_ingest_arguments(parser)
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    if args.copy and args.batch_size:
+        parser.error('--copy cannot be combined with --batch-size')
+    if args.load and (args.copy or args.batch_size):
+        parser.error('--load cannot be combined with --copy or --batch-size')
+    if (args.shards or args.shard_size) and (args.copy or args.transaction or args.load):
+        parser.error('--shards/--shard-size cannot be combined with --copy, --transaction or --load')
+    if args.existing_pagos and args.existing_pagos_dsn:
+        parser.error('give either --existing-pagos or --existing-pagos-dsn')
+    if args.sheet_config and not sheet_mode(args):
+        parser.error('--sheet-config requires --all-sheets or --sheets')
+    if args.parse_cache_size != DEFAULT_PARSE_CACHE_SIZE:
+        set_parse_cache_size(args.parse_cache_size)
+    profiler = start_profiler(__file__, profile_options(args))
 
     # Build name -> ID mapping
-    name_to_id = build_name_to_id_map(args.csv)
-
-    # Load workbook
-    wb = openpyxl.load_workbook(args.excel)
-    ws = wb.active
+    with profiler.stage('roster_load'):
+        name_to_id = load_name_to_id_map(args.csv, None if args.no_roster_cache else args.roster_cache)
+        matcher = NameMatcher(name_to_id, min_score=args.match_threshold) if args.fuzzy_match else None
 
     # Load template SQL
-    template = load_template(args.sql_template)
+    with profiler.stage('template_load'):
+        template = load_template(args.sql_template)
 
-    # Parse the cell range argument (e.g. "B3:B21").  Extract the column letter
-    # and start/end row numbers.  Use the first cell's column for names and
-    # compute the amount column by applying the offset between the template's
-    # name and amount columns (B -> I).  Accept either colon or dash as
-    # separator.
-    cell_range = args.cell_range
-    try:
-        if ':' in cell_range:
-            first_cell, last_cell = cell_range.split(':', 1)
-        elif '-' in cell_range:
-            first_cell, last_cell = cell_range.split('-', 1)
-        else:
-            first_cell = last_cell = cell_range
-        # Extract column letters and row numbers from the cell references
-        import re
-        cell_re = re.compile(r'(?i)([A-Z]+)(\d+)')
-        m_start = cell_re.fullmatch(first_cell.strip())
-        m_end = cell_re.fullmatch(last_cell.strip())
-        if not (m_start and m_end):
-            raise ValueError
-        name_col_letter = m_start.group(1).upper()
-        start_row = int(m_start.group(2))
-        # We allow the end column to be omitted or different; rows from second cell
-        end_row = int(m_end.group(2))
-        if start_row > end_row:
-            start_row, end_row = end_row, start_row
-        # Determine the fee (amount) column letter.  If the user supplied
-        # --fee-col, use that directly; otherwise derive it from the
-        # name column by applying the same offset used in the original
-        # template (B -> I corresponds to an offset of 7 columns).
-        if args.fee_col:
-            amount_col_letter = args.fee_col.strip().upper()
-        else:
-            name_col_index = column_index_from_string(name_col_letter)
-            amount_col_index = name_col_index + (column_index_from_string('I') - column_index_from_string('B'))
-            amount_col_letter = get_column_letter(amount_col_index)
-    except Exception:
-        print(
-            f"Invalid cell range '{cell_range}'. Expected format '<col><row>:<col><row>' e.g. 'B3:B21'."
-        )
-        return
+    jobs = None
+    if sheet_mode(args):
+        try:
+            jobs = sheet_jobs_from_args(args)
+        except ValueError as e:
+            print(e)
+            return
+    else:
+        try:
+            layout = layout_from_args(args, args.excel)
+        except ValueError as e:
+            print(f"Could not infer the layout of {args.excel}: {e}")
+            return
+        fee_col = args.fee_col
+        if layout is not None:
+            print(f"Layout of {args.excel}: {layout.describe()}")
+            if not fee_col:
+                try:
+                    fee_col = single_fee_col(layout)
+                except ValueError as e:
+                    print(f"Could not infer the fee column of {args.excel}: {e}")
+                    return
+        try:
+            name_col_letter, start_row, end_row, amount_col_letter = resolve_columns(args.cell_range, fee_col, layout)
+        except Exception:
+            print(
+                f"Invalid cell range '{args.cell_range}'. Expected format '<col><row>:<col><row>' e.g. 'B3:B21'."
+            )
+            return
 
     # Determine output filename based on the Excel filename
     # Use the stem (remove extension) and append .sql
     import os
     excel_basename = os.path.basename(args.excel)
     stem, _ = os.path.splitext(excel_basename)
-    output_filename = f"{stem}.sql"
-
-    statements = []  # collect all generated statements
-    # Iterate over the rows of interest based on the provided range
-    for row in range(start_row, end_row + 1):
-        # Build cell references dynamically based on the parsed range
-        name_cell_ref = f"{name_col_letter}{row}"
-        amount_cell_ref = f"{amount_col_letter}{row}"
-        name_cell = ws[name_cell_ref].value
-        amount_cell = ws[amount_cell_ref].value
-        # Skip rows without a student name
-        if not name_cell:
-            continue
-        # Normalize name to look up ID
-        norm_name = normalize_name(str(name_cell))
-        alumno_id = name_to_id.get(norm_name)
-        if alumno_id is None:
-            # Skip silently if no ID found
-            continue
-        # Parse amount
-        monto = parse_amount(amount_cell)
-        if monto is None:
-            # Skip silently if amount cannot be parsed
-            continue
-        # Extract date from comment
-        comment = ws[amount_cell_ref].comment
-        fecha = parse_date_from_comment(comment.text if comment else '')
-        # If no date found, use fallback month/year if provided
-        if fecha is None:
-            if args.month and args.year:
-                # Use the first day of the specified month/year
-                fecha = f"{args.year}-{args.month:02d}-01"
-            else:
-                # If no fallback specified, skip this row
-                continue
-        # Generate statement
-        stmt = generate_statement(
-            template,
-            fecha,
-            monto,
-            alumno_id,
-            args.rubro_id,
-        )
-        statements.append(stmt.strip())
-
-    # Write all statements to the output file
-    if statements:
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            f.write('\n\n'.join(statements))
-        print(f"Generated {len(statements)} statements and wrote them to {output_filename}")
+    output_filename = compressed_name(f"{stem}.sql", args.compress)
+
+    rubro_ids = [job['rubro_id'] for job in jobs] if jobs is not None else [args.rubro_id]
+    run = PaymentRun(args, 'generate_sql_openai_v4', profiler, rubro_ids)
+    if jobs is not None:
+        payments = run.sheet_payments(sheet_payment_values, jobs, {'name_to_id': name_to_id, 'matcher': matcher})
     else:
-        print("No statements were generated.")
+        payments = run.workbook_payments(iter_payment_values(
+            args.excel,
+            name_to_id,
+            args.rubro_id,
+            name_col_letter,
+            amount_col_letter,
+            start_row,
+            end_row,
+            month=args.month,
+            year=args.year,
+            streaming=args.streaming,
+            matcher=matcher,
+            profiler=profiler,
+            metrics=run.metrics,
+            staging=staging_dir_from_args(args),
+            source_cells=run.source_cells,
+        ))
+    run.finish(
+        payments, template, output_filename, render_payment_statements, load_payment_values,
+        parse_caches=[cached_parse_date, cached_parse_amount],
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Local SQLite database of everything parsed out of the workbooks.
+
+Every question about the migrated data (which sheet a payment came
+from, how many students a section has, what a name looked like before
+normalisation) used to mean re-running a script over the ``.xlsx``
+files.  The migration database keeps the intermediate results in one
+indexed SQLite file instead::
+
+    extracted_names   one row per line of extracted_names_*.txt
+    processed_names   one row per line of processed_names_*.txt
+    payments          one row per payment parsed by the Pagos generators:
+                      name, AlumnoId, RubroId, Fecha, Monto, month, year,
+                      Notas and the source cell (e.g. ``J14``)
+    sources           one row per ingested file or worksheet, with its
+                      row count and ingest time
+
+The names files are ingested with::
+
+    python migration_db.py --db migracion.sqlite names extracted_names_*.txt
+    python migration_db.py --db migracion.sqlite processed processed_names_*.txt
+    python migration_db.py --db migracion.sqlite sources
+
+and the generators record the payments they parse with ``--ingest-db
+migracion.sqlite``.  Payments are recorded as they are read from the
+workbook, before ``--existing-pagos`` and ``--ledger`` drop any, so the
+database mirrors the workbook rather than one run's output.  Ingesting
+the same file again, or the same worksheet for the same rubro, replaces
+its earlier rows.
+
+The database runs in WAL mode with ``synchronous=NORMAL``, and rows are
+inserted with ``executemany`` in chunks of :data:`INGEST_CHUNK_ROWS`
+inside one transaction per source, so an interrupted ingest leaves the
+previous rows of that source in place.  The rows per second of every
+source are printed and kept in ``sources``.  The file can be queried
+with ``sqlite3``, e.g.::
+
+    SELECT s.sheet, p.cell, p.name, p.monto FROM payments p
+    JOIN sources s ON s.id = p.source_id
+    WHERE p.alumno_id = 412 AND p.anio_colegiatura = 2025;
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from accents import fold_accents
+from sheet_jobs import sheet_label
+
+MIGRATION_DB_VERSION = 1
+INGEST_CHUNK_ROWS = 5000
+
+# Extra keys the generators add to the payment values with --ingest-db
+SOURCE_NAME = 'Nombre'
+SOURCE_CELL = 'Celda'
+
+KIND_EXTRACTED = 'extracted_names'
+KIND_PROCESSED = 'processed_names'
+KIND_PAYMENTS = 'payments'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sheet TEXT NOT NULL DEFAULT '',
+    -- Payments of one sheet are kept per rubro (a sheet is run once per fee column set)
+    rubro_id INTEGER NOT NULL DEFAULT 0,
+    script TEXT,
+    ingested_at TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    UNIQUE (kind, path, sheet, rubro_id)
+);
+CREATE TABLE IF NOT EXISTS extracted_names (
+    source_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    PRIMARY KEY (source_id, line)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS processed_names (
+    source_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    primer_apellido TEXT NOT NULL,
+    segundo_apellido TEXT NOT NULL,
+    primer_nombre TEXT NOT NULL,
+    segundo_nombre TEXT NOT NULL,
+    tercer_nombre TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    PRIMARY KEY (source_id, line)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL,
+    cell TEXT,
+    name TEXT,
+    name_key TEXT,
+    alumno_id INTEGER NOT NULL,
+    rubro_id INTEGER NOT NULL,
+    fecha TEXT NOT NULL,
+    monto REAL NOT NULL,
+    mes_colegiatura INTEGER,
+    anio_colegiatura INTEGER,
+    es_colegiatura INTEGER NOT NULL,
+    notas TEXT
+);
+CREATE INDEX IF NOT EXISTS extracted_names_key ON extracted_names (name_key);
+CREATE INDEX IF NOT EXISTS processed_names_key ON processed_names (name_key);
+CREATE INDEX IF NOT EXISTS payments_source ON payments (source_id);
+CREATE INDEX IF NOT EXISTS payments_alumno ON payments (alumno_id, anio_colegiatura, mes_colegiatura);
+CREATE INDEX IF NOT EXISTS payments_rubro ON payments (rubro_id, anio_colegiatura, mes_colegiatura);
+CREATE INDEX IF NOT EXISTS payments_name ON payments (name_key);
+"""
+
+_INSERT_EXTRACTED = 'INSERT INTO extracted_names (source_id, line, name, name_key) VALUES (?, ?, ?, ?)'
+_INSERT_PROCESSED = (
+    'INSERT INTO processed_names '
+    '(source_id, line, primer_apellido, segundo_apellido, primer_nombre, segundo_nombre, tercer_nombre, name_key) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+)
+_INSERT_PAYMENT = (
+    'INSERT INTO payments '
+    '(source_id, cell, name, name_key, alumno_id, rubro_id, fecha, monto, '
+    'mes_colegiatura, anio_colegiatura, es_colegiatura, notas) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+_KIND_TABLES = {KIND_EXTRACTED: 'extracted_names', KIND_PROCESSED: 'processed_names', KIND_PAYMENTS: 'payments'}
+_PROCESSED_FIELDS = 5
+_WHITESPACE_RE = re.compile(r'\s+')
+_PUNCTUATION_RE = re.compile(r'[.,]')
+
+
+def name_key(name: str) -> str:
+    """The generators' ``normalize_name``: upper case, no accents, commas or periods, single spaces."""
+    s = fold_accents(name.strip().upper())
+    return _WHITESPACE_RE.sub(' ', _PUNCTUATION_RE.sub('', s))
+
+
+def _int_or_none(text: str) -> Optional[int]:
+    return None if text in ('', 'NULL') else int(text)
+
+
+def payment_row(source_id: int, values: Dict[str, str]) -> Tuple[Any, ...]:
+    """``payments`` row of one payment from its template slot values (see ``statement_values``)."""
+    name = values.get(SOURCE_NAME)
+    return (
+        source_id,
+        values.get(SOURCE_CELL),
+        name,
+        name_key(name) if name is not None else None,
+        int(values['AlumnoId']),
+        int(values['RubroId']),
+        values['Fecha'].strip("'"),
+        float(values['Monto']),
+        _int_or_none(values['MesColegiatura']),
+        _int_or_none(values['AnioColegiatura']),
+        1 if values['EsColegiatura'] == 'true' else 0,
+        # Notas carries SQL-escaped quotes
+        values['Notas'].replace("''", "'"),
+    )
+
+
+def format_ingest(label: str, rows: int, seconds: float) -> str:
+    """``Ingested 5400 rows from Pagos.xlsx [Kinder A] in 0.03s (180000 rows/s)``."""
+    rate = f"{rows / seconds:.0f}" if seconds else '-'
+    return f"Ingested {rows} rows from {label} in {seconds:.2f}s ({rate} rows/s)"
+
+
+class MigrationDB:
+    """The migration database in a SQLite file.
+
+    Parameters
+    ----------
+    path: str
+        SQLite file; created with its tables and indexes on first use.
+    script: str
+        Name recorded with every source ingested through this object.
+    """
+
+    def __init__(self, path: str, script: str = ''):
+        self.path = path
+        self.script = script
+        self.conn = sqlite3.connect(path)
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, MIGRATION_DB_VERSION):
+            self.conn.close()
+            raise ValueError(f"{path} is a version {version} migration database; this script writes version {MIGRATION_DB_VERSION}")
+        # WAL lets sqlite3 sessions read while a generator is ingesting
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.execute(f'PRAGMA user_version = {MIGRATION_DB_VERSION}')
+        self.conn.commit()
+        # (label, rows, seconds) of every source ingested, in order
+        self.ingested: List[Tuple[str, int, float]] = []
+
+    def __enter__(self) -> 'MigrationDB':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _begin_source(self, kind: str, path: str, sheet: Optional[str], rubro_id: int = 0) -> int:
+        """Drop the earlier rows of the source and register it again; returns its id.
+
+        Runs inside the caller's transaction, so the old rows only go
+        away when the new ones are committed.
+        """
+        path = os.path.abspath(path)
+        sheet = sheet or ''
+        row = self.conn.execute(
+            'SELECT id FROM sources WHERE kind = ? AND path = ? AND sheet = ? AND rubro_id = ?', (kind, path, sheet, rubro_id),
+        ).fetchone()
+        if row is not None:
+            self.conn.execute(f'DELETE FROM {_KIND_TABLES[kind]} WHERE source_id = ?', row)
+            self.conn.execute('DELETE FROM sources WHERE id = ?', row)
+        cursor = self.conn.execute(
+            'INSERT INTO sources (kind, path, sheet, rubro_id, script, ingested_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, path, sheet, rubro_id, self.script, datetime.now(timezone.utc).isoformat()),
+        )
+        return cursor.lastrowid
+
+    def _finish_source(self, source_id: int, label: str, rows: int, seconds: float) -> None:
+        self.conn.execute('UPDATE sources SET rows = ?, seconds = ? WHERE id = ?', (rows, seconds, source_id))
+        self.conn.commit()
+        self.ingested.append((label, rows, seconds))
+        print(format_ingest(label, rows, seconds))
+
+    def _ingest_rows(
+        self,
+        kind: str,
+        path: str,
+        insert: str,
+        rows: Iterable[Sequence[Any]],
+        sheet: Optional[str] = None,
+    ) -> int:
+        """Insert ``rows`` (without their leading ``source_id``) as the new rows of one source."""
+        start = time.perf_counter()
+        count = 0
+        try:
+            source_id = self._begin_source(kind, path, sheet)
+            chunk: List[Sequence[Any]] = []
+            for row in rows:
+                chunk.append((source_id,) + tuple(row))
+                if len(chunk) >= INGEST_CHUNK_ROWS:
+                    self.conn.executemany(insert, chunk)
+                    count += len(chunk)
+                    chunk = []
+            self.conn.executemany(insert, chunk)
+            count += len(chunk)
+            self._finish_source(source_id, sheet_label(path, sheet), count, time.perf_counter() - start)
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return count
+
+    def ingest_extracted_names(self, path: str) -> int:
+        """Load an ``extracted_names_*.txt`` file (see ``extract_names.py``); returns the row count."""
+
+        def rows(f) -> Iterator[Tuple[Any, ...]]:
+            for line_number, line in enumerate(f, start=1):
+                name = line.rstrip('\n')
+                if name.strip():
+                    yield line_number, name, name_key(name)
+
+        with open(path, 'r', encoding='utf-8') as f:
+            return self._ingest_rows(KIND_EXTRACTED, path, _INSERT_EXTRACTED, rows(f))
+
+    def ingest_processed_names(self, path: str) -> int:
+        """Load a ``processed_names_*.txt`` file (see ``process_names.py``); returns the row count."""
+
+        def rows(f) -> Iterator[Tuple[Any, ...]]:
+            for line_number, line in enumerate(f, start=1):
+                line = line.rstrip('\n')
+                if not line.strip():
+                    continue
+                fields = (line.split(',') + [''] * _PROCESSED_FIELDS)[:_PROCESSED_FIELDS]
+                yield (line_number, *fields, name_key(' '.join(field for field in fields if field)))
+
+        with open(path, 'r', encoding='utf-8') as f:
+            return self._ingest_rows(KIND_PROCESSED, path, _INSERT_PROCESSED, rows(f))
+
+    def tap_payments(
+        self,
+        payments: Iterable[Dict[str, str]],
+        excel_path: str,
+        sheet_name: Optional[str] = None,
+        rubro_id: int = 0,
+    ) -> Iterator[Dict[str, str]]:
+        """Pass ``payments`` through unchanged, recording each one as a ``payments`` row.
+
+        They replace the earlier payments of the same sheet and rubro.
+        Rows are inserted in chunks while the payments flow; the source
+        is committed once the last payment has been passed on, and
+        rolled back if the consumer stops early.  The time reported is
+        the time spent in SQLite, not in parsing the workbook.
+        """
+        seconds = 0.0
+        count = 0
+        try:
+            start = time.perf_counter()
+            source_id = self._begin_source(KIND_PAYMENTS, excel_path, sheet_name, rubro_id)
+            seconds += time.perf_counter() - start
+            chunk: List[Tuple[Any, ...]] = []
+            for values in payments:
+                chunk.append(payment_row(source_id, values))
+                if len(chunk) >= INGEST_CHUNK_ROWS:
+                    start = time.perf_counter()
+                    self.conn.executemany(_INSERT_PAYMENT, chunk)
+                    seconds += time.perf_counter() - start
+                    count += len(chunk)
+                    chunk = []
+                yield values
+            start = time.perf_counter()
+            self.conn.executemany(_INSERT_PAYMENT, chunk)
+            count += len(chunk)
+            self._finish_source(source_id, sheet_label(excel_path, sheet_name), count, seconds + time.perf_counter() - start)
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def summary(self) -> str:
+        rows = sum(rows for _, rows, _ in self.ingested)
+        seconds = sum(seconds for _, _, seconds in self.ingested)
+        rate = f"{rows / seconds:.0f}" if seconds else '-'
+        return f"Migration database {self.path}: {rows} rows from {len(self.ingested)} sources ({rate} rows/s)"
+
+    def sources(self) -> List[Tuple[Any, ...]]:
+        """``(kind, path, sheet, rubro_id, rows, seconds, ingested_at)`` of every source, oldest first."""
+        return self.conn.execute(
+            'SELECT kind, path, sheet, rubro_id, rows, seconds, ingested_at FROM sources ORDER BY id'
+        ).fetchall()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def add_ingest_arguments(parser) -> None:
+    """Add ``--ingest-db`` to an ``argparse`` parser."""
+    parser.add_argument('--ingest-db', help='SQLite migration database; every parsed payment is recorded with its source cell')
+
+
+def migration_db_from_args(args, script: str = '') -> Optional[MigrationDB]:
+    """:class:`MigrationDB` for ``--ingest-db``, or ``None`` without it."""
+    return MigrationDB(args.ingest_db, script) if args.ingest_db else None
+
+
+def _expand(patterns: List[str]) -> List[str]:
+    # PowerShell does not expand wildcards for Python scripts
+    paths: List[str] = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Ingest extracted and processed names into the migration database.')
+    parser.add_argument('--db', required=True, help='SQLite migration database (created if missing)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    names = commands.add_parser('names', help='Ingest extracted_names_*.txt files (extract_names.py)')
+    names.add_argument('files', nargs='+')
+    processed = commands.add_parser('processed', help='Ingest processed_names_*.txt files (process_names.py)')
+    processed.add_argument('files', nargs='+')
+    commands.add_parser('sources', help='List the ingested sources with their rows and throughput')
+    args = parser.parse_args()
+
+    ingest: Dict[str, Callable[[MigrationDB, str], int]] = {
+        'names': MigrationDB.ingest_extracted_names,
+        'processed': MigrationDB.ingest_processed_names,
+    }
+    with MigrationDB(args.db, 'migration_db') as db:
+        if args.command == 'sources':
+            for kind, path, sheet, rubro_id, rows, seconds, ingested_at in db.sources():
+                rubro = f" rubro {rubro_id}" if kind == KIND_PAYMENTS else ''
+                print(f"{ingested_at}  {kind:<16} {format_ingest(sheet_label(path, sheet or None) + rubro, rows, seconds)}")
+            return
+        for path in _expand(args.files):
+            if not os.path.exists(path):
+                print(f"Error: File '{path}' not found")
+                continue
+            ingest[args.command](db, path)
+        print(db.summary())
+
+
+if __name__ == '__main__':
+    main()
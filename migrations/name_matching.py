@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Indexed fuzzy matching of workbook names against the student roster.
+
+``build_name_to_id_map`` keys the roster by ``normalize_name`` and the
+generators look names up with an exact ``dict.get``; any workbook name
+that is written slightly differently from ``NombreCompleto`` is
+skipped.  The usual differences are:
+
+* the given names written before the surnames (or vice versa),
+* the second surname missing on one side,
+* typing mistakes (``GONSALEZ`` for ``GONZALEZ``).
+
+:class:`NameMatcher` resolves those without scanning the roster.  Every
+roster name is split into tokens and two indexes are built once:
+
+1. a token inverted index (``token -> roster entries``), and
+2. a character trigram index over the token vocabulary
+   (``trigram -> tokens``), used to find the known tokens closest to a
+   misspelt one.
+
+A lookup expands each query token into the roster entries that contain
+it (or a close spelling of it), keeps only the entries that share enough
+tokens to possibly reach the score threshold, and scores those few
+candidates.  The score is the Dice coefficient over the aligned tokens,
+weighted by each token's spelling similarity, so ``1.0`` means the same
+multiset of tokens.
+
+Each :class:`NameMatch` carries a reason code:
+
+``exact``       the normalised names are identical
+``reordered``   same tokens in a different order
+``partial``     tokens missing or extra on one side, the rest identical
+``fuzzy``       at least one token only matched by spelling similarity
+``ambiguous``   two roster students scored (nearly) the same
+``no_match``    nothing reached the threshold
+"""
+
+from difflib import SequenceMatcher
+from itertools import combinations
+from math import ceil
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+MATCH_EXACT = 'exact'
+MATCH_REORDERED = 'reordered'
+MATCH_PARTIAL = 'partial'
+MATCH_FUZZY = 'fuzzy'
+MATCH_AMBIGUOUS = 'ambiguous'
+MATCH_NONE = 'no_match'
+
+# A three-token name missing one of its tokens (usually the second
+# surname, ``PEREZ JUAN`` for ``PEREZ LOPEZ JUAN``) scores 2*2/5 = 0.8,
+# so this is the highest default that still resolves it.  Two roster
+# students reaching the same score are still reported as ambiguous.
+DEFAULT_MIN_SCORE = 0.8
+MATCH_THRESHOLD_HELP = (
+    f'Minimum score (0-1) for --fuzzy-match to accept a match (default {DEFAULT_MIN_SCORE}; '
+    'a three-word name missing one surname scores 0.8, so higher values leave it unresolved)'
+)
+
+
+class NameMatch(NamedTuple):
+    """Result of :meth:`NameMatcher.match`.
+
+    ``alumno_id`` is ``None`` for ``ambiguous`` and ``no_match`` results;
+    ``name`` is the normalised roster name that was matched (the best
+    candidate for ``ambiguous``, ``None`` for ``no_match``).
+    """
+
+    alumno_id: Optional[int]
+    score: float
+    reason: str
+    name: Optional[str] = None
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f'${token}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameMatcher:
+    """Token and trigram indexes over the normalised roster names.
+
+    Parameters
+    ----------
+    name_to_id: Dict[str, int]
+        Mapping of normalised roster name to student ``Id``, as returned
+        by ``build_name_to_id_map``.
+    min_score: float
+        Minimum score (0-1) for a non-exact match to be accepted (see
+        :data:`DEFAULT_MIN_SCORE`).
+    token_similarity: float
+        Minimum spelling similarity (0-1) for a misspelt token to be
+        aligned with a roster token.
+    ambiguity_margin: float
+        Two different students whose scores differ by no more than this
+        are reported as ``ambiguous`` instead of picking one.
+    spelling_candidates: int
+        How many vocabulary tokens (those sharing the most trigrams) are
+        checked with ``difflib`` when a token is not in the roster.
+    """
+
+    def __init__(
+        self,
+        name_to_id: Dict[str, int],
+        min_score: float = DEFAULT_MIN_SCORE,
+        token_similarity: float = 0.75,
+        ambiguity_margin: float = 0.02,
+        spelling_candidates: int = 25,
+    ):
+        self.min_score = min_score
+        self.token_similarity = token_similarity
+        self.ambiguity_margin = ambiguity_margin
+        self.spelling_candidates = spelling_candidates
+        self._exact = dict(name_to_id)
+        self._names: List[str] = []
+        self._ids: List[int] = []
+        self._tokens: List[Tuple[str, ...]] = []
+        self._by_sorted_tokens: Dict[Tuple[str, ...], List[int]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        for name, alumno_id in self._exact.items():
+            tokens = tuple(name.split())
+            if not tokens:
+                continue
+            entry = len(self._names)
+            self._names.append(name)
+            self._ids.append(alumno_id)
+            self._tokens.append(tokens)
+            self._by_sorted_tokens.setdefault(tuple(sorted(tokens)), []).append(entry)
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(entry)
+        self._gram_index: Dict[str, List[str]] = {}
+        for token in self._postings:
+            for gram in _trigrams(token):
+                self._gram_index.setdefault(gram, []).append(token)
+        self._spellings: Dict[str, Dict[str, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def similar_tokens(self, token: str) -> Dict[str, float]:
+        """Return the known tokens spelt like ``token`` with their similarity.
+
+        A token present in the roster maps to itself with similarity
+        ``1.0``.  Otherwise the trigram index proposes the vocabulary
+        tokens sharing the most trigrams, and those whose
+        ``difflib`` ratio reaches ``token_similarity`` are kept.
+        Results are cached per token.
+        """
+        cached = self._spellings.get(token)
+        if cached is not None:
+            return cached
+        if token in self._postings:
+            result = {token: 1.0}
+        else:
+            grams = _trigrams(token)
+            shared: Dict[str, int] = {}
+            for gram in grams:
+                for candidate in self._gram_index.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            result = {}
+            # A single typo can destroy three of a short token's trigrams,
+            # so rank by shared trigrams and only verify the best few
+            # instead of thresholding the trigram overlap itself.
+            ranked = sorted(shared.items(), key=lambda item: (-item[1], item[0]))
+            for candidate, _ in ranked[:self.spelling_candidates]:
+                if abs(len(candidate) - len(token)) > max(len(candidate), len(token)) * (1 - self.token_similarity):
+                    continue
+                ratio = SequenceMatcher(None, token, candidate).ratio()
+                if ratio >= self.token_similarity:
+                    result[candidate] = ratio
+        self._spellings[token] = result
+        return result
+
+    def _candidates(self, groups: List[Set[int]], required: int) -> Set[int]:
+        """Entries present in at least ``required`` of the token ``groups``."""
+        groups = sorted((g for g in groups if g), key=len)
+        if len(groups) < required:
+            return set()
+        found: Set[int] = set()
+        for subset in combinations(groups, required):
+            # combinations keeps the smallest-first order, so every
+            # intersection starts from the most selective posting list
+            hit = subset[0].intersection(*subset[1:])
+            found |= hit
+        return found
+
+    def _score(self, query: Tuple[str, ...], spellings: List[Dict[str, float]], entry: int) -> Tuple[float, bool]:
+        """Dice score of ``query`` against roster ``entry`` and whether spelling was needed."""
+        remaining = list(self._tokens[entry])
+        total = 0.0
+        fuzzy = False
+        for token, similar in zip(query, spellings):
+            if token in remaining:
+                remaining.remove(token)
+                total += 1.0
+                continue
+            best = None
+            best_sim = 0.0
+            for candidate in remaining:
+                sim = similar.get(candidate, 0.0)
+                if sim > best_sim:
+                    best, best_sim = candidate, sim
+            if best is not None:
+                remaining.remove(best)
+                total += best_sim
+                fuzzy = True
+        return 2.0 * total / (len(query) + len(self._tokens[entry])), fuzzy
+
+    def match(self, name: str) -> NameMatch:
+        """Resolve a normalised workbook name to a roster student.
+
+        Parameters
+        ----------
+        name: str
+            Name already passed through ``normalize_name``.
+
+        Returns
+        -------
+        NameMatch
+            The matched ``Id`` (or ``None``), its score and reason code.
+        """
+        alumno_id = self._exact.get(name)
+        if alumno_id is not None:
+            return NameMatch(alumno_id, 1.0, MATCH_EXACT, name)
+        query = tuple(name.split())
+        if not query:
+            return NameMatch(None, 0.0, MATCH_NONE)
+        same_tokens = self._by_sorted_tokens.get(tuple(sorted(query)))
+        if same_tokens:
+            ids = {self._ids[e] for e in same_tokens}
+            if len(ids) == 1:
+                return NameMatch(self._ids[same_tokens[0]], 1.0, MATCH_REORDERED, self._names[same_tokens[0]])
+            return NameMatch(None, 1.0, MATCH_AMBIGUOUS, self._names[same_tokens[0]])
+
+        spellings = [self.similar_tokens(token) for token in query]
+        groups: List[Set[int]] = []
+        for similar in spellings:
+            if len(similar) == 1:
+                groups.append(self._postings[next(iter(similar))])
+            elif similar:
+                groups.append(set().union(*(self._postings[t] for t in similar)))
+        # A candidate aligning S of the n query tokens scores at most
+        # 2S / (n + S), so it must share ceil(n * t / (2 - t)) tokens to
+        # be able to reach the threshold t.
+        required = max(1, ceil(len(query) * self.min_score / (2.0 - self.min_score) - 1e-9))
+        candidates = self._candidates(groups, required)
+
+        ranked: List[Tuple[float, bool, int]] = []
+        for entry in candidates:
+            score, fuzzy = self._score(query, spellings, entry)
+            if score >= self.min_score - self.ambiguity_margin:
+                ranked.append((score, fuzzy, entry))
+        if not ranked:
+            return NameMatch(None, 0.0, MATCH_NONE)
+        ranked.sort(key=lambda r: (-r[0], self._names[r[2]]))
+        score, fuzzy, entry = ranked[0]
+        if score < self.min_score:
+            return NameMatch(None, score, MATCH_NONE)
+        for other_score, _, other in ranked[1:]:
+            if score - other_score > self.ambiguity_margin:
+                break
+            if self._ids[other] != self._ids[entry]:
+                return NameMatch(None, score, MATCH_AMBIGUOUS, self._names[entry])
+        reason = MATCH_FUZZY if fuzzy else MATCH_PARTIAL
+        return NameMatch(self._ids[entry], score, reason, self._names[entry])
+
+    def match_many(self, names: Iterable[str]) -> Dict[str, NameMatch]:
+        """Match several names, resolving each distinct name once."""
+        results: Dict[str, NameMatch] = {}
+        for name in names:
+            if name not in results:
+                results[name] = self.match(name)
+        return results
+
+
+def lookup_student_id(
+    name_to_id: Dict[str, int],
+    name: str,
+    matcher: Optional[NameMatcher] = None,
+) -> Optional[int]:
+    """Look ``name`` up exactly, falling back to ``matcher`` on a miss.
+
+    This is the lookup the generators use for every workbook row.
+    Without a matcher it is the plain ``name_to_id.get`` they always did.
+    Names resolved or rejected by the matcher are reported on stdout with
+    their score and reason code so the operator can review them.
+
+    Parameters
+    ----------
+    name_to_id: Dict[str, int]
+        Mapping of normalised roster name to student ``Id``.
+    name: str
+        Normalised workbook name.
+    matcher: Optional[NameMatcher]
+        Fuzzy matcher built over the same roster, or ``None``.
+
+    Returns
+    -------
+    Optional[int]
+        The student ``Id``, or ``None`` if the row should be skipped.
+    """
+    alumno_id = name_to_id.get(name)
+    if alumno_id is not None or matcher is None:
+        return alumno_id
+    match = matcher.match(name)
+    if match.alumno_id is not None:
+        print(f"Matched '{name}' to '{match.name}' (Id {match.alumno_id}, {match.reason}, score {match.score:.2f})")
+    elif match.reason == MATCH_AMBIGUOUS:
+        print(f"Skipped '{name}': ambiguous, best candidate '{match.name}' (score {match.score:.2f})")
+    return match.alumno_id
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Bounded memoisation for the per-cell parsers of the Pagos generators.
+
+``parse_date_from_comment`` strips accents (NFKD plus a per-character
+filter) and runs up to two regex searches on every fee comment, and
+``parse_amount`` runs its regex clean-up on every textual fee cell.
+Treasury staff type the same few dozen texts over and over
+(``13 NOVIEMBRE 2024 transferencia``, ``Q250,00``...), so most of that
+work repeats a result that was already computed.
+
+:class:`MemoizedParser` wraps such a single-argument parser with a
+``functools.lru_cache`` of bounded size.  Only string arguments go
+through the cache; numbers, ``None`` and other cell values are cheap to
+parse and are passed straight to the wrapped function.  Time spent in
+cache misses is measured so :meth:`MemoizedParser.stats` can estimate
+how much time the hits saved, and :func:`format_parse_stats` renders a
+small report for ``--parse-stats``.
+"""
+
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional
+
+DEFAULT_PARSE_CACHE_SIZE = 4096
+
+
+class MemoizedParser:
+    """LRU-cached wrapper around a one-argument parsing function.
+
+    Parameters
+    ----------
+    func: Callable[[Any], Any]
+        The parser to wrap.  It must be pure: the same string always
+        parses to the same value.
+    maxsize: int
+        Maximum number of distinct strings kept.  ``0`` disables the
+        cache (every call goes to ``func``) while still counting calls.
+    name: Optional[str]
+        Label used in the stats report (defaults to ``func.__name__``).
+    """
+
+    def __init__(self, func: Callable[[Any], Any], maxsize: int = DEFAULT_PARSE_CACHE_SIZE, name: Optional[str] = None):
+        self.func = func
+        self.name = name or func.__name__
+        self.maxsize = maxsize
+        self.uncached_calls = 0
+        self.miss_seconds = 0.0
+        self._cached = lru_cache(maxsize=maxsize)(self._timed) if maxsize > 0 else None
+
+    def _timed(self, text: str) -> Any:
+        start = time.perf_counter()
+        try:
+            return self.func(text)
+        finally:
+            self.miss_seconds += time.perf_counter() - start
+
+    def __call__(self, value: Any) -> Any:
+        if self._cached is not None and type(value) is str:
+            return self._cached(value)
+        self.uncached_calls += 1
+        return self.func(value)
+
+    def cache_clear(self) -> None:
+        """Drop every cached result and reset the counters."""
+        if self._cached is not None:
+            self._cached.cache_clear()
+        self.uncached_calls = 0
+        self.miss_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call counts, hit rate and the estimated time saved.
+
+        ``saved_seconds`` assumes every hit would have cost as much as
+        the average miss; it ignores the (much smaller) cost of the
+        cache lookup itself.  With only a handful of misses the average
+        is inflated by one-off costs such as the first regex compile.
+        """
+        if self._cached is not None:
+            info = self._cached.cache_info()
+            hits, misses, currsize = info.hits, info.misses, info.currsize
+        else:
+            hits = misses = currsize = 0
+        lookups = hits + misses
+        avg_miss = self.miss_seconds / misses if misses else 0.0
+        return {
+            'name': self.name,
+            'calls': lookups + self.uncached_calls,
+            'cached_calls': lookups,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': currsize,
+            'maxsize': self.maxsize,
+            'miss_seconds': self.miss_seconds,
+            'saved_seconds': hits * avg_miss,
+        }
+
+
+def format_parse_stats(parsers: Iterable[MemoizedParser]) -> str:
+    """Render the :meth:`MemoizedParser.stats` of several parsers as a table."""
+    lines = [
+        f"{'parser':<26}{'calls':>9}{'cached':>9}{'hits':>9}{'hit rate':>10}"
+        f"{'entries':>9}{'miss ms':>10}{'saved ms':>10}"
+    ]
+    for parser in parsers:
+        s = parser.stats()
+        lines.append(
+            f"{s['name']:<26}{s['calls']:>9}{s['cached_calls']:>9}{s['hits']:>9}{s['hit_rate']:>10.1%}"
+            f"{s['entries']:>9}{s['miss_seconds'] * 1e3:>10.1f}{s['saved_seconds'] * 1e3:>10.1f}"
+        )
+    return '\n'.join(lines)
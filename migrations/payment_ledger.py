@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+SQLite ledger of the payments already emitted, for incremental runs.
+
+Re-running a generator on an updated workbook regenerates every payment
+in it, so a month-end refresh meant deleting and reloading tens of
+thousands of ``Pagos`` rows.  With ``--ledger <file.sqlite>`` the
+generators record a fingerprint of every payment they write::
+
+    (AlumnoId, RubroId, MesColegiatura, AnioColegiatura, Fecha, Monto)
+
+and later runs against the same ledger only emit the payments whose
+fingerprint is not there yet:
+
+* **new**: no payment with that AlumnoId/RubroId/month/year was emitted
+  before;
+* **changed**: one was, but with another Fecha or Monto (a corrected
+  cell).  It is emitted as a new INSERT; the row loaded by the earlier
+  run is left for the operator to void, and the count is reported;
+* **unchanged**: the same fingerprint is already in the ledger, so the
+  payment is skipped.
+
+Fingerprints are counted rather than just flagged: a workbook that
+really holds two identical payments emits both, and a later run skips
+both.  The ledger is only updated by :meth:`PaymentLedger.commit`, which
+the generators call after the SQL file has been written, so a crashed
+run does not mark payments as emitted.  After a ``--load`` that stopped
+partway they commit only the payments that reached the database (the
+rows before ``LoadResult.failed_row``), so the next run emits the rest.
+Every commit also records a row in the ``runs`` table (script, workbook,
+counts, time).
+
+The ledger is a plain SQLite file and can be inspected with ``sqlite3``;
+deleting it starts over with a full run.
+"""
+
+import sqlite3
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+LEDGER_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS emitted_payments (
+    alumno_id INTEGER NOT NULL,
+    rubro_id INTEGER NOT NULL,
+    mes_colegiatura INTEGER NOT NULL,
+    anio_colegiatura INTEGER NOT NULL,
+    fecha TEXT NOT NULL,
+    monto TEXT NOT NULL,
+    occurrences INTEGER NOT NULL DEFAULT 1,
+    source TEXT,
+    run_id INTEGER,
+    PRIMARY KEY (alumno_id, rubro_id, mes_colegiatura, anio_colegiatura, fecha, monto)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    finished_at TEXT NOT NULL,
+    script TEXT,
+    source TEXT,
+    emitted INTEGER NOT NULL,
+    new INTEGER NOT NULL,
+    changed INTEGER NOT NULL,
+    unchanged INTEGER NOT NULL
+);
+"""
+
+# (AlumnoId, RubroId, MesColegiatura, AnioColegiatura, Fecha, Monto)
+Fingerprint = Tuple[int, int, int, int, str, str]
+
+
+def _int_or_zero(text: str) -> int:
+    # Primary key columns cannot hold NULL; statements without a month/year write NULL
+    return 0 if text in ('', 'NULL') else int(text)
+
+
+def payment_fingerprint(values: Dict[str, str]) -> Fingerprint:
+    """Fingerprint of one payment from its template slot values (see ``statement_values``).
+
+    ``Fecha`` loses its SQL quotes and ``Monto`` keeps the two-decimal
+    text the statement carries, so the fingerprint matches what was
+    actually written.  A ``NULL`` month or year is stored as ``0``.
+    """
+    return (
+        int(values['AlumnoId']),
+        int(values['RubroId']),
+        _int_or_zero(values['MesColegiatura']),
+        _int_or_zero(values['AnioColegiatura']),
+        values['Fecha'].strip("'"),
+        values['Monto'],
+    )
+
+
+class PaymentLedger:
+    """Emitted-payment fingerprints stored in a SQLite file.
+
+    Parameters
+    ----------
+    path: str
+        SQLite file; created with its tables on first use.
+    script: str
+        Generator name recorded in the ``runs`` table.
+    """
+
+    def __init__(self, path: str, script: str = ''):
+        self.path = path
+        self.script = script
+        self.conn = sqlite3.connect(path)
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, LEDGER_VERSION):
+            self.conn.close()
+            raise ValueError(f"{path} is a version {version} ledger; this script writes version {LEDGER_VERSION}")
+        self.conn.executescript(_SCHEMA)
+        self.conn.execute(f'PRAGMA user_version = {LEDGER_VERSION}')
+        self._known: Dict[Fingerprint, int] = {}
+        self._keys: set = set()
+        for *fingerprint, occurrences in self.conn.execute(
+            'SELECT alumno_id, rubro_id, mes_colegiatura, anio_colegiatura, fecha, monto, occurrences FROM emitted_payments'
+        ):
+            fingerprint = tuple(fingerprint)
+            self._known[fingerprint] = occurrences
+            self._keys.add(fingerprint[:4])
+        self._seen: Counter = Counter()
+        self._sources: Dict[Fingerprint, str] = {}
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    def filter(self, payments: Iterable[Dict[str, str]], source: str = '') -> Iterator[Dict[str, str]]:
+        """Yield only the payments that are not in the ledger yet, counting each outcome."""
+        known = self._known
+        seen = self._seen
+        for values in payments:
+            fingerprint = payment_fingerprint(values)
+            seen[fingerprint] += 1
+            if seen[fingerprint] <= known.get(fingerprint, 0):
+                self.unchanged += 1
+                continue
+            if fingerprint[:4] in self._keys and fingerprint not in known:
+                self.changed += 1
+            else:
+                self.new += 1
+            self._sources.setdefault(fingerprint, source)
+            yield values
+
+    @property
+    def emitted(self) -> int:
+        return self.new + self.changed
+
+    def commit(self, source: str = '', emitted: Optional[Iterable[Fingerprint]] = None) -> None:
+        """Record the payments emitted by :meth:`filter` and log the run.
+
+        ``emitted`` limits the record to these fingerprints, one per
+        payment that reached its destination (a payment yielded twice
+        appears twice); by default every payment :meth:`filter` yielded
+        is recorded.
+        """
+        if emitted is None:
+            counts = {fingerprint: count for fingerprint, count in self._seen.items() if count > self._known.get(fingerprint, 0)}
+            recorded = self.emitted
+        else:
+            emitted = Counter(emitted)
+            counts = {fingerprint: self._known.get(fingerprint, 0) + count for fingerprint, count in emitted.items()}
+            recorded = sum(emitted.values())
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO runs (finished_at, script, source, emitted, new, changed, unchanged) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (datetime.now(timezone.utc).isoformat(), self.script, source, recorded, self.new, self.changed, self.unchanged),
+            )
+            run_id = cursor.lastrowid
+            rows = [
+                fingerprint + (count, self._sources.get(fingerprint, source), run_id)
+                for fingerprint, count in counts.items()
+            ]
+            self.conn.executemany(
+                'INSERT INTO emitted_payments '
+                '(alumno_id, rubro_id, mes_colegiatura, anio_colegiatura, fecha, monto, occurrences, source, run_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (alumno_id, rubro_id, mes_colegiatura, anio_colegiatura, fecha, monto) '
+                'DO UPDATE SET occurrences = excluded.occurrences, run_id = excluded.run_id',
+                rows,
+            )
+        for fingerprint, count in counts.items():
+            self._known[fingerprint] = count
+            self._keys.add(fingerprint[:4])
+
+    def summary(self) -> str:
+        return (
+            f"Ledger {self.path}: {self.new} new, {self.changed} changed, "
+            f"{self.unchanged} already emitted (skipped)"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
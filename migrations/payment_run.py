@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+The part of a Pagos generator run that comes after the workbook is parsed.
+
+``generate_sql_openai_v4.py`` and ``generate_sql_multi_mes.py`` differ
+in how they read a workbook (one fee column against a row of month
+columns) and in their ``INSERT`` template, but once the payments are
+parsed both do the same thing with them:
+
+1. record them in the ``--ingest-db`` migration database, as parsed;
+2. drop the ones already in ``Pagos`` (``--existing-pagos``) and the ones
+   an earlier run emitted (``--ledger``), counting what is left as
+   written (see ``skip_metrics.py``);
+3. load them with ``--load`` or render them into the SQL file;
+4. print the summaries, commit to the ledger what reached the SQL file
+   or the database, write the metrics and the profile and exit with an
+   error when a sheet or the load failed.
+
+:class:`PaymentRun` holds the state those steps share.  Each generator
+passes in its own ``render_payment_statements`` and
+``load_payment_values``, which know its template.
+"""
+
+import itertools
+import sys
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from existing_pagos import existing_pagos_from_args
+from migration_db import migration_db_from_args
+from parse_cache import format_parse_stats
+from payment_ledger import PaymentLedger, payment_fingerprint
+from pg_loader import load_options
+from profiling import StageProfiler
+from sheet_jobs import iter_sheet_payments, run_sheet_jobs
+from skip_metrics import GenerationMetrics, report_metrics
+from sql_output import RowCounter
+from sql_shards import open_statement_writer
+from workbook_staging import staging_dir_from_args
+
+
+class PaymentRun:
+    """Filters, output and reports of one generator run.
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        The generator's parsed flags.
+    script: str
+        Script name recorded in the ledger, the ingest database and the
+        metrics.
+    profiler: StageProfiler
+        The run's profiler; :meth:`finish` stops it.
+    rubro_ids: Sequence[int]
+        Rubros whose existing ``Pagos`` are indexed for ``--existing-pagos``.
+    """
+
+    def __init__(self, args, script: str, profiler: StageProfiler, rubro_ids: Sequence[int]):
+        self.args = args
+        self.profiler = profiler
+        self.metrics = GenerationMetrics(script)
+        self.ledger = PaymentLedger(args.ledger, script) if args.ledger else None
+        self.ingest = migration_db_from_args(args, script)
+        with profiler.stage('existing_load'):
+            self.existing = existing_pagos_from_args(args, sorted(set(rubro_ids)))
+        self.jobs: Optional[List[Dict]] = None
+        self.failed: List[Dict] = []
+
+    @property
+    def source_cells(self) -> bool:
+        """Whether the payments must carry their workbook name and cell for ``--ingest-db``."""
+        return self.ingest is not None
+
+    def sheet_payments(self, worker: Callable, jobs: List[Dict], shared: Dict[str, Any]) -> Iterator[Dict[str, str]]:
+        """Run the sheet ``jobs`` in worker processes and chain their filtered payments.
+
+        ``shared`` holds what the generator's ``worker`` needs besides the
+        job (roster, matcher); the options common to both generators are
+        added here.
+        """
+        self.jobs = jobs
+        shared = dict(
+            shared,
+            streaming=self.args.streaming,
+            staging=staging_dir_from_args(self.args),
+            source_cells=self.source_cells,
+            # Workers skip cProfile; it only covers the parent process
+            profile=self.profiler.options._replace(cprofile=None) if self.profiler.enabled else None,
+        )
+        # Sheets are parsed in worker processes; filtering, rendering and
+        # writing stay here, in sheet order (see sheet_jobs.py)
+        return iter_sheet_payments(
+            run_sheet_jobs(worker, jobs, shared, self.args.workers),
+            self.metrics, self.profiler, existing=self.existing, ledger=self.ledger,
+            failed=self.failed, ingest=self.ingest,
+        )
+
+    def workbook_payments(self, payments: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Pass the payments parsed from the ``--excel`` workbook through the filters."""
+        if self.ingest is not None:
+            # Recorded as parsed, before the existing-Pagos and ledger filters
+            payments = self._ingest_active_sheet(payments)
+        if self.existing is not None:
+            payments = self.existing.filter(payments)
+        if self.ledger is not None:
+            payments = self.ledger.filter(payments, source=self.args.excel)
+        return self.metrics.count_written(payments)
+
+    def _ingest_active_sheet(self, payments: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        # Under the sheet's title, as --all-sheets/--sheets record it, so that
+        # either mode replaces what the other ingested.  The parser sets the
+        # title once it has opened the workbook, on the first payment pulled
+        payments = iter(payments)
+        first = next(payments, None)
+        sheet = self.metrics.workbooks[-1].sheet
+        if first is not None:
+            payments = itertools.chain([first], payments)
+        yield from self.ingest.tap_payments(payments, self.args.excel, sheet, self.args.rubro_id)
+
+    def finish(
+        self,
+        payments: Iterable[Dict[str, str]],
+        template: str,
+        output_filename: str,
+        render_payment_statements: Callable,
+        load_payment_values: Callable,
+        parse_caches: Sequence = (),
+    ) -> None:
+        """Load or write ``payments``, report the run and exit with 1 if part of it failed."""
+        args = self.args
+        profiler = self.profiler
+        load = load_options(args)
+        if load is not None:
+            # Fingerprints in load order; a failed load only loaded a prefix of them
+            loaded: Optional[List] = [] if self.ledger is not None else None
+            if loaded is not None:
+                payments = self._fingerprinted(payments, loaded)
+            with profiler.stage('load'):
+                result = load_payment_values(load, payments, template, profiler)
+            print(result.summary())
+            # Rows from failed_row on are not in the database; failed sheets
+            # yielded no payments, so everything else is
+            emitted = None
+            if loaded is not None and not result.ok:
+                emitted = loaded[:result.failed_row - 1]
+            self._close(emitted)
+            if not result.ok or self.failed:
+                sys.exit(1)
+            return
+        with profiler.stage('generate'):
+            # Each statement goes to disk as soon as it is rendered (see sql_output.py)
+            counter = RowCounter()
+            with open_statement_writer(output_filename, args, source=args.excel) as writer:
+                write = profiler.wrap('write', writer.write)
+                for statement in render_payment_statements(
+                    payments,
+                    template,
+                    batch_size=args.batch_size,
+                    transaction=args.transaction,
+                    copy=args.copy,
+                    profiler=profiler,
+                    rows=counter,
+                ):
+                    write(statement, counter.take())
+
+        if writer.count and args.copy:
+            print(f"Generated a COPY block of {writer.rows} rows and wrote it to {writer.path}")
+        elif writer.count:
+            print(f"Generated {writer.count} statements and wrote them to {writer.path}")
+        else:
+            print("No statements were generated.")
+        if self.failed:
+            print(f"{len(self.failed)} of {len(self.jobs)} sheets failed: {', '.join(r['sheet'] for r in self.failed)}")
+        if args.parse_stats:
+            print(format_parse_stats(list(parse_caches)))
+        # Recorded only now that the SQL file is on disk
+        self._close()
+        if self.failed:
+            sys.exit(1)
+
+    @staticmethod
+    def _fingerprinted(payments: Iterable[Dict[str, str]], fingerprints: List) -> Iterator[Dict[str, str]]:
+        for values in payments:
+            fingerprints.append(payment_fingerprint(values))
+            yield values
+
+    def _close(self, emitted: Optional[List] = None) -> None:
+        if self.existing is not None:
+            print(self.existing.summary())
+        if self.ledger is not None:
+            if not self.args.ledger_dry_run:
+                self.ledger.commit(source=self.args.excel, emitted=emitted)
+            print(self.ledger.summary())
+            self.ledger.close()
+        if self.ingest is not None:
+            print(self.ingest.summary())
+            self.ingest.close()
+        report_metrics(self.metrics, self.args)
+        self.profiler.finish()
@@ -3,6 +3,8 @@ import re
 import sys
 import os
 
+from profiling import pop_profile_options, start_profiler
+
 def parse_full_name(full_name):
     # Remove 'Nombre del Alumno' header if present
     if full_name.strip() == 'Nombre del Alumno':
@@ -60,13 +62,34 @@ def parse_full_name(full_name):
         'tercer_nombre': tercer_nombre
     }
 
+def iter_processed_names(lines):
+    # One parsed name per extracted line, header and blank lines dropped
+    for line in lines:
+        parsed_name = parse_full_name(line.strip())
+        if parsed_name:
+            yield parsed_name
+
+def format_processed_name(name_dict):
+    # Line layout of processed_names_*.txt, read back by generate_sql.py
+    return f"{name_dict['primer_apellido']},{name_dict['segundo_apellido']},{name_dict['primer_nombre']},{name_dict['segundo_nombre']},{name_dict['tercer_nombre']}\n"
+
+def output_file_for(input_file):
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    # Remove 'extracted_names_' prefix if present
+    if base_name.startswith('extracted_names_'):
+        base_name = base_name[len('extracted_names_'):]
+    return f"processed_names_{base_name}.txt"
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python process_names.py <extracted_names_file>")
+    # Optional flag: --profile reports time and memory per stage (see profiling.py)
+    argv = sys.argv[1:]
+    profile = pop_profile_options(argv)
+    if len(argv) < 1:
+        print("Usage: python process_names.py <extracted_names_file> [--profile]")
         print("Example: python process_names.py extracted_names_KinderA.txt")
         sys.exit(1)
     
-    input_file = sys.argv[1]
+    input_file = argv[0]
     
     if not os.path.exists(input_file):
         print(f"Error: File '{input_file}' not found")
@@ -74,28 +97,21 @@ if __name__ == "__main__":
         sys.exit(1)
     
     print(f"Processing names from: {input_file}")
+    profiler = start_profiler(__file__, profile)
     
     try:
-        processed_names = []
-        with open(input_file, "r", encoding="utf-8") as f:
-            for line in f:
-                parsed_name = parse_full_name(line.strip())
-                if parsed_name:
-                    processed_names.append(parsed_name)
+        with profiler.stage("read_parse"), open(input_file, "r", encoding="utf-8") as f:
+            processed_names = list(profiler.iterate("parse", iter_processed_names(f)))
         
         # Generate output filename based on input filename
-        base_name = os.path.splitext(os.path.basename(input_file))[0]
-        # Remove 'extracted_names_' prefix if present
-        if base_name.startswith('extracted_names_'):
-            base_name = base_name[len('extracted_names_'):]
-        output_file = f"processed_names_{base_name}.txt"
+        output_file = output_file_for(input_file)
         
-        with open(output_file, "w", encoding="utf-8") as f:
-            for name_dict in processed_names:
-                f.write(f"{name_dict['primer_apellido']},{name_dict['segundo_apellido']},{name_dict['primer_nombre']},{name_dict['segundo_nombre']},{name_dict['tercer_nombre']}\n")
+        with profiler.stage("write"), open(output_file, "w", encoding="utf-8") as f:
+            f.writelines(format_processed_name(name_dict) for name_dict in processed_names)
         
         print(f"Successfully processed {len(processed_names)} names")
         print(f"Output saved to: {output_file}")
+        profiler.finish()
         
     except Exception as e:
         print(f"Error processing file: {e}")
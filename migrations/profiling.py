@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Per-stage wall time, call counts and peak memory for ``--profile``.
+
+When a run is slow the question is which stage the time goes to:
+workbook load, roster mapping, comment parsing, rendering or writing.
+Every script in this folder accepts::
+
+    --profile                      print a per-stage summary table
+    --profile-report <file.json>   where to write the JSON report
+                                   (default ``<script>.profile.json``)
+    --profile-cprofile <file>      also dump cProfile statistics
+                                   (read them with ``python -m pstats``)
+    --profile-no-memory            skip tracemalloc (faster, no peak column)
+
+and threads a :class:`StageProfiler` through its stages:
+
+* :meth:`StageProfiler.stage` is a context manager for one-off steps
+  (loading the roster, opening the workbook, writing the output);
+* :meth:`StageProfiler.wrap` times every call of a per-row function
+  (name lookup, amount and date parsing, statement rendering);
+* :meth:`StageProfiler.iterate` times every ``next()`` of a lazy
+  iterator, such as the rows streamed out of a workbook.
+
+Stages nest: a stage entered while another one is running is reported
+below it, indented, and its time and memory are included in its
+parent's.  The peak column is the highest ``tracemalloc`` traced memory
+seen while the stage was running, so it includes whatever was already
+allocated when the stage started.  Tracing memory slows Python
+allocation down noticeably; use ``--profile-no-memory`` when only the
+timings matter.
+
+Without ``--profile`` the scripts get :data:`NULL_PROFILER`, whose
+``wrap`` and ``iterate`` return their argument unchanged, so normal runs
+pay nothing.  The summary table goes to stderr because
+``generate_sql_openai.py`` and ``generate_sql_openai_v2.py`` print their
+SQL on stdout.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+
+class ProfileOptions(NamedTuple):
+    """What ``--profile`` and its companion flags asked for."""
+
+    report: Optional[str]
+    cprofile: Optional[str]
+    memory: bool
+
+
+class _StageStats:
+    __slots__ = ('name', 'depth', 'calls', 'seconds', 'peak')
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak = 0
+
+
+class _StageTimer:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler: 'StageProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.profiler._enter(self.name)
+
+    def __exit__(self, *exc) -> None:
+        self.profiler._exit()
+
+
+class StageProfiler:
+    """Accumulates wall time, calls and peak traced memory per named stage.
+
+    Parameters
+    ----------
+    script: str
+        Name used in the summary and for the default report path.
+    options: Optional[ProfileOptions]
+        ``None`` builds a disabled profiler (see :data:`NULL_PROFILER`).
+    """
+
+    def __init__(self, script: str = '', options: Optional[ProfileOptions] = None):
+        self.script = script
+        self.options = options
+        self.enabled = options is not None
+        self.memory = bool(options and options.memory)
+        self._stages: Dict[str, _StageStats] = {}
+        self._stack: List[list] = []
+        self._started_at: Optional[str] = None
+        self._start = 0.0
+        self._wall = 0.0
+        self._peak = 0
+        self._owns_tracemalloc = False
+        self._cprofile: Optional[cProfile.Profile] = None
+
+    # -- recording -------------------------------------------------------
+
+    def _enter(self, name: str) -> None:
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            # reset_peak() below forgets this peak, so fold it into the run total first
+            self._peak = max(self._peak, peak)
+            if self._stack:
+                top = self._stack[-1]
+                top[2] = max(top[2], peak)
+            tracemalloc.reset_peak()
+        stats = self._stages.get(name)
+        if stats is None:
+            stats = self._stages[name] = _StageStats(name, len(self._stack))
+        self._stack.append([stats, time.perf_counter(), 0])
+
+    def _exit(self, counted: bool = True) -> None:
+        stats, start, peak = self._stack.pop()
+        stats.seconds += time.perf_counter() - start
+        if counted:
+            stats.calls += 1
+        if self.memory:
+            _, current_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, current_peak)
+            stats.peak = max(stats.peak, peak)
+            self._peak = max(self._peak, peak)
+            if self._stack:
+                top = self._stack[-1]
+                top[2] = max(top[2], peak)
+
+    def stage(self, name: str):
+        """Context manager timing one execution of stage ``name``."""
+        if not self.enabled:
+            return nullcontext()
+        return _StageTimer(self, name)
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Return ``func`` with every call recorded under ``name``."""
+        if not self.enabled:
+            return func
+
+        def timed(*args, **kwargs):
+            self._enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit()
+
+        return timed
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterable:
+        """Return ``iterable`` with the time spent producing each item recorded under ``name``."""
+        if not self.enabled:
+            return iterable
+        return self._iterate(name, iter(iterable))
+
+    def _iterate(self, name: str, iterator):
+        while True:
+            self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(counted=False)
+                return
+            except BaseException:
+                self._exit()
+                raise
+            self._exit()
+            yield item
+
+    def merge(self, stages: Iterable[Dict[str, Any]], prefix: str = '', depth: int = 0) -> None:
+        """Add stage records from :meth:`results` of another profiler (e.g. a worker process).
+
+        Records are summed by name (after adding ``prefix``) and shown
+        ``depth`` levels below their original depth.  Times merged from
+        several processes are summed, so they can exceed the wall time.
+        """
+        for record in stages:
+            name = prefix + record['name']
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = _StageStats(name, record['depth'] + depth)
+            stats.calls += record['calls']
+            stats.seconds += record['seconds']
+            stats.peak = max(stats.peak, record['peak_bytes'] or 0)
+
+    # -- session -----------------------------------------------------------
+
+    def start(self) -> 'StageProfiler':
+        """Start tracemalloc and cProfile (as requested) and the wall clock."""
+        if not self.enabled:
+            return self
+        self._started_at = datetime.now(timezone.utc).isoformat()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        if self.options.cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self) -> None:
+        """Stop the clock, cProfile and tracemalloc; safe to call more than once."""
+        if not self.enabled or not self._start:
+            return
+        self._wall = time.perf_counter() - self._start
+        self._start = 0.0
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.memory and tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+
+    def results(self) -> List[Dict[str, Any]]:
+        """Stage records in the order the stages were first entered."""
+        total = self._wall or sum(s.seconds for s in self._stages.values() if s.depth == 0)
+        return [
+            {
+                'name': s.name,
+                'depth': s.depth,
+                'calls': s.calls,
+                'seconds': s.seconds,
+                'share': s.seconds / total if total else 0.0,
+                'peak_bytes': s.peak if self.memory else None,
+            }
+            for s in self._stages.values()
+        ]
+
+    def format_table(self) -> str:
+        """Render :meth:`results` as a fixed-width summary table."""
+        lines = [f"{'stage':<32}{'calls':>10}{'seconds':>10}{'share':>8}{'peak MiB':>10}"]
+        for record in self.results():
+            label = '  ' * record['depth'] + record['name']
+            peak = f"{record['peak_bytes'] / 2 ** 20:>10.1f}" if record['peak_bytes'] is not None else f"{'-':>10}"
+            lines.append(f"{label:<32}{record['calls']:>10}{record['seconds']:>10.3f}{record['share']:>8.1%}{peak}")
+        total = f"{'total (wall)':<32}{'':>10}{self._wall:>10.3f}{'':>8}"
+        total += f"{self._peak / 2 ** 20:>10.1f}" if self.memory else f"{'-':>10}"
+        lines.append(total)
+        return '\n'.join(lines)
+
+    def report(self) -> Dict[str, Any]:
+        """Machine-readable form of the run, as written to ``--profile-report``."""
+        return {
+            'script': self.script,
+            'argv': sys.argv[1:],
+            'started': self._started_at,
+            'wall_seconds': self._wall,
+            'memory_traced': self.memory,
+            'peak_bytes': self._peak if self.memory else None,
+            'cprofile': self.options.cprofile if self.options else None,
+            'stages': self.results(),
+        }
+
+    def finish(self) -> None:
+        """Stop profiling, print the summary to stderr and write the reports."""
+        if not self.enabled:
+            return
+        self.stop()
+        print(f"Profile of {self.script}:", file=sys.stderr)
+        print(self.format_table(), file=sys.stderr)
+        report_path = self.options.report or f"{self.script}.profile.json"
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"Profile report written to {report_path}", file=sys.stderr)
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(self.options.cprofile)
+            print(f"cProfile statistics written to {self.options.cprofile}", file=sys.stderr)
+
+
+NULL_PROFILER = StageProfiler()
+
+
+def add_profile_arguments(parser) -> None:
+    """Add ``--profile`` and its companion flags to an ``argparse`` parser."""
+    parser.add_argument('--profile', action='store_true', help='Print wall time, calls and peak memory per stage')
+    parser.add_argument('--profile-report', help='JSON file for the --profile report (default <script>.profile.json)')
+    parser.add_argument('--profile-cprofile', help='With --profile, also dump cProfile statistics to this file')
+    parser.add_argument('--profile-no-memory', action='store_true', help='With --profile, skip tracemalloc peak memory tracking')
+
+
+def profile_options(args) -> Optional[ProfileOptions]:
+    """:class:`ProfileOptions` from parsed ``argparse`` arguments, or ``None`` without ``--profile``."""
+    if not args.profile:
+        return None
+    return ProfileOptions(args.profile_report, args.profile_cprofile, not args.profile_no_memory)
+
+
+def pop_profile_options(argv: List[str]) -> Optional[ProfileOptions]:
+    """Remove the profile flags from a ``sys.argv`` style list and return them.
+
+    For the scripts that parse ``sys.argv`` by hand.
+    """
+    values: Dict[str, Optional[str]] = {}
+    for flag in ('--profile-report', '--profile-cprofile'):
+        if flag in argv:
+            idx = argv.index(flag)
+            values[flag] = argv[idx + 1]
+            del argv[idx:idx + 2]
+    no_memory = '--profile-no-memory' in argv
+    if no_memory:
+        argv.remove('--profile-no-memory')
+    if '--profile' not in argv:
+        return None
+    argv.remove('--profile')
+    return ProfileOptions(values.get('--profile-report'), values.get('--profile-cprofile'), not no_memory)
+
+
+def start_profiler(script: str, options: Optional[ProfileOptions]) -> StageProfiler:
+    """Started :class:`StageProfiler` for ``script``, or :data:`NULL_PROFILER` when not profiling."""
+    if options is None:
+        return NULL_PROFILER
+    return StageProfiler(os.path.splitext(os.path.basename(script))[0], options).start()
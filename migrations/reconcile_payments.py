@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Reconcile the generated Pagos with the workbook, per student and month.
+
+``generate_sql_multi_mes.py`` drops fee cells it cannot turn into a
+payment (no date in the comment, a month it cannot read, a name that is
+not in the roster) and only counts them (see ``skip_metrics.py``).  This
+script checks the result student by student: for every worksheet it
+reads the fee cells once more and, in the same worker, parses the
+payments exactly as the generator does, then compares the two sides::
+
+    workbook    sum of every readable amount in the student's fee cells
+                for the month of each column
+    generated   sum of the payments the generator emits for them
+    pagos       with --pagos-export, the non-annulled rows of an export
+                of public."Pagos" for the same students, rubros and year
+
+The cells and payments are loaded into pandas DataFrames and summed with
+one ``groupby`` per side on ``(AlumnoId, MesColegiatura)``; amounts are
+compared in cents.  Amount texts are parsed once per distinct text with
+the generator's ``parse_amount``.  Every student-month where the sides
+disagree is flagged:
+
+    missing        money in the workbook, no payment generated
+    amount         payments generated, but a different total
+    extra          payments generated for a month with no workbook amount
+    not_loaded     generated but not in the Pagos export
+    pagos_only     in the Pagos export, not generated
+    pagos_amount   generated and in Pagos with a different total
+
+Names that match no roster entry are listed separately with their
+amounts.  The flags are printed; ``--output`` writes every student-month
+with its status to a CSV.  The exit status is 1 when something is
+flagged, so the check can gate a load.
+
+Usage::
+
+    python reconcile_payments.py --excel <xlsx> --csv <csv> \\
+        [--cell-range B3:B21] [--fee-cols I-T] [--rubro-id 8] \\
+        [--month <m> --year <y>] [--all-sheets | --sheets <names>] \\
+        [--infer-layout] [--streaming | --staging] \\
+        [--pagos-export <pagos.csv>] [--output <report.csv>]
+
+The workbook flags mean the same as for ``generate_sql_multi_mes.py``
+and should be given the same values as for the generation run.
+"""
+
+import argparse
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from generate_sql_multi_mes import (
+    fee_column_months,
+    open_payment_rows,
+    parse_amount,
+    resolve_fee_cols,
+    resolve_name_range,
+    sheet_jobs_from_args,
+    sheet_payment_values,
+)
+from migration_db import SOURCE_NAME
+from name_matching import DEFAULT_MIN_SCORE, MATCH_THRESHOLD_HELP, NameMatcher
+from roster import DEFAULT_CACHE_DIR, load_name_to_id_map, normalize_names
+from sheet_jobs import add_sheet_arguments, run_sheet_jobs, sheet_label, sheet_mode
+from workbook_layout import add_layout_arguments, layout_from_args
+from workbook_staging import add_staging_arguments, staging_dir_from_args
+
+KEY = ['alumno_id', 'mes']
+PAGOS_COLUMNS = ('AlumnoId', 'RubroId', 'MesColegiatura', 'AnioColegiatura', 'Monto')
+
+STATUS_OK = 'ok'
+STATUS_MISSING = 'missing'
+STATUS_AMOUNT = 'amount'
+STATUS_EXTRA = 'extra'
+STATUS_NOT_LOADED = 'not_loaded'
+STATUS_PAGOS_ONLY = 'pagos_only'
+STATUS_PAGOS_AMOUNT = 'pagos_amount'
+
+_TRUE_TEXTS = frozenset(('t', 'true', '1', 'yes', 'y'))
+
+
+def read_fee_cells(job: Dict[str, Any], shared: Dict[str, Any]) -> Dict[str, list]:
+    """Every fee cell of a sheet job's name range, as columns ``row``, ``name``, ``col``, ``value`` and ``mes``.
+
+    Rows without a name are left out, as the generator skips them;
+    ``mes`` is ``None`` for a column whose header names no month.
+    """
+    name_col_letter, fee_cols_list, start_row, end_row = job['columns']
+    layout = job['layout']
+    wb, ws, rows = open_payment_rows(
+        job['excel'], name_col_letter, fee_cols_list, start_row, end_row,
+        streaming=shared['streaming'], sheet_name=job['sheet'], staging=shared['staging'],
+    )
+    cells: Dict[str, list] = {'row': [], 'name': [], 'col': [], 'value': [], 'mes': []}
+    try:
+        column_months = fee_column_months(
+            ws, fee_cols_list,
+            layout.header_row if layout is not None else 2,
+            layout.months if layout is not None else None,
+        )
+        for row, name_val, fees in rows:
+            if not name_val:
+                continue
+            name = str(name_val)
+            for col in fee_cols_list:
+                cells['row'].append(row)
+                cells['name'].append(name)
+                cells['col'].append(col)
+                cells['value'].append(fees[col][0])
+                cells['mes'].append(column_months[col][0])
+    finally:
+        wb.close()
+    return cells
+
+
+def sheet_reconcile_values(job: Dict[str, Any], shared: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse a sheet's payments and read its fee cells inside one worker."""
+    result = sheet_payment_values(job, shared)
+    result['cells'] = {}
+    if not result['error']:
+        try:
+            result['cells'] = read_fee_cells(job, shared)
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def parse_amounts(values: pd.Series) -> np.ndarray:
+    """:func:`generate_sql_multi_mes.parse_amount` of every value, run once per distinct value.
+
+    Unreadable amounts are ``NaN``.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    parsed = [parse_amount(value) for value in uniques]
+    # The extra NaN at the end is what code -1 (an empty cell) picks up
+    table = np.array([np.nan if amount is None else amount for amount in parsed] + [np.nan], dtype='float64')
+    return table[codes]
+
+
+def to_cents(amounts: pd.Series) -> pd.Series:
+    """Amounts as whole cents (nullable integers), so totals compare exactly."""
+    return (amounts.astype('float64') * 100).round().astype('Int64')
+
+
+def workbook_frame(results: Sequence[Dict[str, Any]], name_to_id: Dict[str, int], generated: pd.DataFrame) -> pd.DataFrame:
+    """Fee cells of every sheet with their ``alumno_id``, ``mes`` and ``cents``.
+
+    Names are looked up exactly in the roster; names the generator
+    resolved otherwise (``--fuzzy-match``) take the id it used.
+    """
+    frames = [pd.DataFrame(r['cells']).assign(sheet=r['label']) for r in results if r['cells'].get('row')]
+    if not frames:
+        return pd.DataFrame(columns=['sheet', 'row', 'name', 'col', 'mes', 'name_key', 'alumno_id', 'cents'])
+    cells = pd.concat(frames, ignore_index=True)
+    cells['name_key'] = normalize_names(cells['name'])
+    alumno_id = cells['name_key'].map(name_to_id)
+    if len(generated):
+        resolved = generated.dropna(subset=['name_key']).drop_duplicates('name_key').set_index('name_key')['alumno_id']
+        alumno_id = alumno_id.fillna(cells['name_key'].map(resolved))
+    cells['alumno_id'] = alumno_id.astype('Int64')
+    cells['mes'] = pd.to_numeric(cells['mes'], errors='coerce').astype('Int64')
+    cells['cents'] = to_cents(pd.Series(parse_amounts(cells['value']), index=cells.index))
+    return cells.drop(columns='value')
+
+
+def generated_frame(results: Sequence[Dict[str, Any]]) -> pd.DataFrame:
+    """The generated payments of every sheet as ``alumno_id``, ``mes``, ``anio``, ``cents``, ``name`` and ``name_key``."""
+    payments = [values for r in results for values in r['payments']]
+    frame = pd.DataFrame.from_records(payments, columns=['AlumnoId', 'MesColegiatura', 'AnioColegiatura', 'Monto', SOURCE_NAME])
+    generated = pd.DataFrame({
+        'alumno_id': pd.to_numeric(frame['AlumnoId']).astype('Int64'),
+        'mes': pd.to_numeric(frame['MesColegiatura'], errors='coerce').astype('Int64'),
+        'anio': pd.to_numeric(frame['AnioColegiatura'], errors='coerce').astype('Int64'),
+        'cents': to_cents(pd.to_numeric(frame['Monto'])),
+        'name': frame[SOURCE_NAME],
+    })
+    generated['name_key'] = normalize_names(generated['name'].fillna(''))
+    return generated
+
+
+def read_pagos_export(
+    path: str,
+    rubro_ids: Sequence[int],
+    alumno_ids: Sequence[int],
+    years: Sequence[int],
+) -> pd.DataFrame:
+    """Non-annulled rows of a ``Pagos`` CSV export for the given rubros, students and years.
+
+    Header names are matched without quotes or case, as in
+    ``existing_pagos.py``; any extra column is ignored.  ``years``
+    empty keeps every year.
+    """
+    header = pd.read_csv(path, nrows=0, encoding='utf-8-sig').columns
+    by_name = {str(column).strip().strip('"').lower(): column for column in header}
+    try:
+        usecols = {by_name[column.lower()]: column for column in PAGOS_COLUMNS}
+    except KeyError:
+        raise ValueError(f"{path} must have the columns {', '.join(PAGOS_COLUMNS)}") from None
+    anulado = by_name.get('esanulado')
+    if anulado is not None:
+        usecols[anulado] = 'EsAnulado'
+    pagos = pd.read_csv(path, usecols=list(usecols), dtype=str, encoding='utf-8-sig').rename(columns=usecols)
+    if anulado is not None:
+        pagos = pagos[~pagos['EsAnulado'].fillna('').str.strip().str.lower().isin(_TRUE_TEXTS)]
+    frame = pd.DataFrame({
+        'alumno_id': pd.to_numeric(pagos['AlumnoId']).astype('Int64'),
+        'rubro_id': pd.to_numeric(pagos['RubroId']).astype('Int64'),
+        'mes': pd.to_numeric(pagos['MesColegiatura'], errors='coerce').astype('Int64'),
+        'anio': pd.to_numeric(pagos['AnioColegiatura'], errors='coerce').astype('Int64'),
+        'cents': to_cents(pd.to_numeric(pagos['Monto'])),
+    })
+    keep = frame['rubro_id'].isin(rubro_ids) & frame['alumno_id'].isin(alumno_ids)
+    if len(years):
+        keep &= frame['anio'].isin(years)
+    return frame.loc[keep.fillna(False), KEY + ['cents']]
+
+
+def reconcile(workbook: pd.DataFrame, generated: pd.DataFrame, pagos: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """One row per ``(alumno_id, mes)`` with the totals of every side, the differences and a status.
+
+    Amounts in the result are in quetzales; the comparison is done in cents.
+    """
+    known = workbook.dropna(subset=['alumno_id', 'mes', 'cents'])
+    sides = [
+        known.groupby(KEY).agg(name=('name', 'first'), workbook=('cents', 'sum'), cells=('cents', 'size')),
+        generated.groupby(KEY).agg(generated_name=('name', 'first'), generated=('cents', 'sum'), payments=('cents', 'size')),
+    ]
+    if pagos is not None:
+        sides.append(pagos.groupby(KEY).agg(pagos=('cents', 'sum'), pagos_rows=('cents', 'size')))
+    report = pd.concat(sides, axis=1, join='outer')
+    report['name'] = report['name'].fillna(report.pop('generated_name'))
+    counts = ['workbook', 'generated', 'cells', 'payments'] + (['pagos', 'pagos_rows'] if pagos is not None else [])
+    report[counts] = report[counts].fillna(0).astype('int64')
+
+    wb_cents = report['workbook'].to_numpy()
+    gen_cents = report['generated'].to_numpy()
+    conditions = [
+        (wb_cents != gen_cents) & (gen_cents == 0),
+        (wb_cents != gen_cents) & (wb_cents == 0),
+        wb_cents != gen_cents,
+    ]
+    choices = [STATUS_MISSING, STATUS_EXTRA, STATUS_AMOUNT]
+    report['difference'] = (gen_cents - wb_cents) / 100
+    if pagos is not None:
+        pagos_cents = report['pagos'].to_numpy()
+        conditions += [
+            (pagos_cents != gen_cents) & (pagos_cents == 0),
+            (pagos_cents != gen_cents) & (gen_cents == 0),
+            pagos_cents != gen_cents,
+        ]
+        choices += [STATUS_NOT_LOADED, STATUS_PAGOS_ONLY, STATUS_PAGOS_AMOUNT]
+        report['pagos_difference'] = (pagos_cents - gen_cents) / 100
+        report['pagos'] = pagos_cents / 100
+    report['status'] = np.select(conditions, choices, default=STATUS_OK)
+    report['workbook'] = wb_cents / 100
+    report['generated'] = gen_cents / 100
+    return report.reset_index()
+
+
+def unmatched_names(workbook: pd.DataFrame) -> pd.DataFrame:
+    """Names with readable amounts but no ``alumno_id``, with their cells and total."""
+    unknown = workbook[workbook['alumno_id'].isna() & workbook['cents'].notna()]
+    summary = unknown.groupby(['sheet', 'name']).agg(cells=('cents', 'size'), total=('cents', 'sum'))
+    summary['total'] = summary['total'].astype('int64') / 100
+    return summary.sort_values('total', ascending=False).reset_index()
+
+
+def reconcile_jobs(args) -> List[Dict[str, Any]]:
+    """The sheet jobs of the flags: every selected sheet, or the active one."""
+    if sheet_mode(args):
+        return sheet_jobs_from_args(args)
+    layout = layout_from_args(args, args.excel)
+    if layout is not None:
+        print(f"Layout of {args.excel}: {layout.describe()}")
+    try:
+        name_col_letter, start_row, end_row = resolve_name_range(args.cell_range, layout)
+    except ValueError:
+        raise ValueError(f"Invalid cell range '{args.cell_range}'.") from None
+    try:
+        fee_cols_list = resolve_fee_cols(args.fee_cols, name_col_letter, layout)
+    except ValueError:
+        raise ValueError(f"Invalid fee column specification '{args.fee_cols}'.") from None
+    return [{
+        'excel': args.excel,
+        'sheet': None,
+        'label': sheet_label(args.excel, None),
+        'rubro_id': args.rubro_id,
+        'month': args.month,
+        'year': args.year,
+        'columns': (name_col_letter, fee_cols_list, start_row, end_row),
+        'layout': layout,
+    }]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare the Pagos generated from a workbook with its fee cells (and a Pagos export), per student and month.')
+    parser.add_argument('--excel', required=True, help='Path to the Excel workbook (xlsx)')
+    parser.add_argument('--csv', required=True, help='Path to the CSV file with student IDs and names')
+    parser.add_argument('--rubro-id', type=int, default=8, help='RubroId of the generated payments')
+    parser.add_argument('--month', type=int, help='Fallback month (1-12) for dates missing in comments, as given to the generator')
+    parser.add_argument('--year', type=int, help='Fallback year for dates missing in comments, as given to the generator')
+    parser.add_argument('--cell-range', default=None, help='Range of name cells (default B3:B21, or inferred with --infer-layout)')
+    parser.add_argument('--fee-cols', default=None, help='Range of fee columns (e.g. J-L) or single column (J)')
+    parser.add_argument('--streaming', action='store_true', help='Read the workbook read-only in a single pass over the name/fee columns')
+    parser.add_argument('--fuzzy-match', action='store_true', help='Resolve names without an exact roster match, as the generator does')
+    parser.add_argument('--match-threshold', type=float, default=DEFAULT_MIN_SCORE, help=MATCH_THRESHOLD_HELP)
+    parser.add_argument('--roster-cache', default=DEFAULT_CACHE_DIR, help='Directory (relative to the CSV) for the cached name -> Id index')
+    parser.add_argument('--no-roster-cache', action='store_true', help='Always re-read the CSV instead of using the roster cache')
+    parser.add_argument('--pagos-export', help='CSV export of public."Pagos" to compare the generated payments with')
+    parser.add_argument('--output', help='Write every student-month with its totals and status to this CSV')
+    parser.add_argument('--show', type=int, default=20, help='Flagged student-months and unmatched names to print (0 = all)')
+    add_sheet_arguments(parser)
+    add_layout_arguments(parser)
+    add_staging_arguments(parser)
+    args = parser.parse_args()
+    if args.sheet_config and not sheet_mode(args):
+        parser.error('--sheet-config requires --all-sheets or --sheets')
+
+    start = time.perf_counter()
+    name_to_id = load_name_to_id_map(args.csv, None if args.no_roster_cache else args.roster_cache)
+    matcher = NameMatcher(name_to_id, min_score=args.match_threshold) if args.fuzzy_match else None
+    try:
+        jobs = reconcile_jobs(args)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    shared = {
+        'name_to_id': name_to_id,
+        'matcher': matcher,
+        'streaming': args.streaming,
+        'staging': staging_dir_from_args(args),
+        'source_cells': True,
+        'profile': None,
+    }
+    results = []
+    for result in run_sheet_jobs(sheet_reconcile_values, jobs, shared, args.workers):
+        status = result['error'] or f"{len(result['cells'].get('row', []))} fee cells, {len(result['payments'])} payments"
+        print(f"{result['label']}: {status} ({result['seconds']:.2f}s)")
+        results.append(result)
+    failed = [r for r in results if r['error']]
+    results = [r for r in results if not r['error']]
+    read_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    generated = generated_frame(results)
+    workbook = workbook_frame(results, name_to_id, generated)
+    pagos = None
+    if args.pagos_export:
+        alumno_ids = pd.concat([workbook['alumno_id'], generated['alumno_id']]).dropna().unique()
+        try:
+            pagos = read_pagos_export(
+                args.pagos_export,
+                sorted({job['rubro_id'] for job in jobs}),
+                alumno_ids,
+                generated['anio'].dropna().unique(),
+            )
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    report = reconcile(workbook, generated, pagos)
+    unmatched = unmatched_names(workbook)
+    compare_seconds = time.perf_counter() - start
+
+    flagged = report[report['status'] != STATUS_OK]
+    no_month = int((workbook['mes'].isna() & workbook['cents'].notna()).sum())
+    print(
+        f"Compared {len(report)} student-months of {report['alumno_id'].nunique()} students "
+        f"in {compare_seconds:.2f}s (read in {read_seconds:.2f}s)"
+    )
+    totals = f"workbook Q{report['workbook'].sum():,.2f}, generated Q{report['generated'].sum():,.2f}"
+    if pagos is not None:
+        totals += f", Pagos Q{report['pagos'].sum():,.2f}"
+    print(f"Totals: {totals}")
+    show = None if args.show == 0 else args.show
+    if len(flagged):
+        counts = ', '.join(f"{count} {status}" for status, count in flagged['status'].value_counts().items())
+        print(f"{len(flagged)} student-months differ ({counts}):")
+        differences = [column for column in ('difference', 'pagos_difference') if column in flagged]
+        size = flagged[differences].abs().max(axis=1)
+        order = flagged.assign(size=size).sort_values('size', ascending=False).drop(columns='size')
+        print(order.head(show).to_string(index=False))
+    else:
+        print('Every student-month matches.')
+    if len(unmatched):
+        print(f"{len(unmatched)} names are not in the roster (Q{unmatched['total'].sum():,.2f} in {unmatched['cells'].sum()} cells):")
+        print(unmatched.head(show).to_string(index=False))
+    if no_month:
+        print(f"{no_month} fee cells with an amount are in columns whose header names no month")
+    if failed:
+        print(f"{len(failed)} of {len(jobs)} sheets failed: {', '.join(r['label'] for r in failed)}")
+    if args.output:
+        report.to_csv(args.output, index=False)
+        print(f"Report saved to: {args.output}")
+    if len(flagged) or len(unmatched) or failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
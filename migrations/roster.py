@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Vectorised loading of the ``data-*.csv`` student roster.
+
+Every Pagos generator resolves workbook names through
+``build_name_to_id_map``, which used to read the whole export with
+``pd.read_csv`` and then walk it with ``DataFrame.iterrows()``, calling
+``normalize_name`` once per row.  ``iterrows`` builds a new ``Series``
+for every row, which makes it the slowest way to traverse a frame.
+
+This module loads the roster column-wise instead:
+
+1. only the ``Id`` and ``NombreCompleto`` columns are parsed, with
+   explicit dtypes so pandas does not sniff every column;
+2. the names are normalised with pandas string methods applied to the
+   whole column.  The steps are the ones ``normalize_name`` performs
+   (strip, upper-case, fold accents with ``accents.fold_accents``,
+   remove ``.``/``,``, collapse whitespace), so both produce identical
+   keys;
+3. normalised names shared by different ``Id`` values are found in a
+   single ``duplicated`` pass rather than discovered one overwrite at a
+   time.
+
+As before, when a normalised name appears more than once the last row
+of the CSV wins.
+
+The finished index can also be kept on disk (see
+:func:`load_name_to_id_map`).  Cache files are keyed by the SHA-256 of
+the CSV bytes, so a re-exported roster is picked up automatically, and
+store the names and Ids as a ``marshal`` blob plus a packed ``int64``
+array.  Loading one takes a few milliseconds instead of re-reading and
+re-normalising the export on every run.
+"""
+
+import glob
+import marshal
+import os
+import re
+import sys
+import tempfile
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from accents import fold_accents
+from file_digest import file_digest
+
+ROSTER_COLUMNS = ['Id', 'NombreCompleto']
+NORMALIZED_COLUMN = 'NombreNormalizado'
+
+# Bump when the normalisation or the cache layout changes so that
+# existing cache files are ignored.
+ROSTER_CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = '.roster-cache'
+_CACHE_MAGIC = b'ROSTERIDX'
+_CACHE_SUFFIX = '.roster'
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_names(names: pd.Series) -> pd.Series:
+    """Normalise a column of names the way ``normalize_name`` does.
+
+    Parameters
+    ----------
+    names: pd.Series
+        Raw ``NombreCompleto`` values (strings).
+
+    Returns
+    -------
+    pd.Series
+        The normalised names, index-aligned with ``names``.
+    """
+    s = names.str.strip().str.upper().map(fold_accents)
+    s = s.str.replace(r'[.,]', '', regex=True)
+    return s.str.replace(_WHITESPACE_RE, ' ', regex=True)
+
+
+def load_roster(csv_path: str) -> pd.DataFrame:
+    """Read the roster export and add the normalised name column.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path to the CSV file containing student IDs and names.
+
+    Returns
+    -------
+    pd.DataFrame
+        ``Id``, ``NombreCompleto`` and ``NombreNormalizado`` columns in
+        file order.  Rows without a name are dropped.
+    """
+    df = pd.read_csv(
+        csv_path,
+        usecols=ROSTER_COLUMNS,
+        dtype={'Id': 'int64', 'NombreCompleto': str},
+        keep_default_na=False,
+        na_values={'NombreCompleto': ['']},
+    )
+    df = df[df['NombreCompleto'].notna()].reset_index(drop=True)
+    df[NORMALIZED_COLUMN] = normalize_names(df['NombreCompleto'])
+    return df
+
+
+def find_duplicate_names(roster: pd.DataFrame) -> pd.DataFrame:
+    """Return the roster rows whose normalised name maps to several Ids.
+
+    Rows repeating the same name *and* ``Id`` are not conflicts and are
+    left out.  The result is sorted by normalised name, then file order.
+    """
+    unique = roster.drop_duplicates([NORMALIZED_COLUMN, 'Id'])
+    shared = unique[unique.duplicated(NORMALIZED_COLUMN, keep=False)]
+    return shared.sort_values(NORMALIZED_COLUMN, kind='stable')
+
+
+def roster_name_to_id(roster: pd.DataFrame) -> Dict[str, int]:
+    """Map every normalised name to its ``Id`` (the last row wins)."""
+    return dict(zip(roster[NORMALIZED_COLUMN].tolist(), roster['Id'].tolist()))
+
+
+def _duplicate_report(roster: pd.DataFrame) -> List[Tuple[str, List[int]]]:
+    duplicates = find_duplicate_names(roster)
+    return [
+        (name, ids.tolist())
+        for name, ids in duplicates.groupby(NORMALIZED_COLUMN, sort=False)['Id']
+    ]
+
+
+def _warn_duplicates(csv_path: str, report: List[Tuple[str, List[int]]]) -> None:
+    if not report:
+        return
+    print(f"Warning: {len(report)} names in {csv_path} map to more than one Id; the last row is used:")
+    for name, ids in report:
+        print(f"  {name}: {', '.join(str(i) for i in ids)}")
+
+
+def build_name_to_id_map(csv_path: str, warn_duplicates: bool = True) -> Dict[str, int]:
+    """Build the normalised name to ``Id`` mapping used by the generators.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path to the CSV file containing student IDs and names.
+    warn_duplicates: bool
+        Print the names that map to more than one ``Id``.
+
+    Returns
+    -------
+    Dict[str, int]
+        A dictionary mapping normalised names to their ``Id``.
+    """
+    roster = load_roster(csv_path)
+    if warn_duplicates:
+        _warn_duplicates(csv_path, _duplicate_report(roster))
+    return roster_name_to_id(roster)
+
+
+def _cache_prefix(csv_path: str) -> str:
+    return os.path.splitext(os.path.basename(csv_path))[0] + '-'
+
+
+def roster_cache_path(csv_path: str, cache_dir: str) -> str:
+    """Path of the cache file for the current contents of ``csv_path``."""
+    return os.path.join(cache_dir, f"{_cache_prefix(csv_path)}{file_digest(csv_path)[:32]}{_CACHE_SUFFIX}")
+
+
+def _cache_header() -> bytes:
+    # marshal's format is tied to the interpreter version
+    return _CACHE_MAGIC + bytes((ROSTER_CACHE_VERSION, sys.version_info[0], sys.version_info[1]))
+
+
+def _read_cache(path: str) -> Optional[Tuple[Dict[str, int], List[Tuple[str, List[int]]]]]:
+    header = _cache_header()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(header):
+            return None
+        names, packed_ids, report = marshal.loads(data[len(header):])
+        ids = array('q')
+        ids.frombytes(packed_ids)
+        if len(ids) != len(names):
+            return None
+        return dict(zip(names, ids.tolist())), [(name, list(dup)) for name, dup in report]
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _write_cache(path: str, name_to_id: Dict[str, int], report: List[Tuple[str, List[int]]]) -> None:
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    payload = marshal.dumps((
+        list(name_to_id.keys()),
+        array('q', name_to_id.values()).tobytes(),
+        [(name, tuple(dup)) for name, dup in report],
+    ))
+    # Write to a temporary file first so a concurrent run never reads a
+    # half-written cache, then drop the entries of older exports.
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_cache_header())
+        f.write(payload)
+    os.replace(tmp_path, path)
+    prefix = path[:-len(_CACHE_SUFFIX) - 32]
+    for stale in glob.glob(glob.escape(prefix) + '?' * 32 + _CACHE_SUFFIX):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def load_name_to_id_map(
+    csv_path: str,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+    warn_duplicates: bool = True,
+) -> Dict[str, int]:
+    """Return the name to ``Id`` mapping, using the on-disk cache if possible.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path to the CSV file containing student IDs and names.
+    cache_dir: Optional[str]
+        Directory holding the cache files.  Relative paths are resolved
+        against the CSV's directory.  ``None`` disables caching and is the
+        same as :func:`build_name_to_id_map`.
+    warn_duplicates: bool
+        Print the names that map to more than one ``Id`` (the report is
+        stored in the cache, so it is repeated on cached runs).
+
+    Returns
+    -------
+    Dict[str, int]
+        A dictionary mapping normalised names to their ``Id``.
+    """
+    if cache_dir is None:
+        return build_name_to_id_map(csv_path, warn_duplicates)
+    if not os.path.isabs(cache_dir):
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), cache_dir)
+    path = roster_cache_path(csv_path, cache_dir)
+    cached = _read_cache(path)
+    if cached is None:
+        roster = load_roster(csv_path)
+        name_to_id = roster_name_to_id(roster)
+        report = _duplicate_report(roster)
+        try:
+            _write_cache(path, name_to_id, report)
+        except OSError as e:
+            print(f"Warning: could not write roster cache {path}: {e}")
+    else:
+        name_to_id, report = cached
+    if warn_duplicates:
+        _warn_duplicates(csv_path, report)
+    return name_to_id
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Process several worksheets of one workbook in parallel.
+
+The finance workbooks keep one tab per grade/section, while the Pagos
+generators read only the active sheet, so every tab used to be saved as
+a file of its own first.  ``generate_sql_openai_v4.py`` and
+``generate_sql_multi_mes.py`` accept::
+
+    --all-sheets                every worksheet of the workbook
+    --sheets "Primero*,Kinder A"  the sheets matching any of these names
+                                or shell-style patterns
+    --sheet-config <file.csv>   per-sheet cell range, fee columns, rubro
+                                and fallback month/year
+    --workers <n>               worker processes (default: one per CPU)
+
+The sheet config is a CSV with a header row; only ``sheet`` is
+required and empty cells fall back to the command-line values::
+
+    sheet,cell_range,fee_col,fee_cols,rubro_id,month,year
+    Primero*,B3:B40,,I-T,8,,
+    Kinder A,B3:B21,J,,17,,
+
+``sheet`` may be a pattern; the first matching row applies.  Each
+selected sheet becomes a job that a worker process runs on its own:
+opening the workbook, reading the sheet and parsing its payments.  With
+``--streaming`` a worker only reads its own sheet's XML, which is what
+makes many workers pay off; without it every worker loads the whole
+workbook.  The roster and matcher are sent to each worker once.
+
+:func:`run_sheet_jobs` returns the results in workbook sheet order no
+matter which worker finishes first, and the parent renders, filters and
+writes them in that order, so the output is deterministic.
+"""
+
+import csv
+import fnmatch
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from profiling import NULL_PROFILER, StageProfiler
+from skip_metrics import GenerationMetrics
+from workbook_staging import staged_sheet_names
+from workbook_stream import list_sheet_names
+
+# Config columns read as integers
+_INT_SETTINGS = ('rubro_id', 'month', 'year')
+
+# Objects every worker needs (roster, matcher, options), set once per process
+_shared: Dict[str, Any] = {}
+
+
+def select_sheets(excel_path: str, patterns: Optional[str] = None, staging: Optional[str] = None) -> List[str]:
+    """Sheets of ``excel_path`` in workbook order, filtered by comma-separated patterns.
+
+    ``None`` selects every sheet.  With a ``staging`` directory the names
+    come from the workbook's staging file when it is up to date, so a
+    staged workbook is not opened.  Raises ``ValueError`` when a pattern
+    matches no sheet, which is almost always a typo.
+    """
+    names = staged_sheet_names(excel_path, staging) if staging is not None else None
+    if names is None:
+        names = list_sheet_names(excel_path)
+    if patterns is None:
+        return names
+    wanted = [p.strip() for p in patterns.split(',') if p.strip()]
+    unmatched = [p for p in wanted if not any(fnmatch.fnmatchcase(name, p) for name in names)]
+    if unmatched:
+        raise ValueError(f"No sheet of {os.path.basename(excel_path)} matches {', '.join(unmatched)}; sheets: {', '.join(names)}")
+    return [name for name in names if any(fnmatch.fnmatchcase(name, p) for p in wanted)]
+
+
+def load_sheet_config(path: str) -> List[Dict[str, str]]:
+    """Read the per-sheet settings CSV; blank cells are dropped."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = []
+        for entry in csv.DictReader(f):
+            settings = {key.strip(): value.strip() for key, value in entry.items() if key and value and value.strip()}
+            if settings.get('sheet'):
+                rows.append(settings)
+    return rows
+
+
+def sheet_settings(sheet: str, config: List[Dict[str, str]]) -> Dict[str, str]:
+    """Settings of the first config row whose ``sheet`` pattern matches ``sheet``."""
+    for settings in config:
+        if fnmatch.fnmatchcase(sheet, settings['sheet']):
+            return settings
+    return {}
+
+
+def sheet_label(excel_path: str, sheet: Optional[str]) -> str:
+    """``Pagos.xlsx [Primero A]``, as used in metrics and the ledger."""
+    base = os.path.basename(excel_path)
+    return base if sheet is None else f"{base} [{sheet}]"
+
+
+def build_sheet_jobs(
+    excel_path: str,
+    patterns: Optional[str],
+    config_path: Optional[str],
+    defaults: Dict[str, Any],
+    staging: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """One job per selected sheet: ``defaults`` overridden by the sheet's config row.
+
+    Only the keys present in ``defaults`` are taken from the config, so
+    each generator picks the columns it understands (``fee_col`` or
+    ``fee_cols``).  Every job also carries ``excel``, ``sheet`` and
+    ``label``.  ``staging`` is passed on to :func:`select_sheets`.
+    """
+    config = load_sheet_config(config_path) if config_path else []
+    jobs = []
+    for sheet in select_sheets(excel_path, patterns, staging):
+        job = dict(defaults, excel=excel_path, sheet=sheet, label=sheet_label(excel_path, sheet))
+        for key, value in sheet_settings(sheet, config).items():
+            if key not in defaults:
+                continue
+            try:
+                job[key] = int(value) if key in _INT_SETTINGS else value
+            except ValueError:
+                raise ValueError(f"{config_path}: invalid {key} {value!r} for sheet {sheet!r}") from None
+        jobs.append(job)
+    return jobs
+
+
+def collect_sheet_payments(
+    job: Dict[str, Any],
+    shared: Dict[str, Any],
+    payments: Callable[[StageProfiler, GenerationMetrics], Iterable[Dict[str, str]]],
+) -> Dict[str, Any]:
+    """Run ``payments(profiler, metrics)`` for one job inside a worker.
+
+    The result holds the payments as a list plus the skip counters,
+    the profile records (when ``shared['profile']`` is set) and the
+    error of a sheet that failed, so one bad sheet does not stop the
+    others.
+    """
+    start = time.perf_counter()
+    result = {
+        'excel': job['excel'], 'sheet': job['sheet'], 'label': job['label'], 'rubro_id': job.get('rubro_id', 0),
+        'payments': [], 'error': '', 'profile': [], 'metrics': [],
+    }
+    metrics = GenerationMetrics()
+    profiler = StageProfiler('sheet', shared['profile']).start() if shared.get('profile') else NULL_PROFILER
+    try:
+        result['payments'] = list(payments(profiler, metrics))
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    if profiler.enabled:
+        profiler.stop()
+        result['profile'] = profiler.results()
+    result['metrics'] = metrics.workbooks
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def _init_worker(shared: Dict[str, Any]) -> None:
+    _shared.update(shared)
+
+
+def _call(func: Callable, job: Dict[str, Any]) -> Dict[str, Any]:
+    return func(job, _shared)
+
+
+def run_sheet_jobs(
+    func: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]],
+    jobs: List[Dict[str, Any]],
+    shared: Dict[str, Any],
+    workers: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield ``func(job, shared)`` for every job, in job order.
+
+    ``func`` must be a module-level function so it can be sent to the
+    worker processes; ``shared`` is pickled once per worker.  With a
+    single job or ``workers == 1`` everything runs in this process.
+    Results are yielded as soon as they are next in order, so the
+    caller can write the first sheet while later ones are still parsed.
+    """
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield func(job, shared)
+        return
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+        yield from pool.map(_call, [func] * len(jobs), jobs)
+
+
+def iter_sheet_payments(
+    results: Iterable[Dict[str, Any]],
+    metrics: GenerationMetrics,
+    profiler: StageProfiler = NULL_PROFILER,
+    existing=None,
+    ledger=None,
+    failed: Optional[List[Dict[str, Any]]] = None,
+    ingest=None,
+) -> Iterator[Dict[str, str]]:
+    """Chain the payments of every result, in order, through the parent's filters.
+
+    Each result's counters and profile records are merged into
+    ``metrics`` and ``profiler`` as it arrives and a status line is
+    printed.  ``existing`` and ``ledger`` (see ``existing_pagos.py`` and
+    ``payment_ledger.py``) drop payments exactly as in a single-sheet
+    run; the ledger records the sheet label as each payment's source.
+    ``ingest`` (see ``migration_db.py``) records every sheet's payments
+    before those filters.  Results with an error yield nothing and are
+    appended to ``failed``.
+    """
+    for result in results:
+        profiler.merge(result['profile'], prefix='sheet.', depth=1)
+        for workbook_metrics in result['metrics']:
+            metrics.add(workbook_metrics)
+        status = result['error'] or f"{len(result['payments'])} payments"
+        print(f"{result['label']}: {status} ({result['seconds']:.2f}s)")
+        if result['error']:
+            if failed is not None:
+                failed.append(result)
+            continue
+        payments: Iterable[Dict[str, str]] = result['payments']
+        if ingest is not None:
+            payments = ingest.tap_payments(payments, result['excel'], result['sheet'], result['rubro_id'])
+        if existing is not None:
+            payments = existing.filter(payments)
+        if ledger is not None:
+            payments = ledger.filter(payments, source=result['label'])
+        yield from metrics.count_written(payments)
+
+
+def add_sheet_arguments(parser) -> None:
+    """Add ``--all-sheets``, ``--sheets``, ``--sheet-config`` and ``--workers`` to an ``argparse`` parser."""
+    sheets = parser.add_mutually_exclusive_group()
+    sheets.add_argument('--all-sheets', action='store_true', help='Process every worksheet instead of the active one')
+    sheets.add_argument('--sheets', help='Comma-separated sheet names or patterns (e.g. "Primero*,Kinder A")')
+    parser.add_argument('--sheet-config', help='CSV with per-sheet cell_range, fee columns, rubro_id, month and year')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for --all-sheets/--sheets (default: CPU count)')
+
+
+def sheet_mode(args) -> bool:
+    """Whether the flags ask for the multi-worksheet mode."""
+    return bool(args.all_sheets or args.sheets)
+
+
+def sheet_patterns(args) -> Optional[str]:
+    """The ``patterns`` argument of :func:`select_sheets` for the parsed flags."""
+    return None if args.all_sheets else args.sheets
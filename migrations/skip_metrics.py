@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Skip-reason counters and throughput for the Pagos generators.
+
+``generate_sql_openai_v4.py`` and ``generate_sql_multi_mes.py`` drop a
+row or a fee cell with a bare ``continue`` whenever something does not
+line up: a name that is not in the roster, an amount that cannot be
+parsed, a comment without a date, a fee column whose header is not a
+month.  The generated SQL just comes out shorter, and the only way to
+notice a bad workbook is to diff it against the last run.
+
+:class:`WorkbookMetrics` counts every one of those skips by reason and
+fee column, together with the rows read, the payments emitted and the
+elapsed time, and :class:`GenerationMetrics` collects them for all the
+workbooks of a run.  The result can be printed (``--skip-stats``),
+written as JSON (``--metrics-json``) or written in the Prometheus
+textfile-collector format (``--metrics-prom``) for node_exporter to
+pick up::
+
+    pagos_skipped_total{workbook="Pagos-SegundoPrimaria-B.xlsx",fee_column="J",reason="missing_date"} 3
+    pagos_payments_total{workbook="Pagos-SegundoPrimaria-B.xlsx",fee_column="J"} 18
+    pagos_written_total{workbook="Pagos-SegundoPrimaria-B.xlsx"} 15
+    pagos_rows_per_second{workbook="Pagos-SegundoPrimaria-B.xlsx"} 412.7
+
+Row-level skips (empty or unknown names) are reported with an empty
+``fee_column``.  ``payments`` counts what was parsed from the workbook
+and ``written`` what was left of it after the existing-Pagos and ledger
+filters, i.e. what reached the SQL file or the database.  Seconds are
+measured from opening the workbook until its last row was consumed, so
+they include the rendering done by the caller while the rows are
+streamed.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+SKIP_EMPTY_NAME = 'empty_name'
+SKIP_UNKNOWN_NAME = 'unknown_name'
+SKIP_MISSING_HEADER = 'missing_month_header'
+SKIP_UNKNOWN_MONTH = 'unknown_month'
+SKIP_EMPTY_FEE = 'empty_fee'
+SKIP_UNPARSABLE_AMOUNT = 'unparsable_amount'
+SKIP_MISSING_DATE = 'missing_date'
+SKIP_REASONS = (
+    SKIP_EMPTY_NAME,
+    SKIP_UNKNOWN_NAME,
+    SKIP_MISSING_HEADER,
+    SKIP_UNKNOWN_MONTH,
+    SKIP_EMPTY_FEE,
+    SKIP_UNPARSABLE_AMOUNT,
+    SKIP_MISSING_DATE,
+)
+
+METRIC_PREFIX = 'pagos'
+
+
+def amount_skip_reason(value) -> str:
+    """:data:`SKIP_EMPTY_FEE` for a blank fee cell, :data:`SKIP_UNPARSABLE_AMOUNT` otherwise."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return SKIP_EMPTY_FEE
+    return SKIP_UNPARSABLE_AMOUNT
+
+
+class WorkbookMetrics:
+    """Counters for one workbook (or one sheet of it).
+
+    Parameters
+    ----------
+    workbook: str
+        Label used in the reports, usually the workbook's file name.
+
+    The generators set ``sheet`` to the title of the worksheet they read
+    once the workbook is open.
+    """
+
+    def __init__(self, workbook: str):
+        self.workbook = workbook
+        self.sheet: Optional[str] = None
+        self.rows = 0
+        self.payments: Counter = Counter()
+        self.skipped: Counter = Counter()
+        self.written = 0
+        self.seconds = 0.0
+        self._start = time.perf_counter()
+
+    def skip(self, reason: str, fee_column: str = '') -> None:
+        """Count one row (``fee_column`` empty) or fee cell skipped for ``reason``."""
+        self.skipped[fee_column, reason] += 1
+
+    def emit(self, fee_column: str) -> None:
+        """Count one payment produced from ``fee_column``."""
+        self.payments[fee_column] += 1
+
+    def finish(self) -> None:
+        """Stop the clock; called once the workbook's rows are exhausted or abandoned."""
+        self.seconds = time.perf_counter() - self._start
+
+    @property
+    def total_payments(self) -> int:
+        return sum(self.payments.values())
+
+    def skipped_by_reason(self) -> Dict[str, int]:
+        totals: Counter = Counter()
+        for (_, reason), count in self.skipped.items():
+            totals[reason] += count
+        return {reason: totals[reason] for reason in SKIP_REASONS if totals[reason]}
+
+    def to_dict(self) -> Dict[str, Any]:
+        columns: Dict[str, Dict[str, Any]] = {}
+        for column in sorted({c for c in self.payments} | {c for c, _ in self.skipped if c}):
+            columns[column] = {
+                'payments': self.payments[column],
+                'skipped': {r: self.skipped[column, r] for r in SKIP_REASONS if self.skipped[column, r]},
+            }
+        return {
+            'workbook': self.workbook,
+            'rows': self.rows,
+            'payments': self.total_payments,
+            'written': self.written,
+            'seconds': self.seconds,
+            'rows_per_second': self.rows / self.seconds if self.seconds else None,
+            'payments_per_second': self.total_payments / self.seconds if self.seconds else None,
+            'skipped': self.skipped_by_reason(),
+            'row_skips': {r: self.skipped['', r] for r in SKIP_REASONS if self.skipped['', r]},
+            'fee_columns': columns,
+        }
+
+
+class GenerationMetrics:
+    """The :class:`WorkbookMetrics` of every workbook in a run, in processing order."""
+
+    def __init__(self, script: str = ''):
+        self.script = script
+        self.workbooks: List[WorkbookMetrics] = []
+
+    def workbook(self, path: str, label: Optional[str] = None) -> WorkbookMetrics:
+        """Start counting a workbook and return its :class:`WorkbookMetrics`."""
+        metrics = WorkbookMetrics(label or os.path.basename(path))
+        self.workbooks.append(metrics)
+        return metrics
+
+    def add(self, metrics: WorkbookMetrics) -> None:
+        """Add counters gathered elsewhere, e.g. in a worker process."""
+        self.workbooks.append(metrics)
+
+    def count_written(self, payments: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Yield ``payments``, counting them as written for the workbook being processed.
+
+        Wrap the payments after the existing-Pagos and ledger filters, so
+        the count only covers what reaches the output.
+        """
+        for values in payments:
+            self.workbooks[-1].written += 1
+            yield values
+
+    def totals(self) -> Dict[str, Any]:
+        skipped: Counter = Counter()
+        for wb in self.workbooks:
+            skipped.update(wb.skipped_by_reason())
+        rows = sum(wb.rows for wb in self.workbooks)
+        payments = sum(wb.total_payments for wb in self.workbooks)
+        written = sum(wb.written for wb in self.workbooks)
+        seconds = sum(wb.seconds for wb in self.workbooks)
+        return {
+            'workbooks': len(self.workbooks),
+            'rows': rows,
+            'payments': payments,
+            'written': written,
+            'seconds': seconds,
+            'rows_per_second': rows / seconds if seconds else None,
+            'skipped': {reason: skipped[reason] for reason in SKIP_REASONS if skipped[reason]},
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'script': self.script,
+            'generated': datetime.now(timezone.utc).isoformat(),
+            'argv': sys.argv[1:],
+            'totals': self.totals(),
+            'workbooks': [wb.to_dict() for wb in self.workbooks],
+        }
+
+
+def format_skip_stats(metrics: GenerationMetrics) -> str:
+    """Render one line per workbook with its payments, skips by reason and throughput."""
+    lines = [f"{'workbook':<36}{'rows':>8}{'payments':>10}{'written':>10}{'rows/s':>10}  skipped"]
+    for wb in metrics.workbooks:
+        rate = f"{wb.rows / wb.seconds:>10.0f}" if wb.seconds else f"{'-':>10}"
+        skipped = ', '.join(f"{reason} {count}" for reason, count in wb.skipped_by_reason().items()) or '-'
+        lines.append(f"{wb.workbook:<36}{wb.rows:>8}{wb.total_payments:>10}{wb.written:>10}{rate}  {skipped}")
+    return '\n'.join(lines)
+
+
+def write_metrics_json(metrics: GenerationMetrics, path: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(metrics.to_dict(), f, indent=2)
+
+
+def _label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels: str) -> str:
+    return '{' + ','.join(f'{key}="{_label_value(str(value))}"' for key, value in labels.items()) + '}'
+
+
+def format_prometheus(metrics: GenerationMetrics) -> str:
+    """Render ``metrics`` in the Prometheus text exposition format."""
+    families = [
+        ('skipped_total', 'counter', 'Rows or fee cells skipped while generating Pagos, by reason.'),
+        ('payments_total', 'counter', 'Payments parsed, by workbook and fee column, before the existing-Pagos and ledger filters.'),
+        ('written_total', 'counter', 'Payments written after the existing-Pagos and ledger filters.'),
+        ('rows_total', 'counter', 'Name rows read from the workbook.'),
+        ('generation_seconds', 'gauge', 'Seconds spent reading and generating the workbook.'),
+        ('rows_per_second', 'gauge', 'Name rows processed per second.'),
+    ]
+    samples: Dict[str, List[str]] = {name: [] for name, _, _ in families}
+    for wb in metrics.workbooks:
+        for (column, reason), count in sorted(wb.skipped.items()):
+            samples['skipped_total'].append(f"{_labels(workbook=wb.workbook, fee_column=column, reason=reason)} {count}")
+        for column, count in sorted(wb.payments.items()):
+            samples['payments_total'].append(f"{_labels(workbook=wb.workbook, fee_column=column)} {count}")
+        samples['written_total'].append(f"{_labels(workbook=wb.workbook)} {wb.written}")
+        samples['rows_total'].append(f"{_labels(workbook=wb.workbook)} {wb.rows}")
+        samples['generation_seconds'].append(f"{_labels(workbook=wb.workbook)} {wb.seconds:.6f}")
+        if wb.seconds:
+            samples['rows_per_second'].append(f"{_labels(workbook=wb.workbook)} {wb.rows / wb.seconds:.3f}")
+    lines = []
+    for name, kind, help_text in families:
+        metric = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f"{metric}{sample}" for sample in samples[name])
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus_textfile(metrics: GenerationMetrics, path: str) -> None:
+    """Write :func:`format_prometheus` atomically, as the textfile collector expects."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.prom.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus(metrics))
+        # mkstemp creates the file 0600; node_exporter usually runs as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def add_metrics_arguments(parser) -> None:
+    """Add ``--skip-stats``, ``--metrics-json`` and ``--metrics-prom`` to an ``argparse`` parser."""
+    parser.add_argument('--skip-stats', action='store_true', help='Print skipped rows/cells by reason and rows per second')
+    parser.add_argument('--metrics-json', help='Write skip counters and throughput to this JSON file')
+    parser.add_argument('--metrics-prom', help='Write skip counters and throughput in Prometheus textfile format')
+
+
+def report_metrics(metrics: GenerationMetrics, args) -> None:
+    """Print and/or write ``metrics`` as requested by :func:`add_metrics_arguments` flags."""
+    if args.skip_stats:
+        print(format_skip_stats(metrics))
+    if args.metrics_json:
+        write_metrics_json(metrics, args.metrics_json)
+        print(f"Metrics written to {args.metrics_json}")
+    if args.metrics_prom:
+        write_prometheus_textfile(metrics, args.metrics_prom)
+        print(f"Prometheus metrics written to {args.metrics_prom}")
+
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Output formats shared by the Pagos and Alumnos SQL generators.
+
+The generators historically wrote one ``INSERT INTO ... VALUES (...)``
+statement per row.  When such a file is loaded PostgreSQL parses,
+plans and (in autocommit mode) commits every statement separately,
+which dominates the load time of large migrations.
+
+:func:`format_insert_batches` groups rows into multi-row statements::
+
+    INSERT INTO public."Pagos" (...) VALUES
+    (...),
+    (...);
+
+optionally wrapping every batch in its own ``BEGIN``/``COMMIT`` so a
+failed batch does not leave a half-loaded file behind.
+
+For bulk cutovers :class:`CopyRowPlan` and :func:`format_copy_block`
+produce a ``COPY <table> (<columns>) FROM STDIN`` stream in PostgreSQL's
+text format instead.  The table and column list are taken from the
+``INSERT`` template itself, so ``insert-pago-example.sql`` stays the
+single place where the Pagos columns are declared.
+
+:class:`StatementWriter` writes the statements to disk as they are
+generated, through a large write buffer and optionally gzip or zstd
+compressed (:func:`open_sql_output`), instead of collecting them in a
+list and joining them at the end.
+"""
+
+import gzip
+import io
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from statement_render import RenderPlan
+
+
+def format_insert_batches(
+    head: str,
+    rows: Iterable[str],
+    batch_size: int,
+    transaction: bool = False,
+) -> Iterator[str]:
+    """Group value tuples into multi-row ``INSERT`` statements.
+
+    Parameters
+    ----------
+    head: str
+        Statement text up to and including the ``VALUES`` keyword,
+        e.g. ``INSERT INTO public."Pagos" (...) VALUES``.
+    rows: Iterable[str]
+        Rendered value tuples, each including its parentheses.
+    batch_size: int
+        Maximum number of rows per statement.  Values below ``1`` are
+        treated as ``1``.
+    transaction: bool
+        Wrap each statement in ``BEGIN;`` / ``COMMIT;``.
+
+    Yields
+    ------
+    str
+        One multi-row statement (or transaction block) per batch,
+        without a trailing newline.
+    """
+    batch_size = max(1, batch_size)
+    batch: List[str] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield _format_batch(head, batch, transaction)
+            batch = []
+    if batch:
+        yield _format_batch(head, batch, transaction)
+
+
+def _format_batch(head: str, batch: List[str], transaction: bool) -> str:
+    statement = f"{head}\n" + ',\n'.join(batch) + ';'
+    if transaction:
+        return f"BEGIN;\n{statement}\nCOMMIT;"
+    return statement
+
+
+# ---------------------------------------------------------------------------
+# PostgreSQL COPY text format
+# ---------------------------------------------------------------------------
+
+_INSERT_HEAD_RE = re.compile(r'INSERT\s+INTO\s+(?P<table>.+?)\s*\((?P<columns>[^)]*)\)', re.IGNORECASE | re.DOTALL)
+_NUMERIC_RE = re.compile(r'[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?')
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+COPY_NULL = '\\N'
+
+
+def parse_insert_head(head: str) -> Tuple[str, List[str]]:
+    """Return the table name and quoted column names of an ``INSERT`` head.
+
+    Parameters
+    ----------
+    head: str
+        Statement text such as ``INSERT INTO public."Pagos" ("A", "B") VALUES``.
+
+    Returns
+    -------
+    Tuple[str, List[str]]
+        ``(table, columns)`` with the identifiers exactly as written.
+    """
+    m = _INSERT_HEAD_RE.search(head)
+    if not m:
+        raise ValueError('Not an INSERT INTO <table> (<columns>) statement')
+    columns = [c.strip() for c in m.group('columns').split(',') if c.strip()]
+    return m.group('table').strip(), columns
+
+
+def split_sql_values(values_text: str) -> List[str]:
+    """Split a parenthesised ``VALUES`` tuple into its expressions.
+
+    ``--`` comments are dropped and commas inside string literals or
+    nested parentheses (e.g. ``EXTRACT(MONTH FROM CURRENT_DATE)``) do not
+    split.
+
+    Parameters
+    ----------
+    values_text: str
+        Text of the tuple, including the outer parentheses.
+
+    Returns
+    -------
+    List[str]
+        The stripped expressions, one per column.
+    """
+    items: List[str] = []
+    current: List[str] = []
+    depth = 0
+    in_quote = False
+    i = 0
+    n = len(values_text)
+    while i < n:
+        c = values_text[i]
+        if in_quote:
+            current.append(c)
+            if c == "'":
+                if i + 1 < n and values_text[i + 1] == "'":
+                    current.append("'")
+                    i += 1
+                else:
+                    in_quote = False
+        elif c == "'":
+            in_quote = True
+            current.append(c)
+        elif c == '-' and values_text.startswith('--', i):
+            newline = values_text.find('\n', i)
+            i = n if newline == -1 else newline
+            continue
+        elif c == '(':
+            depth += 1
+            if depth > 1:
+                current.append(c)
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                items.append(''.join(current).strip())
+                current = []
+            else:
+                current.append(c)
+        elif c == ',' and depth == 1:
+            items.append(''.join(current).strip())
+            current = []
+        elif depth >= 1:
+            current.append(c)
+        i += 1
+    return items
+
+
+def copy_escape(value: Optional[str]) -> str:
+    """Escape a value for the COPY text format (``None`` becomes ``\\N``)."""
+    if value is None:
+        return COPY_NULL
+    return value.translate(_COPY_ESCAPES)
+
+
+def sql_literal_to_copy(expr: str, now: datetime) -> Optional[str]:
+    """Convert a SQL literal from the generated statements to its COPY value.
+
+    Handles the literals the generators emit: ``NULL``, quoted strings,
+    numbers, booleans and the ``CURRENT_TIMESTAMP``/``CURRENT_DATE``
+    keywords (which COPY cannot evaluate, so ``now`` is used instead).
+
+    Parameters
+    ----------
+    expr: str
+        A single SQL expression as written in a ``VALUES`` tuple.
+    now: datetime
+        Timestamp standing in for ``CURRENT_TIMESTAMP``.
+
+    Returns
+    -------
+    Optional[str]
+        The unescaped value, or ``None`` for SQL ``NULL``.
+
+    Raises
+    ------
+    ValueError
+        If the expression is not one of the supported literals.
+    """
+    s = expr.strip()
+    upper = s.upper()
+    if upper == 'NULL':
+        return None
+    if len(s) >= 2 and s[0] == "'" and s[-1] == "'":
+        return s[1:-1].replace("''", "'")
+    if upper in ('TRUE', 'FALSE'):
+        return 't' if upper == 'TRUE' else 'f'
+    if upper in ('CURRENT_TIMESTAMP', 'NOW()'):
+        return now.isoformat()
+    if upper == 'CURRENT_DATE':
+        return now.date().isoformat()
+    if _NUMERIC_RE.fullmatch(s):
+        return s
+    raise ValueError(f"Cannot express {expr!r} in COPY format")
+
+
+def format_copy_row(values: Sequence[Optional[str]]) -> str:
+    """Render one row of the COPY text format (tab separated, escaped)."""
+    return '\t'.join([copy_escape(v) for v in values])
+
+
+# Ends the data of a COPY ... FROM STDIN block
+COPY_TERMINATOR = '\\.'
+
+
+def format_copy_block(table: str, columns: Sequence[str], rows: Iterable[str]) -> str:
+    """Build a complete ``COPY ... FROM STDIN`` block for ``psql``.
+
+    Parameters
+    ----------
+    table: str
+        Target table, e.g. ``public."Pagos"``.
+    columns: Sequence[str]
+        Quoted column names in the order of the row values.
+    rows: Iterable[str]
+        Rows already rendered with :func:`format_copy_row`.
+
+    Returns
+    -------
+    str
+        The ``COPY`` command, the data rows and the ``\\.`` terminator.
+    """
+    lines = [copy_command(table, columns)]
+    lines.extend(rows)
+    lines.append(COPY_TERMINATOR)
+    return '\n'.join(lines)
+
+
+def copy_command(table: str, columns: Sequence[str]) -> str:
+    """The ``COPY ... FROM STDIN;`` line that opens a COPY block."""
+    return f"COPY {table} ({', '.join(columns)}) FROM STDIN;"
+
+
+def iter_copy_lines(table: str, columns: Sequence[str], rows: Iterable[str]) -> Iterator[str]:
+    """Yield the lines of :func:`format_copy_block` as ``rows`` produces them.
+
+    The command is yielded once the first row is there, so no rows yield
+    no block at all: an empty COPY would still be sent to the server.
+    Joined with ``'\\n'`` the lines are the block.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    yield copy_command(table, columns)
+    yield first
+    yield from rows
+    yield COPY_TERMINATOR
+
+
+class CopyRowPlan:
+    """Turn template slot values into COPY rows for a compiled template.
+
+    The template's value tuple is split into one expression per column.
+    Columns without slots are converted once; columns holding a slot are
+    rendered and converted for each payment.
+
+    Parameters
+    ----------
+    plan: RenderPlan
+        Compiled ``INSERT`` template (see ``statement_render``).
+    now: datetime
+        Timestamp used for ``CURRENT_TIMESTAMP`` in the template.
+    """
+
+    def __init__(self, plan: RenderPlan, now: datetime):
+        head, row_plan = plan.split_values()
+        self.table, self.columns = parse_insert_head(head)
+        expressions = split_sql_values(row_plan.marked_text)
+        if len(expressions) != len(self.columns):
+            raise ValueError(
+                f"Template has {len(self.columns)} columns but {len(expressions)} values"
+            )
+        self.now = now
+        self._cells: List[Tuple[Optional[RenderPlan], Optional[str]]] = []
+        for expr in expressions:
+            expr_plan = RenderPlan(expr)
+            if expr_plan.slots:
+                self._cells.append((expr_plan, None))
+            else:
+                self._cells.append((None, sql_literal_to_copy(expr, now)))
+
+    def values(self, values: Dict[str, str]) -> List[Optional[str]]:
+        """Unescaped column values of one row, as loaded by ``pg_loader``."""
+        now = self.now
+        return [
+            sql_literal_to_copy(expr_plan.render(values), now) if expr_plan is not None else const
+            for expr_plan, const in self._cells
+        ]
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Render one COPY data row from :func:`statement_values` output."""
+        return format_copy_row(self.values(values))
+
+    def lines(self, rows: Iterable[str]) -> Iterator[str]:
+        """The ``COPY ... FROM STDIN`` block around rendered rows, line by line (see :func:`iter_copy_lines`)."""
+        return iter_copy_lines(self.table, self.columns, rows)
+
+
+# ---------------------------------------------------------------------------
+# Streaming, optionally compressed output
+# ---------------------------------------------------------------------------
+
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_WRITE_BUFFER = 1 << 20
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compression_for(path: str) -> Optional[str]:
+    """Compression implied by the file name (``.gz``/``.zst``), or ``None``."""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def compressed_name(path: str, compression: Optional[str]) -> str:
+    """``path`` with the suffix of ``compression`` appended unless already there."""
+    if compression is None or compression_for(path) == compression:
+        return path
+    return path + COMPRESSION_SUFFIXES[compression]
+
+
+def _zstd_writer(path: str):
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError('zstd output needs the zstandard package: pip install zstandard') from e
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, 'wb'))
+
+
+def open_sql_output(path: str, compression: Optional[str] = None, buffer_size: int = DEFAULT_WRITE_BUFFER) -> TextIO:
+    """Open ``path`` for writing SQL text through a ``buffer_size`` byte buffer.
+
+    Parameters
+    ----------
+    path: str
+        Output file.
+    compression: Optional[str]
+        ``'gzip'``, ``'zstd'`` or ``None``; ``None`` infers it from the
+        ``.gz``/``.zst`` suffix of ``path`` and otherwise writes plain
+        text exactly as ``open(path, 'w', encoding='utf-8')`` would.
+    buffer_size: int
+        Bytes collected before each write to the file or the compressor.
+
+    Returns
+    -------
+    TextIO
+        A text stream; closing it finishes the compressed frame.
+    """
+    if compression is None:
+        compression = compression_for(path)
+    if compression is None:
+        return open(path, 'w', encoding='utf-8', buffering=buffer_size)
+    if compression == 'gzip':
+        # mtime=0 keeps the output reproducible from run to run
+        stream = gzip.GzipFile(path, 'wb', compresslevel=GZIP_LEVEL, mtime=0)
+    elif compression == 'zstd':
+        stream = _zstd_writer(path)
+    else:
+        raise ValueError(f"Unknown compression {compression!r}; expected one of {', '.join(COMPRESSION_SUFFIXES)}")
+    return io.TextIOWrapper(io.BufferedWriter(stream, buffer_size), encoding='utf-8')
+
+
+class StatementWriter:
+    """Write statements to a file as they are produced, separated by a blank line.
+
+    The bytes are the same as ``'\\n\\n'.join(statements)`` written at
+    once, but only the write buffer is held in memory, and a run that
+    fails half-way leaves the statements produced so far on disk.  The
+    file is created with the first statement, so a run that produces
+    none writes no file, as before.
+
+    Parameters
+    ----------
+    path: str
+        Output file.
+    compression: Optional[str]
+        See :func:`open_sql_output`.
+    buffer_size: int
+        See :func:`open_sql_output`.
+    separator: Optional[str]
+        Written between statements instead of a blank line, e.g.
+        ``'\\n'`` for the lines of a COPY block (see :func:`iter_copy_lines`).
+    """
+
+    separator = '\n\n'
+
+    def __init__(
+        self,
+        path: str,
+        compression: Optional[str] = None,
+        buffer_size: int = DEFAULT_WRITE_BUFFER,
+        separator: Optional[str] = None,
+    ):
+        self.path = path
+        if separator is not None:
+            self.separator = separator
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.count = 0
+        self.rows = 0
+        self._file: Optional[TextIO] = None
+
+    def __enter__(self) -> 'StatementWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write(self, statement: str, rows: int = 1) -> None:
+        """Write one statement holding ``rows`` rows (more than one for batched INSERTs)."""
+        if self._file is None:
+            self._file = open_sql_output(self.path, self.compression, self.buffer_size)
+        else:
+            self._file.write(self.separator)
+        self._file.write(statement)
+        self.count += 1
+        self.rows += rows
+
+    def write_all(self, statements: Iterable[str]) -> int:
+        """Write every statement of ``statements`` and return the running count."""
+        write = self.write
+        for statement in statements:
+            write(statement)
+        return self.count
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def size(self) -> int:
+        """Bytes on disk once closed (compressed size for ``.gz``/``.zst``)."""
+        return os.path.getsize(self.path) if self.count else 0
+
+
+class RowCounter:
+    """Count the rows pulled through :meth:`wrap`.
+
+    The statement generators consume their rows lazily, so the rows a
+    statement holds are the ones pulled since the previous statement was
+    yielded; :meth:`take` returns that number.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._taken = 0
+
+    def wrap(self, rows: Iterable) -> Iterator:
+        for row in rows:
+            self.total += 1
+            yield row
+
+    def take(self) -> int:
+        """Rows counted since the last call."""
+        count = self.total - self._taken
+        self._taken = self.total
+        return count
+
+
+def add_output_arguments(parser) -> None:
+    """Add ``--compress`` and ``--write-buffer`` to an ``argparse`` parser."""
+    parser.add_argument(
+        '--compress',
+        choices=sorted(COMPRESSION_SUFFIXES),
+        help='Compress the SQL output (.sql.gz with gzip, .sql.zst with zstd, which needs the zstandard package)',
+    )
+    parser.add_argument(
+        '--write-buffer',
+        type=int,
+        default=DEFAULT_WRITE_BUFFER,
+        help=f'Bytes buffered before each write of the SQL output (default {DEFAULT_WRITE_BUFFER})',
+    )
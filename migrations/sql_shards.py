@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Split the Pagos SQL output into shards that load in parallel.
+
+A single ``{stem}.sql`` file is loaded by one ``psql`` session, one
+statement after the other.  With ``--shards <n>`` or ``--shard-size
+<size>`` the generators write the statements into several files
+instead::
+
+    Pagos-Historico.part-0001.sql
+    Pagos-Historico.part-0002.sql
+    ...
+    Pagos-Historico.shards.json
+
+Every shard is self-contained: it starts with ``BEGIN;`` and ends with
+``COMMIT;``, so a shard either loads completely or not at all, and no
+statement depends on another shard.  ``--shards <n>`` deals the
+statements out round-robin into ``n`` files of near-equal size;
+``--shard-size <size>`` (``64M``, ``500K``, ``1G`` or plain bytes)
+starts a new shard once the current one holds that much SQL text
+(counted in characters before compression).  Shards are compressed like
+the unsharded output (see ``sql_output.open_sql_output``).  When the run
+fails half-way the open shards are closed without their ``COMMIT;`` and
+no manifest is written, so nothing partial can be loaded by mistake.
+
+The manifest lists every shard with its statement and row counts (rows
+differ from statements with ``--batch-size``), its size on disk and the
+SHA-256 of the file, so a loader can check what it is about to run and
+report progress::
+
+    {
+      "source": "Pagos-Historico.xlsx",
+      "rows": 182000,
+      "shards": [
+        {"file": "Pagos-Historico.part-0001.sql", "statements": 45500,
+         "rows": 45500, "bytes": 71830211, "sha256": "..."},
+        ...
+      ]
+    }
+
+The shards can then be loaded over several connections at once, e.g.
+with ``psql -v ON_ERROR_STOP=1 -f <shard>`` per file (see
+``comandos.MD``).
+"""
+
+import argparse
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, TextIO
+
+from file_digest import file_digest
+from sql_output import COMPRESSION_SUFFIXES, DEFAULT_WRITE_BUFFER, StatementWriter, compression_for, open_sql_output
+
+SHARD_BEGIN = 'BEGIN;\n\n'
+SHARD_END = '\n\nCOMMIT;\n'
+_SIZE_RE = re.compile(r'(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>[KMG]?)(?:I?B)?', re.IGNORECASE)
+_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def parse_size(text: str) -> int:
+    """Bytes in a size such as ``64M``, ``500KB``, ``1.5G`` or ``1048576``."""
+    m = _SIZE_RE.fullmatch(text.strip())
+    if not m:
+        raise ValueError(f"Invalid size {text!r}; expected e.g. 64M, 500K or 1G")
+    return int(float(m.group('number')) * _UNITS[m.group('unit').upper()])
+
+
+def _shard_count(text: str) -> int:
+    # argparse type for --shards; 0 or less would mean "no sharding" or fail later
+    try:
+        count = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard count {text!r}") from None
+    if count <= 0:
+        raise argparse.ArgumentTypeError(f"the number of shards must be at least 1, got {count}")
+    return count
+
+
+def _shard_size(text: str) -> int:
+    # argparse type for --shard-size
+    try:
+        size = parse_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"the shard size must be positive, got {text!r}")
+    return size
+
+
+def shard_base(output_path: str) -> str:
+    """``output_path`` without its ``.sql`` and compression suffixes."""
+    compression = compression_for(output_path)
+    if compression is not None:
+        output_path = output_path[:-len(COMPRESSION_SUFFIXES[compression])]
+    stem, ext = os.path.splitext(output_path)
+    return stem if ext == '.sql' else output_path
+
+
+class _Shard:
+    __slots__ = ('path', 'file', 'statements', 'rows', 'chars')
+
+    def __init__(self, path: str, file: TextIO):
+        self.path = path
+        self.file = file
+        self.statements = 0
+        self.rows = 0
+        self.chars = 0
+
+
+class ShardedStatementWriter:
+    """Drop-in replacement for :class:`sql_output.StatementWriter` writing shards.
+
+    Parameters
+    ----------
+    output_path: str
+        The unsharded output name; the shards and the manifest are named
+        after it (``<stem>.part-0001.sql``, ``<stem>.shards.json``).
+    shards: int
+        Number of round-robin shards, or ``0`` to cut by ``shard_size``.
+    shard_size: int
+        Uncompressed characters per shard when ``shards`` is ``0``.
+    compression: Optional[str]
+        See :func:`sql_output.open_sql_output`.
+    buffer_size: int
+        Write buffer of every open shard.
+    source: str
+        Recorded in the manifest, usually the workbook.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        shards: int = 0,
+        shard_size: int = 0,
+        compression: Optional[str] = None,
+        buffer_size: int = DEFAULT_WRITE_BUFFER,
+        source: str = '',
+    ):
+        if shards <= 0 and shard_size <= 0:
+            raise ValueError('Give a number of shards or a shard size')
+        self.compression = compression or compression_for(output_path)
+        self.base = shard_base(output_path)
+        self.suffix = '.sql' + (COMPRESSION_SUFFIXES[self.compression] if self.compression else '')
+        self.manifest_path = f"{self.base}.shards.json"
+        self.shards = shards
+        self.shard_size = shard_size
+        self.buffer_size = buffer_size
+        self.source = source
+        self.count = 0
+        self.rows = 0
+        self._open: List[Optional[_Shard]] = [None] * shards if shards > 0 else []
+        self._written: List[_Shard] = []
+        self.manifest: Optional[Dict[str, Any]] = None
+
+    def __enter__(self) -> 'ShardedStatementWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        self.close(completed=exc_type is None)
+
+    @property
+    def path(self) -> str:
+        """What to report as the output: the manifest."""
+        return self.manifest_path
+
+    def _new_shard(self) -> _Shard:
+        path = f"{self.base}.part-{len(self._written) + 1:04d}{self.suffix}"
+        shard = _Shard(path, open_sql_output(path, self.compression, self.buffer_size))
+        shard.file.write(SHARD_BEGIN)
+        self._written.append(shard)
+        return shard
+
+    def _shard_for_next(self) -> _Shard:
+        if self.shards > 0:
+            slot = self.count % self.shards
+            shard = self._open[slot]
+            if shard is None:
+                shard = self._open[slot] = self._new_shard()
+            return shard
+        shard = self._open[0] if self._open else None
+        if shard is None or shard.chars >= self.shard_size:
+            if shard is not None:
+                self._finish(shard)
+            shard = self._new_shard()
+            self._open[:] = [shard]
+        return shard
+
+    def write(self, statement: str, rows: int = 1) -> None:
+        """Write one statement holding ``rows`` rows into the next shard."""
+        shard = self._shard_for_next()
+        if shard.statements:
+            shard.file.write('\n\n')
+        shard.file.write(statement)
+        shard.statements += 1
+        shard.rows += rows
+        shard.chars += len(statement) + 2
+        self.count += 1
+        self.rows += rows
+
+    def _finish(self, shard: _Shard, completed: bool = True) -> None:
+        if shard.file is not None:
+            if completed:
+                shard.file.write(SHARD_END)
+            shard.file.close()
+            shard.file = None
+
+    def close(self, completed: bool = True) -> None:
+        """Close every shard and write the manifest (only if a statement was written).
+
+        With ``completed`` false the shards are left without ``COMMIT;``
+        and no manifest is written.
+        """
+        for shard in self._written:
+            self._finish(shard, completed)
+        self._open = []
+        if completed and self.count and self.manifest is None:
+            self.manifest = self._build_manifest()
+            with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=2)
+
+    def _build_manifest(self) -> Dict[str, Any]:
+        return {
+            'source': self.source,
+            'created': datetime.now(timezone.utc).isoformat(),
+            'compression': self.compression,
+            'statements': self.count,
+            'rows': self.rows,
+            'shards': [
+                {
+                    'file': os.path.basename(shard.path),
+                    'statements': shard.statements,
+                    'rows': shard.rows,
+                    'bytes': os.path.getsize(shard.path),
+                    'sha256': file_digest(shard.path),
+                }
+                for shard in self._written
+            ],
+        }
+
+
+def output_exists(output_path: str) -> bool:
+    """Whether ``output_path`` or a shard manifest for it already exists."""
+    return os.path.exists(output_path) or os.path.exists(f"{shard_base(output_path)}.shards.json")
+
+
+def add_shard_arguments(parser) -> None:
+    """Add ``--shards`` and ``--shard-size`` to an ``argparse`` parser."""
+    shard = parser.add_mutually_exclusive_group()
+    shard.add_argument('--shards', type=_shard_count, default=0, help='Split the SQL into this many self-contained shard files (round-robin)')
+    shard.add_argument('--shard-size', type=_shard_size, default=0, help='Start a new shard file every <size> of SQL (e.g. 64M)')
+
+
+def open_statement_writer(output_path: str, args, source: str = ''):
+    """:class:`ShardedStatementWriter` when sharding was asked for, :class:`sql_output.StatementWriter` otherwise."""
+    if args.shards or args.shard_size:
+        return ShardedStatementWriter(
+            output_path, args.shards, args.shard_size, args.compress, args.write_buffer, source=source,
+        )
+    # A --copy block arrives line by line
+    return StatementWriter(output_path, args.compress, args.write_buffer, separator='\n' if args.copy else None)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Pre-compiled rendering of the ``insert-pago-example.sql`` template.
+
+The Pagos generators used to customise the template for every payment
+with up to nine ``re.sub`` passes over the whole statement text.  The
+template never changes during a run, so the positions of the values
+being replaced do not change either.
+
+A :class:`RenderPlan` is built once per template: the generator's own
+substitution routine is run a single time with marker strings in place
+of the real values, and the result is split at the markers into
+literal chunks and typed slots (``Fecha``, ``Monto``, ``AlumnoId``,
+``MedioPago``, ``Notas``, ``RubroId``, ``EsColegiatura``,
+``MesColegiatura``, ``AnioColegiatura``).  Rendering a payment is then
+a single ``%`` formatting call over the pre-split pieces.
+
+Because the plan is derived by running the very same substitutions, the
+rendered text is byte-identical to what the regex passes produce, as
+long as the substituted values contain no newlines (the generators only
+ever pass single-line values).
+"""
+
+import re
+from typing import Callable, Dict, List, Tuple
+
+SLOT_NAMES = (
+    'Fecha',
+    'Monto',
+    'AlumnoId',
+    'MedioPago',
+    'Notas',
+    'RubroId',
+    'EsColegiatura',
+    'MesColegiatura',
+    'AnioColegiatura',
+)
+
+_VALUES_RE = re.compile(r'\)\s*VALUES\s*(?P<open>\()', re.IGNORECASE)
+_MARKER_RE = re.compile('\x00(' + '|'.join(SLOT_NAMES) + ')\x00')
+
+
+def slot_marker(name: str) -> str:
+    """Return the placeholder used for slot ``name`` while compiling."""
+    return f'\x00{name}\x00'
+
+
+class RenderPlan:
+    """Literal chunks plus typed slots for one statement template.
+
+    Parameters
+    ----------
+    marked_text: str
+        Template text in which every substituted value has been replaced
+        by :func:`slot_marker`.
+    """
+
+    __slots__ = ('marked_text', 'chunks', 'slots', '_format')
+
+    def __init__(self, marked_text: str):
+        self.marked_text = marked_text
+        parts = _MARKER_RE.split(marked_text)
+        # re.split with one group alternates literal, slot, literal, ...
+        self.chunks: List[str] = parts[0::2]
+        self.slots: Tuple[str, ...] = tuple(parts[1::2])
+        self._format = '%s'.join(chunk.replace('%', '%%') for chunk in self.chunks)
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Render a statement from already formatted SQL slot values.
+
+        Slots that the template does not contain are ignored.
+        """
+        return self._format % tuple([values[name] for name in self.slots])
+
+    def split_values(self) -> Tuple[str, 'RenderPlan']:
+        """Split an ``INSERT`` plan into its head and a value-tuple plan.
+
+        Used to emit multi-row ``INSERT`` statements: the head (up to and
+        including ``VALUES``) is written once per batch and the returned
+        plan renders the parenthesised value tuple of a single row.
+
+        Returns
+        -------
+        Tuple[str, RenderPlan]
+            ``(head, row_plan)``.
+
+        Raises
+        ------
+        ValueError
+            If the template is not a single ``INSERT ... VALUES (...)``
+            statement with every slot inside the value tuple.
+        """
+        text = self.marked_text
+        m = _VALUES_RE.search(text)
+        end = text.rfind(')', 0, text.rfind(';')) if ';' in text else text.rfind(')')
+        if not m or end < m.end():
+            raise ValueError('Template is not an INSERT ... VALUES (...) statement')
+        head = text[:m.start('open')].rstrip()
+        if _MARKER_RE.search(head):
+            raise ValueError('Template has substituted values outside of the VALUES tuple')
+        return head, RenderPlan(text[m.start('open'):end + 1])
+
+
+def compile_plan(template: str, substitute: Callable[[str, Dict[str, str]], str]) -> RenderPlan:
+    """Compile ``template`` by running ``substitute`` once with markers.
+
+    Parameters
+    ----------
+    template: str
+        The raw SQL template.
+    substitute: Callable[[str, Dict[str, str]], str]
+        The generator's substitution routine, taking the template and a
+        mapping of slot name to the SQL text to insert.
+
+    Returns
+    -------
+    RenderPlan
+        The pre-split render plan for ``template``.
+    """
+    return RenderPlan(substitute(template, {name: slot_marker(name) for name in SLOT_NAMES}))
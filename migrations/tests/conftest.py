@@ -0,0 +1,6 @@
+"""The scripts import each other as siblings, so the tests run them from ``migrations/``."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
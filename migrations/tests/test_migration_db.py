@@ -0,0 +1,79 @@
+"""
+``--ingest-db`` across the single-sheet and the ``--all-sheets`` modes.
+
+Both modes must record the active sheet's payments as the same source,
+so ingesting a workbook in one mode and then in the other replaces the
+payments instead of storing them twice.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import openpyxl
+import pytest
+
+MIGRATIONS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROSTER = [(1, 'Orozco Rodriguez Maria'), (2, 'Perez Lopez Juan'), (3, 'Garcia Ana')]
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    wb = openpyxl.Workbook()
+    for title in ('Primero A', 'Primero B'):
+        ws = wb.active if title == 'Primero A' else wb.create_sheet(title)
+        ws.title = title
+        ws['B2'] = 'Nombre del Alumno'
+        ws['J2'] = 'Inscripción'
+        for row, (_, name) in enumerate(ROSTER, start=3):
+            ws[f'B{row}'] = name
+            ws[f'J{row}'] = 250
+    path = tmp_path / 'Pagos.xlsx'
+    wb.save(path)
+    (tmp_path / 'data.csv').write_text(
+        'Id,NombreCompleto\n' + ''.join(f'{i},{name}\n' for i, name in ROSTER), encoding='utf-8',
+    )
+    return tmp_path
+
+
+def run_v4(cwd, *extra):
+    subprocess.run(
+        [
+            sys.executable, os.path.join(MIGRATIONS, 'generate_sql_openai_v4.py'),
+            '--excel', 'Pagos.xlsx', '--csv', 'data.csv',
+            '--sql-template', os.path.join(MIGRATIONS, 'insert-pago-example.sql'),
+            '--rubro-id', '17', '--month', '1', '--year', '2025',
+            '--cell-range', 'B3:B5', '--fee-col', 'J', '--ingest-db', 'migracion.sqlite', *extra,
+        ],
+        cwd=cwd, check=True, capture_output=True,
+    )
+    for name in os.listdir(cwd):
+        if name.endswith('.sql'):
+            os.remove(os.path.join(cwd, name))
+
+
+def ingested(cwd):
+    conn = sqlite3.connect(os.path.join(cwd, 'migracion.sqlite'))
+    try:
+        sources = conn.execute("SELECT sheet, rows FROM sources WHERE kind = 'payments' ORDER BY sheet").fetchall()
+        payments = conn.execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+    finally:
+        conn.close()
+    return sources, payments
+
+
+@pytest.mark.parametrize('modes', [((), ('--all-sheets', '--workers', '1')), (('--all-sheets', '--workers', '1'), ())])
+def test_both_modes_replace_the_same_source(workbook, modes):
+    first, second = modes
+    run_v4(workbook, *first)
+    run_v4(workbook, *second)
+    # The active sheet is one source whichever mode ran last
+    assert ingested(workbook) == ([('Primero A', 3), ('Primero B', 3)], 6)
+
+
+@pytest.mark.parametrize('extra', [(), ('--streaming',), ('--staging',)])
+def test_single_sheet_rerun_replaces_its_payments(workbook, extra):
+    run_v4(workbook, *extra)
+    run_v4(workbook, *extra)
+    assert ingested(workbook) == ([('Primero A', 3)], 3)
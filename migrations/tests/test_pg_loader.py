@@ -0,0 +1,187 @@
+"""
+:class:`pg_loader.PgLoader` against an in-memory stand-in for psycopg.
+
+:class:`FakeDatabase` hands out connections whose transactions buffer
+their rows and append them to ``committed`` only when the transaction
+block exits cleanly, which is what psycopg does.  A row whose first value
+is ``'bad'`` makes its batch fail on every attempt; ``delays`` slows down
+chosen batches so later ones are already written when an earlier one
+fails.
+"""
+
+import argparse
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from payment_run import PaymentRun
+from pg_loader import PgLoader
+from profiling import StageProfiler
+
+
+class FakeDatabase:
+    def __init__(self, delays=None):
+        self.committed = []
+        self.delays = delays or {}
+        self.lock = threading.Lock()
+
+    def connect(self, dsn):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.closed = False
+        self.broken = False
+        self.pending = None
+
+    @contextmanager
+    def transaction(self):
+        self.pending = []
+        try:
+            yield
+        except BaseException:
+            self.pending = None
+            raise
+        with self.db.lock:
+            self.db.committed.extend(self.pending)
+        self.pending = None
+
+    @contextmanager
+    def cursor(self):
+        yield FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def executemany(self, sql, batch):
+        time.sleep(self.conn.db.delays.get(batch[0][0], 0))
+        for row in batch:
+            if row[0] == 'bad':
+                raise ValueError('invalid input syntax')
+            self.conn.pending.append(tuple(row))
+
+    @contextmanager
+    def copy(self, sql):
+        rows = []
+        yield FakeCopy(rows)
+        self.executemany(sql, rows)
+
+
+class FakeCopy:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+
+def make_rows(count, bad=None):
+    return [('bad' if i == bad else f'r{i:02d}', '100.00') for i in range(count)]
+
+
+def make_loader(db, method='copy', batch_size=3, writers=4):
+    return PgLoader(
+        'postgresql://fake', 'public."Pagos"', ['"AlumnoId"', '"Monto"'], method=method,
+        batch_size=batch_size, writers=writers, retries=1, retry_delay=0, connect=db.connect,
+    )
+
+
+@pytest.mark.parametrize('method', ['copy', 'insert'])
+def test_load_commits_every_row(method):
+    db = FakeDatabase()
+    rows = make_rows(21)
+    with make_loader(db, method) as loader:
+        result = loader.load(iter(rows))
+    assert result.ok
+    assert (result.rows, result.batches, result.not_loaded) == (21, 7, 0)
+    assert sorted(db.committed) == rows
+
+
+@pytest.mark.parametrize('writers', [1, 4])
+def test_failed_batch_leaves_only_the_rows_before_it(writers):
+    db = FakeDatabase()
+    rows = make_rows(21, bad=11)
+    with make_loader(db, writers=writers) as loader:
+        result = loader.load(iter(rows))
+    assert not result.ok
+    # Row 12 (index 11) is in the batch of rows 10-12
+    assert result.failed_row == 10
+    assert result.rows == 9
+    assert sorted(db.committed) == rows[:9]
+    assert result.rows + result.not_loaded <= len(rows)
+
+
+def test_later_batches_written_before_the_failure_are_rolled_back():
+    # The failing batch is slow, so the four batches after it reach their
+    # commit point first; none of them may commit
+    db = FakeDatabase(delays={'bad': 0.2})
+    rows = make_rows(30, bad=9)
+    with make_loader(db, writers=4) as loader:
+        result = loader.load(iter(rows))
+    assert result.failed_row == 10
+    assert sorted(db.committed) == rows[:9]
+    assert 'rows from 10 on were not loaded' in result.summary()
+
+
+def test_earlier_slow_batch_still_commits_when_a_later_one_fails():
+    # Batch 7-9 is still being written when batch 10-12 fails; it must
+    # commit, and the failure is reported at row 10
+    db = FakeDatabase(delays={'r06': 0.2})
+    rows = make_rows(21, bad=11)
+    with make_loader(db, writers=4) as loader:
+        result = loader.load(iter(rows))
+    assert result.failed_row == 10
+    assert sorted(db.committed) == rows[:9]
+
+
+def make_payments(count):
+    return [
+        {'AlumnoId': str(i), 'RubroId': '17', 'MesColegiatura': '1', 'AnioColegiatura': '2025', 'Fecha': "'2025-01-05'", 'Monto': '250.00'}
+        for i in range(1, count + 1)
+    ]
+
+
+def run_load(db, ledger_path, payments, bad=None):
+    """Load ``payments`` through :class:`PaymentRun` with a ``--ledger``; return the rows sent."""
+    args = argparse.Namespace(
+        excel='Pagos.xlsx', ledger=str(ledger_path), ledger_dry_run=False, ingest_db=None,
+        existing_pagos=None, existing_pagos_dsn=None, load='postgresql://fake', load_method='copy',
+        load_batch_size=3, load_writers=4, load_retries=1, skip_stats=False, metrics_json=None, metrics_prom=None,
+    )
+    sent = []
+
+    def load_payment_values(options, payments, template, profiler):
+        rows = [('bad' if v['AlumnoId'] == bad else v['AlumnoId'], v['Monto']) for v in payments]
+        sent.extend(rows)
+        with make_loader(db) as loader:
+            return loader.load(iter(rows))
+
+    run = PaymentRun(args, 'test', StageProfiler(), [17])
+    # The generator's parser starts the workbook's counters
+    run.metrics.workbook(args.excel)
+    try:
+        run.finish(run.workbook_payments(payments), '', 'Pagos.sql', None, load_payment_values)
+    except SystemExit as e:
+        assert e.code == 1
+    return sent
+
+
+def test_ledger_records_the_rows_loaded_before_a_failure(tmp_path):
+    ledger = tmp_path / 'ledger.sqlite'
+    payments = make_payments(21)
+    db = FakeDatabase()
+    run_load(db, ledger, payments, bad='12')
+    assert sorted(db.committed) == sorted((str(i), '250.00') for i in range(1, 10))
+    # The incremental re-run emits only what the failed load left out
+    rerun = FakeDatabase()
+    assert [row[0] for row in run_load(rerun, ledger, payments)] == [str(i) for i in range(10, 22)]
+    assert run_load(FakeDatabase(), ledger, payments) == []
@@ -0,0 +1,40 @@
+"""
+Sheet selection for ``--all-sheets``/``--sheets`` with ``--staging``.
+
+Once a workbook is staged, listing its sheets must come from the staging
+file's metadata; the test makes every ``openpyxl.load_workbook`` call fail
+after staging to prove the workbook is not opened again.
+"""
+
+import openpyxl
+import pytest
+
+from sheet_jobs import select_sheets
+from workbook_staging import open_staged_workbook
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    wb = openpyxl.Workbook()
+    wb.active.title = 'Primero A'
+    for title in ('Primero B', 'Kinder A'):
+        wb.create_sheet(title)
+    path = tmp_path / 'Pagos.xlsx'
+    wb.save(path)
+    return str(path)
+
+
+def test_staged_workbook_is_not_opened(workbook, monkeypatch):
+    open_staged_workbook(workbook, '.staging').close()
+
+    def load_workbook(*args, **kwargs):
+        raise AssertionError('the workbook was opened')
+
+    monkeypatch.setattr(openpyxl, 'load_workbook', load_workbook)
+    assert select_sheets(workbook, None, '.staging') == ['Primero A', 'Primero B', 'Kinder A']
+    assert select_sheets(workbook, 'Primero*', '.staging') == ['Primero A', 'Primero B']
+
+
+def test_unstaged_workbook_is_listed_from_the_xlsx(workbook):
+    assert select_sheets(workbook, 'Kinder*', '.staging') == ['Kinder A']
+    assert select_sheets(workbook) == ['Primero A', 'Primero B', 'Kinder A']
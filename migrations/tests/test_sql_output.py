@@ -0,0 +1,29 @@
+"""
+The ``--copy`` block written line by line through :class:`sql_output.StatementWriter`.
+"""
+
+from sql_output import RowCounter, StatementWriter, format_copy_block, iter_copy_lines
+
+TABLE = 'public."Pagos"'
+COLUMNS = ['"AlumnoId"', '"Monto"']
+
+
+def write_copy(path, rows):
+    counter = RowCounter()
+    with StatementWriter(str(path), separator='\n') as writer:
+        for line in iter_copy_lines(TABLE, COLUMNS, counter.wrap(iter(rows))):
+            writer.write(line, counter.take())
+    return writer
+
+
+def test_streamed_block_matches_the_joined_block(tmp_path):
+    rows = [f'{i}\t250.00' for i in range(1, 6)]
+    writer = write_copy(tmp_path / 'Pagos.sql', rows)
+    assert (tmp_path / 'Pagos.sql').read_text(encoding='utf-8') == format_copy_block(TABLE, COLUMNS, rows)
+    assert writer.rows == 5
+
+
+def test_no_rows_write_no_block(tmp_path):
+    writer = write_copy(tmp_path / 'Pagos.sql', [])
+    assert writer.count == 0
+    assert not (tmp_path / 'Pagos.sql').exists()
@@ -0,0 +1,78 @@
+"""
+Layout inference on the finance workbook template of ``comandos.MD``.
+
+Names in B, the Carnet fee in G (``generate_sql_openai_carnet.py``
+``--fee-col G``), Inscripción or Cuota Anual in H (``--fee-col H``) and
+the monthly fees in I-T (``--fee-cols I-T``).
+"""
+
+import openpyxl
+import pytest
+
+from generate_sql_openai_v4 import resolve_columns
+from workbook_layout import MONTH_NUMBERS, detect_layout, single_fee_col
+
+MONTHS = [month.title() for month in MONTH_NUMBERS]
+
+
+def write_workbook(path, headers):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws['A1'] = 'Colegio Manitas Creativas - Control de pagos'
+    for col, label in headers.items():
+        ws[f'{col}2'] = label
+    for i, name in enumerate(['OROZCO RODRIGUEZ, Maria', 'PEREZ LOPEZ, Juan', 'GARCIA, Ana'], start=3):
+        ws[f'A{i}'] = i - 2
+        ws[f'B{i}'] = name
+        for col in headers:
+            if col not in ('A', 'B'):
+                ws[f'{col}{i}'] = 150
+    wb.save(path)
+    return str(path)
+
+
+def template_headers(single_fee='Inscripción', **extra):
+    headers = {'A': 'No.', 'B': 'Nombre del Alumno', 'G': 'Carnet', 'H': single_fee}
+    headers.update(extra)
+    headers.update(zip('IJKLMNOPQRST', MONTHS))
+    return headers
+
+
+@pytest.mark.parametrize('single_fee', ['Inscripción', 'Cuota Anual'])
+def test_single_fee_column_is_the_one_after_carnet(tmp_path, single_fee):
+    excel = write_workbook(tmp_path / 'Pagos-SegundoPrimaria-B.xlsx', template_headers(single_fee))
+    layout = detect_layout(excel, cache_dir=None)
+    assert (layout.header_row, layout.name_col, layout.start_row) == (2, 'B', 3)
+    assert layout.fee_cols == list('IJKLMNOPQRST')
+    assert layout.months['I'] == 1 and layout.months['T'] == 12
+    assert layout.amount_cols == ('H',)
+    assert resolve_columns(None, None, layout) == ('B', 3, 5, 'H')
+    # An explicit --fee-col still wins
+    assert resolve_columns(None, 'g', layout)[3] == 'G'
+
+
+def test_columns_right_of_carnet_come_first(tmp_path):
+    excel = write_workbook(tmp_path / 'Pagos.xlsx', template_headers(C='Grado', D='Encargado'))
+    layout = detect_layout(excel, cache_dir=None)
+    assert layout.amount_cols == ('H', 'C', 'D')
+    assert single_fee_col(layout) == 'H'
+
+
+def test_month_only_headers_require_fee_col(tmp_path):
+    headers = {'A': 'No.', 'B': 'Nombre del Alumno'}
+    headers.update(zip('IJKLMNOPQRST', MONTHS))
+    excel = write_workbook(tmp_path / 'Pagos.xlsx', headers)
+    layout = detect_layout(excel, cache_dir=None)
+    assert layout.amount_cols == ()
+    with pytest.raises(ValueError, match='--fee-col'):
+        resolve_columns(None, None, layout)
+    assert resolve_columns(None, 'J', layout)[3] == 'J'
+
+
+def test_cached_profile_keeps_the_amount_columns(tmp_path):
+    excel = write_workbook(tmp_path / 'Pagos.xlsx', template_headers())
+    inferred = detect_layout(excel, cache_dir='.layout-cache')
+    cached = detect_layout(excel, cache_dir='.layout-cache')
+    assert not inferred.cached and cached.cached
+    assert cached.amount_cols == inferred.amount_cols == ('H',)
+    assert cached.fee_cols == inferred.fee_cols
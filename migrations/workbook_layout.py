@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Infer where the names and fees of a payment workbook are.
+
+The Pagos generators need ``--cell-range B3:B21`` and ``--fee-col`` or
+``--fee-cols`` typed by hand for every workbook, although every tab of
+the finance workbooks follows the same template::
+
+    row 1   Colegio Manitas Creativas - Control de pagos
+    row 2   No. | Nombre del Alumno | ... | Carnet | Inscripción | Enero | ... | Diciembre
+    row 3+  1   | OROZCO RODRIGUEZ, Maria | ... | 25 | 250 | Q150,00 | ...
+
+With ``--infer-layout`` the first :data:`HEADER_SCAN_ROWS` rows are read
+once and:
+
+1. the header row is the first row made of two or more text cells and
+   no numbers (the title row has a single cell, data rows hold numbers);
+2. the name column is the header cell that mentions ``Nombre``,
+   ``Alumno`` or ``Estudiante``;
+3. the fee columns are the header cells to the right of it that name a
+   month (``Enero``, ``Mayo 2025``, ``Mes 4``), or every labelled cell
+   to the right when none does (e.g. a single ``Inscripcion`` column),
+   each with its ``MesColegiatura``;
+4. the amount columns are the labelled cells to the right of the name
+   column that do not name a month, those right of a ``Carnet`` column
+   first and the ``Carnet`` column itself left out.  They hold the
+   single fees (``Inscripción``, ``Cuota Anual``) read by
+   ``generate_sql_openai_v4.py``, which takes the first one;
+5. the data starts at the first row below the header with a name and
+   runs to the last row of the sheet.
+
+The result is saved as a layout profile, a small JSON file named after
+a fingerprint of the header row (its row number, columns and accent
+folded, upper-cased labels), in ``.layout-cache`` next to the workbook.
+Workbooks built from the same template share a fingerprint, so later
+runs take the profile as it is: no inference, and
+``generate_sql_multi_mes.py`` does not read the month headers at all.
+A profile can be edited by hand to correct a column; bump
+:data:`LAYOUT_CACHE_VERSION` when the inference rules change.
+
+Explicit ``--cell-range`` and ``--fee-col``/``--fee-cols`` still win
+over the inferred values.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from accents import fold_accents
+from workbook_staging import open_staged_workbook, staging_dir_from_args
+from workbook_stream import open_streaming_workbook
+
+# Bump when the inference rules or the profile format change so that
+# existing profiles are ignored.
+LAYOUT_CACHE_VERSION = 2
+DEFAULT_LAYOUT_CACHE_DIR = '.layout-cache'
+HEADER_SCAN_ROWS = 10
+NAME_HEADER_WORDS = ('NOMBRE', 'ALUMNO', 'ESTUDIANTE')
+CARNET_HEADER_WORD = 'CARNET'
+_PROFILE_SUFFIX = '.layout.json'
+
+MONTH_NUMBERS = {
+    'ENERO': 1,
+    'FEBRERO': 2,
+    'MARZO': 3,
+    'ABRIL': 4,
+    'MAYO': 5,
+    'JUNIO': 6,
+    'JULIO': 7,
+    'AGOSTO': 8,
+    'SEPTIEMBRE': 9,
+    'OCTUBRE': 10,
+    'NOVIEMBRE': 11,
+    'DICIEMBRE': 12,
+}
+_MONTH_DIGITS_RE = re.compile(r'.*?(\d{1,2}).*')
+
+
+class WorkbookLayout(NamedTuple):
+    """Where the names and fees of one worksheet are."""
+
+    header_row: int
+    name_col: str
+    start_row: int
+    fee_cols: List[str]
+    # MesColegiatura of each fee column, None when its header names no month
+    months: Dict[str, Optional[int]]
+    fingerprint: str
+    # Last row of the sheet when known without reading it (None otherwise)
+    end_row: Optional[int] = None
+    cached: bool = False
+    # Non-month fee columns right of the names, in order of preference
+    amount_cols: Tuple[str, ...] = ()
+
+    def describe(self) -> str:
+        """One-line summary printed by the generators."""
+        origin = 'cached profile' if self.cached else 'inferred'
+        if self.end_row is not None:
+            names = f"{self.name_col}{self.start_row}:{self.name_col}{self.end_row}"
+        else:
+            names = f"{self.name_col}{self.start_row} to the last row"
+        return (
+            f"names {names}, fee columns {column_span(self.fee_cols)}, "
+            f"header row {self.header_row} ({origin} {self.fingerprint[:12]})"
+        )
+
+
+def header_month(header: Any) -> Optional[int]:
+    """``MesColegiatura`` named by a fee column header, or ``None``.
+
+    The first word is looked up as a Spanish month name; otherwise the
+    first one- or two-digit number in the header is taken.
+    """
+    header_norm = fold_accents(str(header)).upper().strip()
+    first_word = header_norm.split()[0] if header_norm else ''
+    month = MONTH_NUMBERS.get(first_word)
+    if month is None:
+        m = _MONTH_DIGITS_RE.match(header_norm)
+        if m:
+            month = int(m.group(1))
+    return month
+
+
+def find_header_row(top_rows: List[Tuple[Any, ...]]) -> Optional[Tuple[int, Dict[str, str]]]:
+    """``(row, {column: label})`` of the first row made only of two or more text cells."""
+    for row, values in enumerate(top_rows, start=1):
+        cells = {get_column_letter(i): v for i, v in enumerate(values, start=1) if v is not None and str(v).strip()}
+        if len(cells) >= 2 and all(isinstance(v, str) for v in cells.values()):
+            return row, {col: v.strip() for col, v in cells.items()}
+    return None
+
+
+def header_fingerprint(header_row: int, labels: Dict[str, str]) -> str:
+    """SHA-256 of the header row number, its columns and their folded labels."""
+    text = '\n'.join([str(header_row)] + [f"{col}={fold_accents(label).upper()}" for col, label in labels.items()])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def infer_layout(top_rows: List[Tuple[Any, ...]], header_row: int, labels: Dict[str, str], fingerprint: str) -> WorkbookLayout:
+    """Apply the rules of the module docstring to a sheet's first rows.
+
+    Raises ``ValueError`` when no name column or no fee column is found.
+    """
+    folded = {col: fold_accents(label).upper() for col, label in labels.items()}
+    name_col = next(
+        (col for col, label in folded.items() if any(word in label for word in NAME_HEADER_WORDS)),
+        None,
+    )
+    if name_col is None:
+        raise ValueError(f"no header in row {header_row} mentions {', '.join(w.title() for w in NAME_HEADER_WORDS)}")
+    cols = list(labels)
+    right = cols[cols.index(name_col) + 1:]
+    months = {col: header_month(labels[col]) for col in right}
+    fee_cols = [col for col in right if months[col] is not None] or right
+    if not fee_cols:
+        raise ValueError(f"no fee column right of the name column {name_col} in row {header_row}")
+    # The Carnet fee has a generator of its own; the single fees follow it
+    others = [col for col in right if months[col] is None]
+    carnet = next((col for col in others if CARNET_HEADER_WORD in folded[col]), None)
+    amount_cols = [col for col in others if col != carnet]
+    if carnet is not None:
+        amount_cols.sort(key=lambda col: cols.index(col) < cols.index(carnet))
+    # Data starts at the first row below the header with a name in it
+    name_idx = column_index_from_string(name_col) - 1
+    start_row = next(
+        (
+            row
+            for row in range(header_row + 1, len(top_rows) + 1)
+            if name_idx < len(top_rows[row - 1]) and str(top_rows[row - 1][name_idx] or '').strip()
+        ),
+        header_row + 1,
+    )
+    return WorkbookLayout(
+        header_row, name_col, start_row, fee_cols, {col: months[col] for col in fee_cols}, fingerprint,
+        amount_cols=tuple(amount_cols),
+    )
+
+
+def single_fee_col(layout: WorkbookLayout) -> str:
+    """The column a single-fee generator reads when no ``--fee-col`` is given.
+
+    Raises ``ValueError`` when every header right of the names is a
+    month: which of them holds the fee cannot be told from the header.
+    """
+    if not layout.amount_cols:
+        raise ValueError(
+            f"every header right of the name column {layout.name_col} is a month "
+            f"({column_span(layout.fee_cols)}); give the fee column with --fee-col"
+        )
+    return layout.amount_cols[0]
+
+
+# -- profiles --------------------------------------------------------------
+
+
+def layout_profile_path(cache_dir: str, fingerprint: str) -> str:
+    return os.path.join(cache_dir, f"{fingerprint[:32]}{_PROFILE_SUFFIX}")
+
+
+def _read_profile(path: str, fingerprint: str) -> Optional[WorkbookLayout]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        if profile.get('version') != LAYOUT_CACHE_VERSION or profile.get('fingerprint') != fingerprint:
+            return None
+        return WorkbookLayout(
+            int(profile['header_row']),
+            str(profile['name_col']),
+            int(profile['start_row']),
+            [str(col) for col in profile['fee_cols']],
+            {str(col): (int(month) if month is not None else None) for col, month in profile['months'].items()},
+            fingerprint,
+            cached=True,
+            amount_cols=tuple(str(col) for col in profile['amount_cols']),
+        )
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _write_profile(path: str, layout: WorkbookLayout, labels: Dict[str, str]) -> None:
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    profile = {
+        'version': LAYOUT_CACHE_VERSION,
+        'fingerprint': layout.fingerprint,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'header_row': layout.header_row,
+        'name_col': layout.name_col,
+        'start_row': layout.start_row,
+        'fee_cols': layout.fee_cols,
+        'months': layout.months,
+        'amount_cols': list(layout.amount_cols),
+        'headers': labels,
+    }
+    # Same temporary-file dance as the roster cache, for concurrent runs
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def detect_layout(
+    excel_path: str,
+    sheet_name: Optional[str] = None,
+    cache_dir: Optional[str] = DEFAULT_LAYOUT_CACHE_DIR,
+    staging: Optional[str] = None,
+) -> WorkbookLayout:
+    """Layout of a worksheet (the active one by default), from its profile or inferred.
+
+    Parameters
+    ----------
+    excel_path: str
+        Path to the Excel workbook (xlsx).
+    sheet_name: Optional[str]
+        Worksheet to inspect; ``None`` inspects the active sheet.
+    cache_dir: Optional[str]
+        Directory of the layout profiles, relative to the workbook's
+        directory unless absolute.  ``None`` always infers and saves
+        nothing.
+    staging: Optional[str]
+        Read the header rows from the workbook's staging file in this
+        directory instead of the workbook (see ``workbook_staging.py``).
+
+    Raises
+    ------
+    ValueError
+        If the sheet has no recognisable header row, name column or fee
+        column.
+    """
+    wb = open_staged_workbook(excel_path, staging) if staging is not None else open_streaming_workbook(excel_path)
+    try:
+        ws = wb[sheet_name] if sheet_name is not None else wb.active
+        top_rows = [tuple(values) for values in ws.iter_rows(max_row=HEADER_SCAN_ROWS, values_only=True)]
+        # Read-only sheets know their size only when the file records it
+        end_row = ws.max_row
+    finally:
+        wb.close()
+    where = f"{os.path.basename(excel_path)}" + (f" [{sheet_name}]" if sheet_name is not None else '')
+    found = find_header_row(top_rows)
+    if found is None:
+        raise ValueError(f"{where}: no header row in the first {HEADER_SCAN_ROWS} rows")
+    header_row, labels = found
+    fingerprint = header_fingerprint(header_row, labels)
+    path = None
+    if cache_dir is not None:
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(excel_path)), cache_dir)
+        path = layout_profile_path(cache_dir, fingerprint)
+        layout = _read_profile(path, fingerprint)
+        if layout is not None:
+            return layout._replace(end_row=end_row)
+    try:
+        layout = infer_layout(top_rows, header_row, labels, fingerprint)
+    except ValueError as e:
+        raise ValueError(f"{where}: {e}") from None
+    if path is not None:
+        try:
+            _write_profile(path, layout, labels)
+        except OSError as e:
+            print(f"Warning: could not write layout profile {path}: {e}")
+    return layout._replace(end_row=end_row)
+
+
+def column_span(columns: List[str]) -> str:
+    """``I-T`` for consecutive columns, ``I,K,M`` otherwise."""
+    indexes = [column_index_from_string(col) for col in columns]
+    if indexes == list(range(indexes[0], indexes[0] + len(indexes))):
+        return f"{columns[0]}-{columns[-1]}" if len(columns) > 1 else columns[0]
+    return ','.join(columns)
+
+
+def add_layout_arguments(parser) -> None:
+    """Add ``--infer-layout``, ``--layout-cache`` and ``--no-layout-cache`` to an ``argparse`` parser."""
+    parser.add_argument('--infer-layout', action='store_true', help='Detect the name range and fee columns from the header row (explicit --cell-range/--fee-col(s) still win)')
+    parser.add_argument('--layout-cache', default=DEFAULT_LAYOUT_CACHE_DIR, help='Directory (relative to the workbook) for the cached layout profiles')
+    parser.add_argument('--no-layout-cache', action='store_true', help='Always infer the layout instead of using a cached profile')
+
+
+def layout_from_args(args, excel_path: str, sheet_name: Optional[str] = None) -> Optional[WorkbookLayout]:
+    """:func:`detect_layout` for the parsed flags, or ``None`` without ``--infer-layout``."""
+    if not args.infer_layout:
+        return None
+    cache_dir = None if args.no_layout_cache else args.layout_cache
+    return detect_layout(excel_path, sheet_name, cache_dir, staging_dir_from_args(args))
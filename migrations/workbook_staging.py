@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Columnar staging cache of parsed workbooks (Arrow IPC).
+
+Parsing the ``.xlsx`` XML is the slowest step of every Pagos generator,
+and the same workbook is parsed again for every rubro, every retry and
+every generator variant.  With ``--staging`` the generators parse a
+workbook once into a staging file and read the cells from there on
+every later run::
+
+    .staging/Pagos-SegundoPrimaria-B-<sha256 prefix>.arrow
+
+The file is an Arrow IPC file holding every non-empty or commented cell
+of every worksheet, sorted by sheet, row and column::
+
+    row int32 | col int16 | kind int8 | text string | number float64 | integer int64 | comment string
+
+``kind`` records the Python type openpyxl returned (text, int, float,
+bool, date/time), so the generators see exactly the values and comments
+they would have read from the workbook and produce the same SQL.  The
+sheet names, their offsets in the file, sizes and the active sheet are
+kept in the schema metadata.
+
+Staging files are keyed by the SHA-256 of the workbook bytes: an edited
+workbook gets a new file and the old one is removed.  They are opened
+through a memory map, so a run only touches the pages of the rows it
+asks for, and openpyxl does not parse anything.  :class:`StagedWorkbook`
+mimics the part of openpyxl's workbook and worksheet API the generators
+use (``wb[sheet]``, ``wb.active``, ``ws.max_row``, ``ws.iter_rows``),
+and :func:`iter_staged_rows` yields the same ``(row, name, fees)``
+tuples as ``workbook_stream.iter_payment_rows``.
+
+Workbooks can also be staged ahead of time::
+
+    python workbook_staging.py Pagos-*.xlsx [--staging-dir <dir>]
+
+Needs pyarrow (``pip install pyarrow``).
+"""
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from openpyxl.utils import column_index_from_string
+
+from file_digest import file_digest
+from workbook_stream import MAX_SHEET_ROW, FeeCells, PaymentRow, iter_sheet_comments, open_streaming_workbook
+
+# Bump when the file layout or the value encoding changes so that
+# existing staging files are rebuilt.
+STAGING_VERSION = 1
+DEFAULT_STAGING_DIR = '.staging'
+_STAGING_SUFFIX = '.arrow'
+_METADATA_KEY = b'workbook_staging'
+
+# Cell kinds
+KIND_EMPTY = 0  # a comment on an empty cell
+KIND_TEXT = 1
+KIND_INT = 2
+KIND_FLOAT = 3
+KIND_BOOL = 4
+KIND_DATETIME = 5
+KIND_DATE = 6
+KIND_TIME = 7
+KIND_TIMEDELTA = 8
+
+
+def require_pyarrow():
+    """Import pyarrow, with an install hint when it is missing."""
+    try:
+        import pyarrow
+        import pyarrow.compute  # noqa: F401
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise ImportError('--staging needs pyarrow: pip install pyarrow') from e
+    return pyarrow
+
+
+def staging_path(excel_path: str, staging_dir: str = DEFAULT_STAGING_DIR) -> str:
+    """Staging file for the current contents of ``excel_path``.
+
+    Relative ``staging_dir`` paths are resolved against the workbook's
+    directory.
+    """
+    if not os.path.isabs(staging_dir):
+        staging_dir = os.path.join(os.path.dirname(os.path.abspath(excel_path)), staging_dir)
+    stem = os.path.splitext(os.path.basename(excel_path))[0]
+    return os.path.join(staging_dir, f"{stem}-{file_digest(excel_path)[:32]}{_STAGING_SUFFIX}")
+
+
+# -- encoding ----------------------------------------------------------------
+
+
+def _encode(value: Any) -> Tuple[int, Optional[str], Optional[float], Optional[int]]:
+    """``(kind, text, number, integer)`` of a cell value."""
+    if value is None:
+        return KIND_EMPTY, None, None, None
+    if isinstance(value, str):
+        return KIND_TEXT, value, None, None
+    if isinstance(value, bool):
+        return KIND_BOOL, None, None, int(value)
+    if isinstance(value, int):
+        if -(1 << 63) <= value < 1 << 63:
+            return KIND_INT, None, None, value
+        return KIND_FLOAT, None, float(value), None
+    if isinstance(value, float):
+        return KIND_FLOAT, None, value, None
+    if isinstance(value, datetime):
+        return KIND_DATETIME, value.isoformat(), None, None
+    if isinstance(value, date):
+        return KIND_DATE, value.isoformat(), None, None
+    if isinstance(value, dt_time):
+        return KIND_TIME, value.isoformat(), None, None
+    if isinstance(value, timedelta):
+        return KIND_TIMEDELTA, None, value.total_seconds(), None
+    return KIND_TEXT, str(value), None, None
+
+
+def _decode(kind: int, text: Optional[str], number: Optional[float], integer: Optional[int]) -> Any:
+    if kind == KIND_TEXT:
+        return text
+    if kind == KIND_INT:
+        return integer
+    if kind == KIND_FLOAT:
+        return number
+    if kind == KIND_BOOL:
+        return bool(integer)
+    if kind == KIND_DATETIME:
+        return datetime.fromisoformat(text)
+    if kind == KIND_DATE:
+        return date.fromisoformat(text)
+    if kind == KIND_TIME:
+        return dt_time.fromisoformat(text)
+    if kind == KIND_TIMEDELTA:
+        return timedelta(seconds=number)
+    return None
+
+
+# -- ingest ------------------------------------------------------------------
+
+
+def _sheet_cells(ws) -> Tuple[List[Tuple[int, int, Any, Optional[str]]], int, int]:
+    """Non-empty or commented cells of a read-only sheet, in row/column order, plus its size."""
+    comments: Dict[Tuple[int, int], str] = {
+        (row, column_index_from_string(col)): text
+        for row, col, text in iter_sheet_comments(ws, None, 1, MAX_SHEET_ROW)
+    }
+    cells = []
+    max_row = max_col = 0
+    for row, values in enumerate(ws.iter_rows(values_only=True), start=1):
+        for col, value in enumerate(values, start=1):
+            comment = comments.pop((row, col), None)
+            if value is not None or comment is not None:
+                cells.append((row, col, value, comment))
+                max_col = max(max_col, col)
+        max_row = row
+    # Comments on cells beyond the last row or column holding data
+    for (row, col), comment in comments.items():
+        cells.append((row, col, None, comment))
+        max_row, max_col = max(max_row, row), max(max_col, col)
+    cells.sort(key=lambda cell: (cell[0], cell[1]))
+    return cells, max_row, max_col
+
+
+def stage_workbook(excel_path: str, path: str) -> Dict[str, Any]:
+    """Parse every worksheet of ``excel_path`` into the staging file ``path``.
+
+    Returns the metadata stored with the file.
+    """
+    pa = require_pyarrow()
+    rows: List[int] = []
+    cols: List[int] = []
+    kinds: List[int] = []
+    texts: List[Optional[str]] = []
+    numbers: List[Optional[float]] = []
+    integers: List[Optional[int]] = []
+    comments: List[Optional[str]] = []
+    sheets = []
+    wb = open_streaming_workbook(excel_path)
+    try:
+        active = wb.active.title
+        for ws in wb.worksheets:
+            cells, max_row, max_col = _sheet_cells(ws)
+            sheets.append({'title': ws.title, 'offset': len(rows), 'length': len(cells), 'max_row': max_row, 'max_column': max_col})
+            for row, col, value, comment in cells:
+                kind, text, number, integer = _encode(value)
+                rows.append(row)
+                cols.append(col)
+                kinds.append(kind)
+                texts.append(text)
+                numbers.append(number)
+                integers.append(integer)
+                comments.append(comment)
+    finally:
+        wb.close()
+    metadata = {
+        'version': STAGING_VERSION,
+        'source': os.path.basename(excel_path),
+        'sha256': file_digest(excel_path),
+        'active': active,
+        'sheets': sheets,
+    }
+    table = pa.table(
+        {
+            'row': pa.array(rows, pa.int32()),
+            'col': pa.array(cols, pa.int16()),
+            'kind': pa.array(kinds, pa.int8()),
+            'text': pa.array(texts, pa.string()),
+            'number': pa.array(numbers, pa.float64()),
+            'integer': pa.array(integers, pa.int64()),
+            'comment': pa.array(comments, pa.string()),
+        }
+    ).replace_schema_metadata({_METADATA_KEY: json.dumps(metadata).encode('utf-8')})
+    staging_dir = os.path.dirname(path)
+    os.makedirs(staging_dir, exist_ok=True)
+    # Written to a temporary file first so a concurrent run never maps a
+    # half-written file, then the files of older versions of the workbook
+    # are removed.
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f, pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    prefix = path[:-len(_STAGING_SUFFIX) - 32]
+    for stale in glob.glob(glob.escape(prefix) + '?' * 32 + _STAGING_SUFFIX):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return metadata
+
+
+# -- reading -----------------------------------------------------------------
+
+
+class StagedSheet:
+    """One worksheet of a :class:`StagedWorkbook`, read like an openpyxl sheet."""
+
+    def __init__(self, table, title: str, max_row: int, max_column: int):
+        self._table = table
+        self.title = title
+        self.max_row = max_row
+        self.max_column = max_column
+        # Rows are sorted, so row ranges are found by bisection; the
+        # column is a view of the memory-mapped buffer
+        self._rows = table.column('row').to_numpy()
+
+    def cells(self, min_row: int, max_row: int, columns: Optional[Set[int]] = None) -> Iterator[Tuple[int, int, Any, Optional[str]]]:
+        """``(row, col, value, comment)`` of the staged cells in a row range, optionally of some columns only."""
+        pa = require_pyarrow()
+        lo = int(np.searchsorted(self._rows, min_row, 'left'))
+        hi = int(np.searchsorted(self._rows, max_row, 'right'))
+        part = self._table.slice(lo, hi - lo)
+        if columns is not None:
+            part = part.filter(pa.compute.is_in(part.column('col'), value_set=pa.array(sorted(columns), pa.int16())))
+        data = part.to_pydict()
+        for row, col, kind, text, number, integer, comment in zip(
+            data['row'], data['col'], data['kind'], data['text'], data['number'], data['integer'], data['comment']
+        ):
+            yield row, col, _decode(kind, text, number, integer), comment
+
+    def iter_rows(self, min_row: int = 1, max_row: Optional[int] = None, min_col: int = 1, max_col: Optional[int] = None, values_only: bool = True) -> Iterator[Tuple[Any, ...]]:
+        """Value tuples of a block of rows, like ``Worksheet.iter_rows(values_only=True)``."""
+        max_row = min(max_row or self.max_row, self.max_row)
+        max_col = max_col or self.max_column
+        width = max_col - min_col + 1
+        values: Dict[int, List[Any]] = {}
+        for row, col, value, _ in self.cells(min_row, max_row, set(range(min_col, max_col + 1))):
+            values.setdefault(row, [None] * width)[col - min_col] = value
+        empty = (None,) * width
+        for row in range(min_row, max_row + 1):
+            found = values.get(row)
+            yield tuple(found) if found is not None else empty
+
+
+class StagedWorkbook:
+    """A staging file opened through a memory map (see :func:`open_staged_workbook`)."""
+
+    def __init__(self, path: str):
+        pa = require_pyarrow()
+        self.path = path
+        self._source = pa.memory_map(path, 'r')
+        self._table = pa.ipc.open_file(self._source).read_all()
+        self.metadata = json.loads(self._table.schema.metadata[_METADATA_KEY])
+        self.sheetnames = [sheet['title'] for sheet in self.metadata['sheets']]
+
+    def __getitem__(self, title: str) -> StagedSheet:
+        for sheet in self.metadata['sheets']:
+            if sheet['title'] == title:
+                return StagedSheet(
+                    self._table.slice(sheet['offset'], sheet['length']), title, sheet['max_row'], sheet['max_column'],
+                )
+        raise KeyError(f"Worksheet {title} does not exist.")
+
+    @property
+    def active(self) -> StagedSheet:
+        return self[self.metadata['active']]
+
+    def close(self) -> None:
+        self._table = None
+        self._source.close()
+
+
+def _read_metadata(path: str) -> Optional[Dict[str, Any]]:
+    pa = require_pyarrow()
+    try:
+        with pa.memory_map(path, 'r') as source:
+            metadata = json.loads(pa.ipc.open_file(source).schema.metadata[_METADATA_KEY])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return metadata if metadata.get('version') == STAGING_VERSION else None
+
+
+def open_staged_workbook(excel_path: str, staging_dir: str = DEFAULT_STAGING_DIR) -> StagedWorkbook:
+    """:class:`StagedWorkbook` of ``excel_path``, staging the workbook first when needed."""
+    path = staging_path(excel_path, staging_dir)
+    if _read_metadata(path) is None:
+        stage_workbook(excel_path, path)
+    return StagedWorkbook(path)
+
+
+def staged_sheet_names(excel_path: str, staging_dir: str = DEFAULT_STAGING_DIR) -> Optional[List[str]]:
+    """Sheet names of ``excel_path`` from its up-to-date staging file, or ``None`` without one.
+
+    Only the file's schema metadata is read, so listing the sheets of a
+    staged workbook does not open the workbook.
+    """
+    metadata = _read_metadata(staging_path(excel_path, staging_dir))
+    return None if metadata is None else [sheet['title'] for sheet in metadata['sheets']]
+
+
+def iter_staged_rows(
+    ws: StagedSheet,
+    name_col: str,
+    fee_cols: List[str],
+    start_row: int,
+    end_row: int,
+) -> Iterator[PaymentRow]:
+    """Yield the same tuples as ``workbook_stream.iter_payment_rows`` from a staged sheet."""
+    name_idx = column_index_from_string(name_col)
+    fee_idx = {column_index_from_string(c): c for c in fee_cols}
+    by_row: Dict[int, Dict[int, Tuple[Any, Optional[str]]]] = {}
+    for row, col, value, comment in ws.cells(start_row, end_row, {name_idx, *fee_idx}):
+        by_row.setdefault(row, {})[col] = (value, comment)
+    missing = (None, None)
+    for row in range(start_row, end_row + 1):
+        cells = by_row.pop(row, {})
+        fees: FeeCells = {}
+        for idx, col in fee_idx.items():
+            value, comment = cells.get(idx, missing)
+            fees[col] = (value, comment or '')
+        yield row, cells.get(name_idx, missing)[0], fees
+
+
+def add_staging_arguments(parser) -> None:
+    """Add ``--staging`` and ``--staging-dir`` to an ``argparse`` parser."""
+    parser.add_argument('--staging', action='store_true', help='Read the workbook from its Arrow staging file, creating it on first use (needs pyarrow)')
+    parser.add_argument('--staging-dir', default=DEFAULT_STAGING_DIR, help='Directory (relative to the workbook) for the staging files')
+
+
+def staging_dir_from_args(args) -> Optional[str]:
+    """The staging directory when ``--staging`` was given, ``None`` otherwise."""
+    return args.staging_dir if args.staging else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Stage workbooks into Arrow files for the Pagos generators.')
+    parser.add_argument('excel', nargs='+', help='Workbooks (xlsx) to stage')
+    parser.add_argument('--staging-dir', default=DEFAULT_STAGING_DIR, help='Directory (relative to each workbook) for the staging files')
+    parser.add_argument('--force', action='store_true', help='Stage again even when an up-to-date staging file exists')
+    args = parser.parse_args()
+    for excel_path in args.excel:
+        path = staging_path(excel_path, args.staging_dir)
+        if not args.force and _read_metadata(path) is not None:
+            print(f"{excel_path}: up to date ({path})")
+            continue
+        start = time.perf_counter()
+        metadata = stage_workbook(excel_path, path)
+        elapsed = time.perf_counter() - start
+        cells = sum(sheet['length'] for sheet in metadata['sheets'])
+        print(
+            f"{excel_path}: {len(metadata['sheets'])} sheets, {cells} cells in {elapsed:.2f}s "
+            f"({cells / elapsed if elapsed else 0:.0f} cells/s) -> {path}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Streaming, read-only access to the payment workbooks.
+
+The Pagos generators originally opened each workbook with
+``openpyxl.load_workbook(path)`` in full mode and then fetched every
+cell with ``ws[f"{col}{row}"]``.  Full mode materialises every cell and
+style of every sheet, so memory grows with the size of the workbook
+even though the generators only ever look at a name column and a
+handful of fee columns.
+
+This module offers an alternative ingest path:
+
+1. The workbook is opened with ``read_only=True`` and the worksheet XML
+   is walked exactly once, restricted to the column span that covers
+   the name column and the fee columns.
+2. Comments are read straight from the sheet's comments part.  Only the
+   comments attached to the fee columns inside the requested row range
+   are kept; every other comment is discarded while parsing.
+
+Both :func:`iter_payment_rows` (streaming) and :func:`iter_loaded_rows`
+(an already loaded full-mode worksheet) yield the same
+``(row, name_value, fees)`` tuples, where ``fees`` maps each fee column
+letter to a ``(value, comment_text)`` pair.  Callers can therefore
+switch between both modes without changing their per-row logic.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from xml.etree.ElementTree import iterparse
+
+import openpyxl
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.utils import column_index_from_string
+from openpyxl.xml.constants import COMMENTS_NS, SHEET_MAIN_NS
+
+
+# Last row of an .xlsx sheet; iterating a read-only sheet stops at its data
+MAX_SHEET_ROW = 1048576
+
+FeeCells = Dict[str, Tuple[Any, str]]
+PaymentRow = Tuple[int, Any, FeeCells]
+
+_COMMENT_TAG = f'{{{SHEET_MAIN_NS}}}comment'
+_TEXT_TAG = f'{{{SHEET_MAIN_NS}}}text'
+_COMMENT_LIST_TAG = f'{{{SHEET_MAIN_NS}}}commentList'
+_T_TAG = f'{{{SHEET_MAIN_NS}}}t'
+_R_TAG = f'{{{SHEET_MAIN_NS}}}r'
+_CELL_REF_RE = re.compile(r'([A-Z]+)(\d+)')
+_COMMENT_REF_BYTES_RE = re.compile(rb'<(?:[\w.-]+:)?comment\s[^>]*?\bref="[A-Z]+(\d+)"')
+
+
+def _comment_content(text_elem) -> str:
+    """Return the unformatted text of a comment's ``<text>`` element.
+
+    Mirrors ``openpyxl.cell.text.Text.content`` (plain text followed by
+    the text of every rich-text run, phonetic runs ignored) without
+    building the intermediate descriptor objects for every comment.
+    """
+    if text_elem is None:
+        return ''
+    plain = None
+    runs = []
+    for child in text_elem:
+        if child.tag == _T_TAG:
+            plain = child.text
+        elif child.tag == _R_TAG:
+            t = child.find(_T_TAG)
+            if t is not None and t.text is not None:
+                runs.append(t.text)
+    if plain is not None:
+        runs.insert(0, plain)
+    return ''.join(runs)
+
+
+def open_streaming_workbook(excel_path: str):
+    """Open a workbook in read-only mode for streaming access.
+
+    Parameters
+    ----------
+    excel_path: str
+        Path to the Excel workbook (xlsx).
+
+    Returns
+    -------
+    openpyxl.Workbook
+        A read-only workbook.  The caller must ``close()`` it once done
+        because read-only workbooks keep the underlying archive open.
+    """
+    return openpyxl.load_workbook(excel_path, read_only=True)
+
+
+def list_sheet_names(excel_path: str) -> List[str]:
+    """Titles of the worksheets of ``excel_path``, in workbook order."""
+    wb = open_streaming_workbook(excel_path)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def _comment_parts(ws) -> List[str]:
+    """Return the archive paths of the comments parts of a read-only sheet."""
+    archive = ws.parent._archive
+    rels_path = get_rels_path(ws._worksheet_path)
+    if rels_path not in archive.namelist():
+        return []
+    return [rel.target for rel in get_dependents(archive, rels_path).find(COMMENTS_NS)]
+
+
+def _comments_in_row_order(ws) -> bool:
+    """Check whether the sheet's comments are stored in ascending row order.
+
+    Only the ``ref`` attributes are inspected with a byte-level scan of
+    the comments part, read in fixed-size chunks, so this pass is cheap
+    and keeps no comment text in memory.
+    """
+    archive = ws.parent._archive
+    last_row = 0
+    for part in _comment_parts(ws):
+        with archive.open(part) as fh:
+            pending = b''
+            while True:
+                chunk = fh.read(1 << 20)
+                if chunk:
+                    pending += chunk
+                    # Keep a possibly incomplete trailing tag for the next chunk
+                    cut = pending.rfind(b'<')
+                    scan, pending = pending[:cut], pending[cut:]
+                else:
+                    scan, pending = pending, b''
+                for m in _COMMENT_REF_BYTES_RE.finditer(scan):
+                    row = int(m.group(1))
+                    if row < last_row:
+                        return False
+                    last_row = row
+                if not chunk:
+                    break
+    return True
+
+
+def iter_sheet_comments(
+    ws,
+    columns: Optional[List[str]],
+    start_row: int,
+    end_row: int,
+) -> Iterator[Tuple[int, str, str]]:
+    """Yield the comments attached to ``columns`` within a row range.
+
+    The comments part of the worksheet is parsed incrementally and
+    every comment element is released as soon as it has been handled,
+    so only the comment currently being read is held in memory.
+
+    Parameters
+    ----------
+    ws: ReadOnlyWorksheet
+        Worksheet obtained from a read-only workbook.
+    columns: Optional[List[str]]
+        Column letters whose comments should be kept; ``None`` keeps
+        the comments of every column.
+    start_row: int
+        First row (inclusive) to keep comments for.
+    end_row: int
+        Last row (inclusive) to keep comments for.
+
+    Yields
+    ------
+    Tuple[int, str, str]
+        ``(row, column_letter, text)`` in document order.  The text is
+        identical to ``cell.comment.text`` in full mode.
+    """
+    archive = ws.parent._archive
+    wanted_cols: Optional[Set[str]] = {c.upper() for c in columns} if columns is not None else None
+    for part in _comment_parts(ws):
+        with archive.open(part) as fh:
+            comment_list = None
+            for event, elem in iterparse(fh, events=('start', 'end')):
+                if event == 'start':
+                    if elem.tag == _COMMENT_LIST_TAG:
+                        comment_list = elem
+                    continue
+                if elem.tag != _COMMENT_TAG:
+                    continue
+                m = _CELL_REF_RE.fullmatch(elem.get('ref', ''))
+                if m and (wanted_cols is None or m.group(1) in wanted_cols) and start_row <= int(m.group(2)) <= end_row:
+                    yield int(m.group(2)), m.group(1), _comment_content(elem.find(_TEXT_TAG))
+                # Drop the handled comment so the parsed tree does not grow
+                if comment_list is not None:
+                    comment_list.clear()
+
+
+def read_sheet_comments(
+    ws,
+    columns: List[str],
+    start_row: int,
+    end_row: int,
+) -> Dict[Tuple[int, str], str]:
+    """Collect :func:`iter_sheet_comments` into a ``(row, column) -> text`` dict."""
+    return {(row, col): text for row, col, text in iter_sheet_comments(ws, columns, start_row, end_row)}
+
+
+def read_row_values(ws, columns: List[str], row: int) -> Dict[str, Any]:
+    """Read the values of ``columns`` for a single row.
+
+    Used to fetch header rows (e.g. the month names in row 2) without
+    walking the rest of the sheet.
+
+    Parameters
+    ----------
+    ws: Worksheet
+        Read-only or full-mode worksheet.
+    columns: List[str]
+        Column letters to read.
+    row: int
+        Row number to read.
+
+    Returns
+    -------
+    Dict[str, Any]
+        Mapping of column letter to cell value.
+    """
+    if not columns:
+        return {}
+    indexes = [column_index_from_string(c) for c in columns]
+    min_col, max_col = min(indexes), max(indexes)
+    for values in ws.iter_rows(min_row=row, max_row=row, min_col=min_col, max_col=max_col, values_only=True):
+        return {c: values[i - min_col] if i - min_col < len(values) else None for c, i in zip(columns, indexes)}
+    return {c: None for c in columns}
+
+
+def iter_payment_rows(
+    ws,
+    name_col: str,
+    fee_cols: List[str],
+    start_row: int,
+    end_row: int,
+) -> Iterator[PaymentRow]:
+    """Stream the name and fee cells of a read-only worksheet.
+
+    Parameters
+    ----------
+    ws: ReadOnlyWorksheet
+        Worksheet obtained from :func:`open_streaming_workbook`.
+    name_col: str
+        Column letter holding the student names.
+    fee_cols: List[str]
+        Column letters holding fee amounts (and their comments).
+    start_row: int
+        First data row (inclusive).
+    end_row: int
+        Last data row (inclusive).
+
+    Yields
+    ------
+    Tuple[int, Any, Dict[str, Tuple[Any, str]]]
+        ``(row, name_value, fees)`` for every row in the range, where
+        ``fees`` maps each fee column to ``(value, comment_text)``.
+        Missing comments are reported as an empty string.
+    """
+    name_idx = column_index_from_string(name_col)
+    fee_idx = [column_index_from_string(c) for c in fee_cols]
+    min_col = min([name_idx] + fee_idx)
+    max_col = max([name_idx] + fee_idx)
+    width = max_col - min_col + 1
+    # Comments written in row order (what Excel and openpyxl produce) are
+    # merged with the rows as both streams advance, so no more than one
+    # row's comments are held at a time.  Otherwise fall back to reading
+    # the needed comments up front.
+    if _comments_in_row_order(ws):
+        comment_stream = iter_sheet_comments(ws, fee_cols, start_row, end_row)
+        comments: Dict[Tuple[int, str], str] = {}
+    else:
+        comment_stream = iter(())
+        comments = read_sheet_comments(ws, fee_cols, start_row, end_row)
+    next_comment = next(comment_stream, None)
+    row = start_row
+    for values in ws.iter_rows(
+        min_row=start_row, max_row=end_row, min_col=min_col, max_col=max_col, values_only=True
+    ):
+        while next_comment is not None and next_comment[0] <= row:
+            comments[(next_comment[0], next_comment[1])] = next_comment[2]
+            next_comment = next(comment_stream, None)
+        if len(values) < width:
+            values = tuple(values) + (None,) * (width - len(values))
+        fees = {
+            col: (values[idx - min_col], comments.pop((row, col), ''))
+            for col, idx in zip(fee_cols, fee_idx)
+        }
+        yield row, values[name_idx - min_col], fees
+        row += 1
+
+
+def iter_loaded_rows(
+    ws,
+    name_col: str,
+    fee_cols: List[str],
+    start_row: int,
+    end_row: int,
+) -> Iterator[PaymentRow]:
+    """Yield the same tuples as :func:`iter_payment_rows` from a full-mode sheet.
+
+    This keeps the original ``ws[f"{col}{row}"]`` lookups so that the
+    default behaviour of the generators is unchanged.
+    """
+    for row in range(start_row, end_row + 1):
+        fees: FeeCells = {}
+        for col in fee_cols:
+            cell = ws[f"{col}{row}"]
+            fees[col] = (cell.value, cell.comment.text if cell.comment else '')
+        yield row, ws[f"{name_col}{row}"].value, fees
+